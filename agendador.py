@@ -0,0 +1,74 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+
+
+# Número de processos a usar: 0 (ou negativo) significa um por núcleo disponível. Em hosts serverless
+# (Vercel, AWS Lambda), onde não há suporte a pools de processos, o cálculo é sempre em série.
+def processos_efetivos(processos=None):
+    if processos is None:
+        processos = config.PROCESSOS
+    if processos <= 0:
+        processos = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    if os.environ.get('VERCEL') or os.environ.get('AWS_LAMBDA_FUNCTION_NAME'):
+        return 1
+    return processos
+
+
+# Resultados de `funcao` nas tarefas calculados em um pool de `processos` processos, ou None se o pool não
+# puder ser criado (ex.: sem /dev/shm para os semáforos) ou quebrar no meio (ex.: um processo morto pelo sistema).
+# Exceções levantadas pela própria `funcao` ou pelo `progresso` se propagam (as tarefas ainda não iniciadas são
+# canceladas).
+def _mapear_pool(funcao, tarefas, processos, progresso):
+    # Lotes de tarefas por envio, para diluir o custo de comunicação entre processos
+    tamanho_lote = max(1, len(tarefas) // (processos * 4))
+    executor = None
+    try:
+        # O executor.map envia todas as tarefas de uma vez, iniciando os processos do pool
+        executor = ProcessPoolExecutor(max_workers=processos)
+        iterador = executor.map(funcao, tarefas, chunksize=tamanho_lote)
+    except (OSError, NotImplementedError, BrokenProcessPool) as erro:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        logging.warning('Pool de processos indisponível (%s); ajustes seguem em série', erro)
+        return None
+
+    with executor:
+        resultados = []
+        try:
+            for resultado in iterador:
+                resultados.append(resultado)
+                if progresso is not None:
+                    progresso(len(resultados), len(tarefas))
+        except BrokenProcessPool as erro:
+            executor.shutdown(cancel_futures=True)
+            logging.warning('Pool de processos interrompido (%s); ajustes seguem em série', erro)
+            return None
+        except Exception:
+            executor.shutdown(cancel_futures=True)
+            raise
+        return resultados
+
+
+# Aplica `funcao` a cada tarefa e devolve os resultados na ordem das tarefas, em um pool de processos
+# quando há mais de um processo disponível. O resultado não depende do número de processos; se o pool
+# não puder ser usado (_mapear_pool), o cálculo segue em série.
+# `progresso(feitas, total)` é chamado a cada resultado; uma exceção levantada por ele ou pela `funcao`
+# interrompe o cálculo.
+def mapear(funcao, tarefas, processos=None, progresso=None):
+    tarefas = list(tarefas)
+    processos = min(processos_efetivos(processos), len(tarefas))
+    if processos > 1:
+        resultados = _mapear_pool(funcao, tarefas, processos, progresso)
+        if resultados is not None:
+            return resultados
+
+    resultados = []
+    for tarefa in tarefas:
+        resultados.append(funcao(tarefa))
+        if progresso is not None:
+            progresso(len(resultados), len(tarefas))
+    return resultados
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+
+from categorias import CATEGORIAS
+from indice_anos import MESES, IndiceAnos
+
+# Quantis guardados por ano: mínimo, 1º quartil, mediana, 3º quartil e máximo
+QUANTIS = (0, 25, 50, 75, 100)
+
+# Bordas das classes do histograma do SPEI (largura 0,25); valores fora de [-4, 4] vão para as classes extremas
+BORDAS_HISTOGRAMA = np.linspace(-4, 4, 33)
+
+
+# Agregados de uma série mensal de SPEI (serie_mensal.SerieMensal) por ano, calculados uma única vez.
+# Qualquer intervalo de anos é respondido somando as linhas dos anos correspondentes, sem voltar a
+# percorrer a série. O eixo de tempo tem passo fixo de um mês, então cada ano é um trecho contíguo da
+# série (indice_anos.IndiceAnos) e os agregados guardam só o que não se obtém dela: contagens por
+# categoria e por classe do histograma (uint8, no máximo 12 meses por ano) e as estatísticas anuais do
+# boxplot (float32).
+class CuboAgregado:
+    def __init__(self, serie, rotulos=CATEGORIAS):
+        self.serie = serie
+        self.rotulos = tuple(rotulos)
+
+        n = len(serie)
+        deslocamento = serie.mes_zero % MESES  # Mês do calendário da primeira posição
+        self.indice = IndiceAnos.mensal(serie.mes_zero, n)
+        self.anos = self.indice.anos
+
+        # Matriz (ano × mês) dos valores, com NaN nos meses antes do início e depois do fim da série
+        self.matriz = np.full(len(self.anos) * MESES, np.nan, dtype='float32')
+        self.matriz[deslocamento:deslocamento + n] = serie.valores
+        self.matriz = self.matriz.reshape(-1, MESES)
+
+        valores = serie.valores
+        validos = ~np.isnan(valores) & (serie.codigos >= 0)
+        linhas = self.indice.linha_de_cada_posicao()[validos]
+        forma = (len(self.anos), len(self.rotulos))
+        self.contagem = np.bincount(
+            np.ravel_multi_index((linhas, serie.codigos[validos]), forma), minlength=int(np.prod(forma))
+        ).reshape(forma).astype('uint8')
+
+        # Contagem por (ano, classe do histograma)
+        classes = np.clip(np.searchsorted(BORDAS_HISTOGRAMA, valores[validos], side='right') - 1,
+                          0, len(BORDAS_HISTOGRAMA) - 2)
+        forma_histograma = (len(self.anos), len(BORDAS_HISTOGRAMA) - 1)
+        self.histograma = np.bincount(
+            np.ravel_multi_index((linhas, classes), forma_histograma), minlength=int(np.prod(forma_histograma)),
+        ).reshape(forma_histograma).astype('uint8')
+
+        # Estatísticas anuais do boxplot: quantis, cercas (valores mais extremos a até 1,5 IQR dos quartis),
+        # média e desvio padrão populacional, como o plotly calcula a partir dos pontos
+        self.quantis = np.full((len(self.anos), len(QUANTIS)), np.nan, dtype='float32')
+        self.cercas = np.full((len(self.anos), 2), np.nan, dtype='float32')
+        self.medias = np.full(len(self.anos), np.nan, dtype='float32')
+        self.desvios = np.full(len(self.anos), np.nan, dtype='float32')
+        for i, (_, trecho) in enumerate(self.indice.trechos()):
+            valores_ano = valores[trecho].astype('float64')
+            valores_ano = valores_ano[~np.isnan(valores_ano)]
+            if len(valores_ano):
+                quantis = np.percentile(valores_ano, QUANTIS)
+                q1, q3 = quantis[1], quantis[3]
+                amplitude = 1.5 * (q3 - q1)
+                self.quantis[i] = quantis
+                self.cercas[i] = (min(q1, valores_ano[valores_ano >= q1 - amplitude].min()),
+                                  max(q3, valores_ano[valores_ano <= q3 + amplitude].max()))
+                self.medias[i] = valores_ano.mean()
+                self.desvios[i] = valores_ano.std()
+
+    # Fatia do eixo de anos que cobre [ano_inicial, ano_final]
+    def _linhas(self, ano_inicial, ano_final):
+        return self.indice.linhas(ano_inicial, ano_final)
+
+    def anos_intervalo(self, ano_inicial, ano_final):
+        return self.anos[self._linhas(ano_inicial, ano_final)]
+
+    # Posições da série (e das categorias, alinhadas a ela) que cobrem o intervalo
+    def posicoes_intervalo(self, ano_inicial, ano_final):
+        return self.indice.posicoes(ano_inicial, ano_final)
+
+    # Número de pontos da série no intervalo
+    def tamanho_intervalo(self, ano_inicial, ano_final):
+        posicoes = self.posicoes_intervalo(ano_inicial, ano_final)
+        return posicoes.stop - posicoes.start
+
+    # Trecho contíguo da série no intervalo (view, sem máscara booleana nem cópia)
+    def serie_intervalo(self, ano_inicial, ano_final):
+        return self.serie[self.posicoes_intervalo(ano_inicial, ano_final)]
+
+    # Porcentagem de meses em cada categoria, por ano
+    def percentual_categorias(self, ano_inicial, ano_final):
+        linhas = self._linhas(ano_inicial, ano_final)
+        por_categoria = self.contagem[linhas].astype('int64')
+        total = por_categoria.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percentual = np.where(total > 0, por_categoria / total * 100, 0.0)
+        return pd.DataFrame(percentual, index=self.anos[linhas], columns=list(self.rotulos))
+
+    # Porcentagem dos meses do período inteiro em cada categoria: as contagens anuais se combinam por soma, então
+    # qualquer período (ex.: para comparar 1997-1998 com 2015-2016) sai das linhas dos seus anos
+    def percentual_periodo(self, ano_inicial, ano_final):
+        por_categoria = self.contagem[self._linhas(ano_inicial, ano_final)].sum(axis=0, dtype='int64')
+        total = por_categoria.sum()
+        percentual = por_categoria / total * 100 if total else np.zeros(len(self.rotulos))
+        return pd.Series(percentual, index=list(self.rotulos))
+
+    # Média do SPEI para cada mês do calendário no intervalo
+    def media_mensal(self, ano_inicial, ano_final):
+        matriz = self.matriz[self._linhas(ano_inicial, ano_final)]
+        contagem = (~np.isnan(matriz)).sum(axis=0)
+        soma = np.nansum(matriz, axis=0, dtype='float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(contagem > 0, soma / contagem, np.nan)
+
+    # Contagem, média e desvio padrão (amostral) do intervalo, combinados a partir das somas
+    def resumo(self, ano_inicial, ano_final):
+        valores = self.matriz[self._linhas(ano_inicial, ano_final)].astype('float64')
+        n = int((~np.isnan(valores)).sum())
+        soma = np.nansum(valores)
+        soma_quadrados = np.nansum(valores ** 2)
+        media = soma / n if n else np.nan
+        desvio = np.sqrt(max(soma_quadrados - n * media ** 2, 0.0) / (n - 1)) if n > 1 else np.nan
+        return {'contagem': n, 'media': media, 'desvio': desvio}
+
+    # Contagens do histograma no intervalo, com as bordas das classes
+    def histograma_intervalo(self, ano_inicial, ano_final):
+        return BORDAS_HISTOGRAMA, self.histograma[self._linhas(ano_inicial, ano_final)].sum(axis=0, dtype='int64')
+
+    # Estatísticas de cada caixa do boxplot anual no intervalo
+    def caixas_anuais(self, ano_inicial, ano_final):
+        linhas = self._linhas(ano_inicial, ano_final)
+        return pd.DataFrame({
+            'q1': self.quantis[linhas, 1],
+            'mediana': self.quantis[linhas, 2],
+            'q3': self.quantis[linhas, 3],
+            'cerca_inferior': self.cercas[linhas, 0],
+            'cerca_superior': self.cercas[linhas, 1],
+            'media': self.medias[linhas],
+            'desvio': self.desvios[linhas],
+        }, index=self.anos[linhas])
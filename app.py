@@ -1,83 +1,381 @@
+import cProfile
 import dash
+import hmac
+import json
+import logging
 import os
-from dash import Input, Output, dcc, html
-import spei as si
+import threading
+import time
+from flask import Response, g, jsonify, request, stream_with_context
+from dash import Input, Output, State, dcc, html
 import pandas as pd
-import plotly.graph_objs as go
 import plotly.express as px
+import plotly.utils
 import dash_bootstrap_components as dbc
 from datetime import datetime
+import categorias
+import compartilhado
+import config
+import eventos
+import exportacao
+from indices import ESCALAS, SPEIMultiescala
+import agregados
+import figuras
+import indice_anos
+import indices
+import serie_mensal
+from cache_figuras import CacheFiguras, versao_codigo
+from camada_http import registrar_camada_http
+from figuras import (CONSTRUTORES, CONSTRUTORES_COMPARACAO, CORES_PERIODOS, GRAFICOS_DETALHAVEIS,
+                     TEXTO_COMPARACAO_VAZIA, TITULOS_COMPARACAO, formatar_valor, precisa_detalhar,
+                     rotulo_periodo)
+from ingestao import extrair_balancos, versao_dados
+from locais import carregar_locais
+from metricas import LIMITES_BYTES, metricas
+from modo_cliente import dados_cliente, dados_estaticos, registrar_callbacks_cliente, registrar_callbacks_estaticos
+from provedor import ProvedorDados
+from segundo_plano import GerenciadorLocal
 
-# Função para extrair dados (sem alterações)
-def extrair_dados(path_etp, path_prp, acumulado=1):
-    df_etp = pd.read_excel(path_etp).rename(columns={'Hargreaves Potential Evapotranspiration (TerraClimate)': 'data', 'Unnamed: 1': 'dados'})
-    df_etp = df_etp.iloc[1:].reset_index(drop=True)
-
-    df_prp = pd.read_excel(path_prp).rename(columns={'Precipitation (TerraClimate)': 'data', 'Unnamed: 1': 'dados'})
-    df_prp = df_prp.iloc[1:].reset_index(drop=True)
-
-    df_merged = pd.merge(df_etp, df_prp, on='data', suffixes=('_etp', '_prp'))
-    df_merged['balanco_hidrico'] = df_merged['dados_prp'] - df_merged['dados_etp']
-    df_merged['data'] = pd.to_datetime(df_merged['data'], format='%Y-%m-%d')
-
-    df = pd.DataFrame({'data': df_merged['data'], 'dados': pd.to_numeric(df_merged['balanco_hidrico'], errors='coerce')})
-    df.set_index('data', inplace=True)
-
-    df_preparado = pd.DataFrame({'data': df['dados'].rolling(acumulado).sum().dropna().index,
-                                  'dados': df['dados'].rolling(acumulado).sum().dropna().values})
-    df_preparado.set_index('data', inplace=True)
-
-    return df_preparado
-
-# Função para extrair dados somente de ETP e precipitação (sem alterações)
-def extrair_etp_prp(path_etp, path_prp):
-    df_etp = pd.read_excel(path_etp).rename(columns={'Hargreaves Potential Evapotranspiration (TerraClimate)': 'data', 'Unnamed: 1': 'ETP'})
-    df_prp = pd.read_excel(path_prp).rename(columns={'Precipitation (TerraClimate)': 'data', 'Unnamed: 1': 'Precipitação'})
-
-    df_etp = df_etp.iloc[1:].reset_index(drop=True)
-    df_prp = df_prp.iloc[1:].reset_index(drop=True)
-
-    df_etp['data'] = pd.to_datetime(df_etp['data'], format='%Y-%m-%d')
-    df_prp['data'] = pd.to_datetime(df_prp['data'], format='%Y-%m-%d')
-
-    df_merged = pd.merge(df_etp, df_prp, on='data', how='inner')
-    df_merged.set_index('data', inplace=True)
-
-    return df_merged
-
-# Caminhos dos arquivos (sem alterações)
-file_path_etp = 'dados/ETP_HARVREAVES_TERRACLIMATE.xlsx'
-file_path_prp = 'dados/PRP_TERRACLIMATE.xlsx'
-
-# Extração dos dados e cálculo do SPEI (sem alterações)
-dados_1 = extrair_dados(file_path_etp, file_path_prp, 1)
-df_etp_prp = extrair_etp_prp(file_path_etp, file_path_prp)
-spei_1 = si.spei(pd.Series(dados_1['dados']))
-
-# Função para filtrar os anos (sem alterações)
-def filtrar_por_ano(spei, ano_inicial, ano_final):
-    return spei[(spei.index.year >= ano_inicial) & (spei.index.year <= ano_final)]
-
-# Função para categorizar o SPEI com as novas categorias
-def categorizar_spei(spei_value):
-    if spei_value >= 2.00:
-        return 'Umidade extrema'
-    elif 1.50 <= spei_value < 2.00:
-        return 'Umidade severa'
-    elif 1.00 <= spei_value < 1.50:
-        return 'Umidade moderada'
-    elif 0 <= spei_value < 1.00:
-        return 'Umidade fraca'
-    elif -0.99 <= spei_value < 0:
-        return 'Seca fraca'
-    elif -1.50 <= spei_value < -1.00:
-        return 'Seca moderada'
-    elif -1.99 <= spei_value < -1.50:
-        return 'Seca severa'
+# Locais disponíveis (dados/locais.json) e arquivos de origem de cada um
+locais = carregar_locais()
+locais_por_id = {local['id']: local for local in locais}
+arquivos_dados = [arquivo for local in locais for arquivo in (local['etp'], local['prp'])]
+
+VERSAO_CODIGO = versao_codigo(__file__, figuras.__file__, agregados.__file__, indices.__file__, compartilhado.__file__,
+                              eventos.__file__, categorias.__file__, serie_mensal.__file__,
+                              indice_anos.__file__)
+
+# Cache das figuras por (intervalo, escala, local); a versão é definida quando os dados são carregados
+cache_figuras = CacheFiguras(
+    versao=None,
+    tamanho_maximo=config.TAMANHO_CACHE_FIGURAS,
+    diretorio=config.DIRETORIO_CACHE_FIGURAS,
+)
+
+
+# SPEI em várias escalas, em lote (tempo × local), a partir de um balanço hídrico
+# (no modo cliente todas as escalas vão para a página, então são calculadas já na carga)
+def calcular_spei(balancos, escalas):
+    return SPEIMultiescala(
+        balancos, processos=config.PROCESSOS, calibracao=config.CALIBRACAO, reajuste_meses=config.REAJUSTE_MESES,
+        criterios_eventos=config.CRITERIOS_EVENTOS,
+    ).calcular(escalas)
+
+
+# Versão das figuras em cache: muda junto com as planilhas, com o último mês do SPEI ou com o código das figuras
+def versao_figuras(spei_escalas):
+    return f'{versao_dados(*arquivos_dados)}-{spei_escalas.balancos.index[-1]:%Y%m}-{VERSAO_CODIGO}'
+
+
+# Extração do balanço hídrico de todos os locais (via cache binário das planilhas) e cálculo do SPEI.
+# Roda fora do import (thread de aquecimento ou primeiro callback), para o servidor subir sem esperar.
+# Com memória compartilhada, todas as escalas são calculadas por um único processo e os demais mapeiam o resultado.
+# Com `anterior` (atualização dos dados), a versão nova parte dele: os meses acrescentados são anexados sem
+# refazer os ajustes (ver incorporar_balancos).
+def carregar_dados(anterior=None):
+    if config.MEMORIA_COMPARTILHADA:
+        versao = '-'.join([versao_dados(*arquivos_dados), VERSAO_CODIGO, *map(str, config.CALIBRACAO or ())])
+        if anterior is None:
+            calcular = lambda: calcular_spei(extrair_balancos(locais), None)
+        else:
+            calcular = lambda: incorporar_balancos(anterior, extrair_balancos(locais), None)[0]
+        spei_escalas = compartilhado.carregar_ou_publicar(
+            config.DIRETORIO_COMPARTILHADO, versao, calcular,
+            processos=config.PROCESSOS, calibracao=config.CALIBRACAO, reajuste_meses=config.REAJUSTE_MESES,
+            criterios_eventos=config.CRITERIOS_EVENTOS,
+        )
+    else:
+        with metricas.medir('extracao'):
+            balancos = extrair_balancos(locais)
+        spei_escalas = calcular_spei(balancos, None if config.MODO_CLIENTE else config.ESCALAS_INICIAIS)
+    cache_figuras.versao = versao_figuras(spei_escalas)
+    return spei_escalas
+
+
+dados = ProvedorDados(carregar_dados)
+trava_dados = threading.Lock()
+
+
+# Opções do ano-dropdown para o tamanho de intervalo escolhido, a partir dos anos que existem nos dados
+def atualizar_ano_dropdown(intervalo):
+    primeiro_ano, ultimo_ano = dados.obter().anos_disponiveis()
+    opcoes = []
+
+    if intervalo in ('5', '10'):
+        tamanho = int(intervalo)
+        for ano in range(primeiro_ano, ultimo_ano + 1, tamanho):
+            ano_final = ano + tamanho - 1
+            if ano_final <= ultimo_ano:
+                opcoes.append({'label': f'{ano} a {ano_final}', 'value': f'{ano}-{ano_final}'})
+        # Anos que sobram depois do último intervalo completo
+        restante = primeiro_ano + (ultimo_ano - primeiro_ano + 1) // tamanho * tamanho
+        if restante <= ultimo_ano:
+            opcoes.append({'label': f'{restante} a {ultimo_ano}', 'value': f'{restante}-{ultimo_ano}'})
+
+    elif intervalo == 'all':
+        opcoes = [{'label': f'{primeiro_ano} a {ultimo_ano}', 'value': f'{primeiro_ano}-{ultimo_ano}'}]
+
+    # Define o value como a primeira opção se houver opções
+    valor_default = opcoes[0]['value'] if opcoes else None
+
+    return opcoes, valor_default  # Retornando as opções e o valor padrão
+
+
+# Converte o valor do ano-dropdown ('1981-1990') em (ano_inicial, ano_final)
+def interpretar_intervalo(intervalo):
+    ano_inicial, ano_final = map(int, intervalo.split('-'))
+    return ano_inicial, ano_final
+
+
+# Atalho do ano-dropdown: leva o intervalo escolhido ('1981-1990') ao controle deslizante de anos, que é de
+# onde a seleção lê os anos
+def aplicar_atalho(intervalo):
+    if not intervalo:
+        raise dash.exceptions.PreventUpdate
+    return list(interpretar_intervalo(intervalo))
+
+
+# Marcas do controle deslizante de anos: a cada 10 anos, mais o último ano (sem marca a menos de 5 anos dele,
+# para os rótulos não se sobreporem)
+def marcas_anos(primeiro_ano, ultimo_ano):
+    return {ano: str(ano) for ano in [*range(primeiro_ano, ultimo_ano - 4, 10), ultimo_ano]}
+
+
+# Texto de apresentação, com o período coberto pelos dados
+def descricao_periodo():
+    primeiro_ano, ultimo_ano = dados.obter().anos_disponiveis()
+    return (f"Este produto apresenta os resultados de uma análise da variabilidade climática no município de Paragominas, "
+            f"no estado do Pará, Brasil, entre {primeiro_ano} e {ultimo_ano}. O foco está na avaliação do índice SPEI "
+            f"(Standardized Precipitation Evapotranspiration Index).")
+
+
+# Figura de um gráfico, construída a partir do cubo da escala e do local somente quando não está no cache.
+# Com `faixa` (zoom nos gráficos detalháveis) a figura cobre só o trecho visível e não passa pelo cache,
+# já que as faixas são arbitrárias.
+def obter_figura(id_grafico, ano_inicial, ano_final, escala, local=None, faixa=None):
+    local = local or locais[0]['id']
+    spei_escalas = dados.obter()
+
+    def construir():
+        with metricas.medir('cubo', escala=escala):
+            cubo = spei_escalas.cubo(escala, local)
+        with metricas.medir('figura', grafico=id_grafico):
+            if faixa:
+                return CONSTRUTORES[id_grafico](cubo, ano_inicial, ano_final, escala, faixa=faixa)
+            return CONSTRUTORES[id_grafico](cubo, ano_inicial, ano_final, escala)
+
+    if faixa:
+        return construir()
+    return cache_figuras.obter([id_grafico, ano_inicial, ano_final, escala, local], construir)
+
+
+# Conteúdo do card de eventos de seca: resumo e tabela dos eventos que tocam o período (modo_cliente e
+# assets/clientside.js montam o mesmo conteúdo no navegador)
+def componentes_eventos(tabela):
+    resumo = eventos.resumo_eventos(tabela)
+    if not resumo['quantidade']:
+        return [html.P('Nenhum evento de seca no período.')]
+    longo, severo = resumo['mais_longo'], resumo['mais_severo']
+    texto = (f"{resumo['quantidade']} eventos de seca ({resumo['meses_seca']} meses secos). "
+             f"Mais longo: {longo['duracao']} meses ({longo['inicio']:%m/%Y} a {longo['fim']:%m/%Y}). "
+             f"Mais severo: severidade {severo['severidade']:.2f}, pico de {severo['pico']:.2f} "
+             f"({severo['categoria_pico']}) em {severo['data_pico']:%m/%Y}.")
+    cabecalho = html.Thead(html.Tr([html.Th(titulo) for titulo in eventos.TITULOS]))
+    linhas = html.Tbody([
+        html.Tr([
+            html.Td(f'{evento.inicio:%m/%Y}'),
+            html.Td(f'{evento.fim:%m/%Y}' + (' (em curso)' if evento.em_curso else '')),
+            html.Td(evento.duracao),
+            html.Td(f'{evento.severidade:.2f}'),
+            html.Td(f'{evento.pico:.2f}'),
+            html.Td(evento.categoria_pico),
+        ])
+        for evento in tabela.itertuples()
+    ])
+    return [html.P(texto), html.Div(html.Table([cabecalho, linhas], className='table table-sm table-striped'),
+                                    style=eventos.ESTILO_TABELA)]
+
+
+# Seleção recebida do navegador (store 'selecao') conferida como os parâmetros da exportação: escala e local
+# conhecidos e anos em ordem. Uma seleção inválida ou forjada não chega ao cálculo: PreventUpdate
+def validar_selecao(selecao):
+    if not isinstance(selecao, dict):
+        raise dash.exceptions.PreventUpdate
+    try:
+        return parametros_exportacao(selecao, dados.obter())
+    except (TypeError, ValueError):
+        raise dash.exceptions.PreventUpdate
+
+
+# Eventos da seleção, lidos da tabela já calculada da série (busca binária pelo intervalo de anos)
+def atualizar_eventos(selecao):
+    if not selecao:
+        return dash.no_update
+    selecao = validar_selecao(selecao)
+    with metricas.medir('eventos_intervalo'):
+        tabela = eventos.eventos_intervalo(dados.obter().eventos(selecao['escala'], selecao['local']),
+                                           selecao['ano_inicial'], selecao['ano_final'])
+    return componentes_eventos(tabela)
+
+
+# Faixa do eixo x de um relayoutData: [início, fim] no zoom, None ao voltar à escala automática
+# e False quando o evento não mexe no eixo x (ex.: redimensionamento) ou traz uma faixa que não é um par
+# de datas (o relayoutData vem do navegador e pode ser qualquer coisa)
+def faixa_do_relayout(relayout):
+    relayout = relayout if isinstance(relayout, dict) else {}
+    if 'xaxis.range[0]' in relayout and 'xaxis.range[1]' in relayout:
+        faixa = [relayout['xaxis.range[0]'], relayout['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout:
+        faixa = relayout['xaxis.range']
+    elif relayout.get('xaxis.autorange'):
+        return None
     else:
-        return 'Seca extrema'
+        return False
+    if not isinstance(faixa, list) or len(faixa) != 2 or not all(isinstance(data, str) for data in faixa):
+        return False
+    try:
+        datas = [pd.Timestamp(data) for data in faixa]
+    except (ValueError, TypeError, OverflowError):
+        return False
+    if any(pd.isna(data) for data in datas):
+        return False
+    return faixa if datas[0] <= datas[1] else faixa[::-1]
+
+
+# As seis figuras de uma seleção, na ordem dos cards (usado fora dos callbacks, ex.: benchmarks)
+def atualizar_graficos(intervalo, escala, local=None):
+    ano_inicial, ano_final = interpretar_intervalo(intervalo)
+    return [obter_figura(id_grafico, ano_inicial, ano_final, escala, local) for id_grafico in CONSTRUTORES]
+
+
+# Figuras e eventos de uma seleção em um único objeto (por id do gráfico, mais 'eventos'): o conteúdo dos arquivos
+# do modo estático (snapshot.py) e da rota /api/figuras, que responde às seleções que não foram pré-calculadas
+def conteudo_selecao(selecao):
+    intervalo = f"{selecao['ano_inicial']}-{selecao['ano_final']}"
+    figuras_selecao = atualizar_graficos(intervalo, selecao['escala'], selecao['local'])
+    return {**dict(zip(CONSTRUTORES, figuras_selecao)), 'eventos': atualizar_eventos(selecao)}
+
+
+# Tabela do card de comparação: meses com dados, média, desvio padrão e porcentagem de meses na categoria
+# limite dos eventos de seca ou em uma mais seca, de cada período (combinados a partir dos agregados anuais)
+def componentes_comparacao(cubo, periodos, categoria_limite):
+    secas = list(categorias.CATEGORIAS[:categorias.CATEGORIAS.index(categoria_limite) + 1])
+    cabecalho = html.Thead(html.Tr([html.Th(titulo) for titulo in TITULOS_COMPARACAO]))
+    linhas = []
+    for ano_inicial, ano_final in periodos:
+        resumo = cubo.resumo(ano_inicial, ano_final)
+        percentual_seca = cubo.percentual_periodo(ano_inicial, ano_final)[secas].sum() if resumo['contagem'] else None
+        linhas.append(html.Tr([
+            html.Td(rotulo_periodo(ano_inicial, ano_final)),
+            html.Td(resumo['contagem']),
+            html.Td(formatar_valor(resumo['media'], 2)),
+            html.Td(formatar_valor(resumo['desvio'], 2)),
+            html.Td(formatar_valor(percentual_seca, 1)),
+        ]))
+    return [html.Table([cabecalho, html.Tbody(linhas)], className='table table-sm table-striped')]
+
+
+# Card de comparação: os gráficos e a tabela dos períodos guardados, na escala e no local da seleção. Cada
+# período é respondido pelos agregados anuais do cubo, sem cache nem nova passada pela série, então o tempo
+# não depende de quantas combinações de períodos já foram pedidas.
+def atualizar_comparacao(periodos, selecao):
+    if not selecao:
+        raise dash.exceptions.PreventUpdate
+    selecao = validar_selecao(selecao)
+    spei_escalas = dados.obter()
+    cubo = spei_escalas.cubo(selecao['escala'], selecao['local'])
+    if not isinstance(periodos, (list, type(None))):
+        raise dash.exceptions.PreventUpdate
+    periodos = [normalizar_periodo(periodo, spei_escalas) for periodo in periodos or []]
+    periodos = [tuple(periodo) for periodo in periodos if periodo is not None][-len(CORES_PERIODOS):]
+    with metricas.medir('comparacao'):
+        figuras_comparacao = [construir(cubo, periodos, selecao['escala'])
+                              for construir in CONSTRUTORES_COMPARACAO.values()]
+        if periodos:
+            resumo = componentes_comparacao(cubo, periodos, spei_escalas.criterios_eventos['categoria_limite'])
+        else:
+            resumo = [html.P(TEXTO_COMPARACAO_VAZIA)]
+    return [*figuras_comparacao, resumo]
+
 
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY], title='Variabilidade do clima em Paragominas')
+# Período [ano_inicial, ano_final] vindo do navegador em ordem crescente e limitado aos anos com dados; None se
+# não é um par de anos ou fica todo fora dos dados
+def normalizar_periodo(periodo, spei_escalas):
+    try:
+        ano_inicial, ano_final = sorted(int(ano) for ano in periodo)
+    except (TypeError, ValueError):
+        return None
+    primeiro_ano, ultimo_ano = spei_escalas.anos_disponiveis()
+    if ano_final < primeiro_ano or ano_inicial > ultimo_ano:
+        return None
+    return [max(ano_inicial, primeiro_ano), min(ano_final, ultimo_ano)]
+
+
+# Lista de períodos comparados: 'Adicionar à comparação' guarda o intervalo do controle deslizante (ordenado,
+# dentro dos anos com dados, sem repetir e mantendo os últimos len(CORES_PERIODOS)); 'Limpar' esvazia a lista
+def atualizar_periodos(adicionar, limpar, anos, periodos):
+    if dash.ctx.triggered_id == 'limpar-comparacao':
+        return []
+    periodo = normalizar_periodo(anos, dados.obter()) if anos else None
+    periodos = periodos if isinstance(periodos, list) else []
+    if periodo is None or periodo in periodos:
+        raise dash.exceptions.PreventUpdate
+    return [*periodos, periodo][-len(CORES_PERIODOS):]
+
+
+# Local escolhido no mapa (id guardado no customdata do ponto clicado); sem clique, o primeiro do registro
+def local_do_clique(clique):
+    if clique and clique.get('points'):
+        local = clique['points'][0].get('customdata', [None])[0]
+        if local in locais_por_id:
+            return local
+    return locais[0]['id']
+
+
+# Seleção normalizada (anos do controle deslizante, escala e local) que alimenta os callbacks dos gráficos
+def atualizar_selecao(anos, escala, clique):
+    if not anos:  # Se não houver intervalo selecionado
+        raise dash.exceptions.PreventUpdate
+
+    ano_inicial, ano_final = int(anos[0]), int(anos[1])
+    return {'ano_inicial': ano_inicial, 'ano_final': ano_final, 'escala': escala, 'local': local_do_clique(clique)}
+
+
+# Com os callbacks em segundo plano: a seleção vai direto aos gráficos quando a escala já está calculada;
+# senão (escala nova ou dados ainda carregando) fica pendente até `preparar_selecao` terminar o cálculo
+def encaminhar_selecao(anos, escala, clique):
+    selecao = atualizar_selecao(anos, escala, clique)
+    if dados.pronto() and escala in dados.obter().escalas_calculadas():
+        return selecao, dash.no_update
+    return dash.no_update, selecao
+
+
+# Callback em segundo plano: carrega os dados e ajusta a escala pendente fora da requisição, informando o
+# progresso dos ajustes; o cálculo é interrompido se o usuário mudar a seleção antes de terminar
+def preparar_selecao(set_progress, selecao):
+    if not selecao:
+        raise dash.exceptions.PreventUpdate
+    selecao = validar_selecao(selecao)
+    set_progress((0, 1))
+    dados.obter().calcular((selecao['escala'],), progresso=lambda feitas, total: set_progress((feitas, total)))
+    return selecao
+
+
+# Callbacks em segundo plano em threads do próprio worker; os resultados valem para a versão atual dos dados.
+# Só funcionam com um único worker (ver config.TAREFAS_SEGUNDO_PLANO)
+if config.TAREFAS_SEGUNDO_PLANO > 0 and config.WORKERS > 1:
+    raise RuntimeError(f'SPEI_TAREFAS_SEGUNDO_PLANO={config.TAREFAS_SEGUNDO_PLANO} exige um único worker '
+                       f'({config.WORKERS} configurados): use WEB_CONCURRENCY=1 ou SPEI_TAREFAS_SEGUNDO_PLANO=0')
+if config.TAREFAS_SEGUNDO_PLANO == 0 and config.WORKERS > 1 and 'SPEI_TAREFAS_SEGUNDO_PLANO' not in os.environ:
+    logging.warning('Callbacks em segundo plano desligados com %d workers (exigem WEB_CONCURRENCY=1)', config.WORKERS)
+gerenciador_segundo_plano = (
+    GerenciadorLocal(threads=config.TAREFAS_SEGUNDO_PLANO, cache_by=[lambda: cache_figuras.versao])
+    if config.TAREFAS_SEGUNDO_PLANO > 0 and not (config.MODO_CLIENTE or config.MODO_ESTATICO) else None
+)
+
+app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY], title='Variabilidade do clima em Paragominas',
+                background_callback_manager=gerenciador_segundo_plano)
+server = app.server  # Aplicação WSGI (gunicorn app:server)
 
 # Definindo variáveis de estilo
 CARD_STYLE = {
@@ -217,490 +515,650 @@ footer = html.Footer(
     style=FOOTER_STYLE
 )
 
-# Card de controles atualizado
-controls = dbc.Card(
-    [
-        html.Div(
-            [
-                html.H4("Filtros", style=TITLE_STYLE),
-                dbc.Label("Intervalo de Anos", style={'fontWeight': '500'}),
-                dcc.Dropdown(
-                    id='intervalo-dropdown',
-                    options=[
-                        {'label': '5 anos', 'value': '5'},
-                        {'label': '10 anos', 'value': '10'},
-                        {'label': 'Todos os anos', 'value': 'all'}
-                    ],
-                    value='10',
-                    clearable=False,
-                    style=DROPDOWN_STYLE
-                ),
-                dbc.Label("Ano", style={'fontWeight': '500', 'marginTop': '10px'}),
-                dcc.Dropdown(
-                    id='ano-dropdown',
-                    options=[],
-                    value=None,
-                    clearable=False,
-                    style=DROPDOWN_STYLE
-                ),
-            ]
-        ),
-    ],
-    body=True,
-    style=CARD_STYLE,
-    className="mb-4"
-)
+# Controle deslizante de anos: qualquer intervalo; os limites e as marcas vêm dos dados (preencher_layout)
+# e o ano-dropdown serve de atalho para os intervalos de 5 e 10 anos (o valor inicial também vem dele)
+def criar_seletor_anos(primeiro_ano=None, ultimo_ano=None):
+    limites = ({} if primeiro_ano is None else
+               {'min': primeiro_ano, 'max': ultimo_ano, 'marks': marcas_anos(primeiro_ano, ultimo_ano)})
+    return dcc.RangeSlider(
+        id='anos-slider',
+        step=1,
+        allowCross=False,
+        tooltip={'placement': 'bottom'},
+        **limites,
+    )
 
-# Coordenadas de Paragominas
-lat = -3.0551
-lon = -47.3497
+# Card de controles atualizado, com o controle deslizante de anos da versão atual dos dados
+def criar_controles(seletor_anos):
+    return dbc.Card(
+        [
+            html.Div(
+                [
+                    html.H4("Filtros", style=TITLE_STYLE),
+                    dbc.Label("Intervalo de Anos", style={'fontWeight': '500'}),
+                    dcc.Dropdown(
+                        id='intervalo-dropdown',
+                        options=[
+                            {'label': '5 anos', 'value': '5'},
+                            {'label': '10 anos', 'value': '10'},
+                            {'label': 'Todos os anos', 'value': 'all'}
+                        ],
+                        value='10',
+                        clearable=False,
+                        style=DROPDOWN_STYLE
+                    ),
+                    dbc.Label("Ano", style={'fontWeight': '500', 'marginTop': '10px'}),
+                    dcc.Dropdown(
+                        id='ano-dropdown',
+                        options=[],
+                        value=None,
+                        clearable=False,
+                        style=DROPDOWN_STYLE
+                    ),
+                    dbc.Label("Anos", style={'fontWeight': '500', 'marginTop': '10px'}),
+                    seletor_anos,
+                    # Comparação de períodos: guarda o intervalo do controle deslizante para o card de comparação
+                    html.Div(
+                        [
+                            dbc.Button("Adicionar à comparação", id='adicionar-comparacao', color='primary', size='sm',
+                                       className='me-2'),
+                            dbc.Button("Limpar", id='limpar-comparacao', color='secondary', size='sm', outline=True),
+                        ],
+                        style={'marginTop': '10px', 'marginBottom': '15px'},
+                    ),
+                    dbc.Label("Escala do SPEI", style={'fontWeight': '500', 'marginTop': '10px'}),
+                    dcc.Dropdown(
+                        id='escala-dropdown',
+                        options=[
+                            {'label': f'{escala} {"mês" if escala == 1 else "meses"} (SPEI-{escala})', 'value': escala}
+                            for escala in ESCALAS
+                        ],
+                        value=1,
+                        clearable=False,
+                        style=DROPDOWN_STYLE
+                    ),
+                    # Progresso do cálculo de uma escala nova (visível só enquanto o callback em segundo plano roda)
+                    html.Div(
+                        [
+                            dbc.Label("Calculando o SPEI...", style={'fontWeight': '500', 'marginTop': '10px'}),
+                            dbc.Progress(id='progresso-calculo', value=0, max=1, striped=True, animated=True),
+                        ],
+                        id='progresso-container',
+                        style={'display': 'none'},
+                    ),
+                ]
+            ),
+        ],
+        body=True,
+        style=CARD_STYLE,
+        className="mb-4"
+    )
 
-# Criando um mapa com Plotly
+# Criando um mapa com Plotly: um ponto por local do registro; clicar em um ponto seleciona o local
+df_locais = pd.DataFrame(locais)
 mapa_paragominas = px.scatter_mapbox(
-    lat=[lat], 
-    lon=[lon], 
-    hover_name=["Paragominas"],
-    color=["Paragominas"], 
-    size=[10],  # Tamanho do marcador
-    title="Localização de Paragominas - PA",  # Título do mapa
+    df_locais,
+    lat='lat',
+    lon='lon',
+    hover_name='nome',
+    color='nome',
+    custom_data=['id'],
+    size=[10] * len(locais),  # Tamanho do marcador
+    title=(f"Localização de {locais[0]['nome']} - {locais[0]['uf']}" if len(locais) == 1
+           else "Locais disponíveis (clique para selecionar)"),  # Título do mapa
 )
 
 # Atualizando o layout do mapa
 mapa_paragominas.update_layout(
     mapbox_style="open-street-map",  # Estilo do mapa
     mapbox_zoom=6,  # Zoom ajustado para abrir mais a área
-    mapbox_center={"lat": lat, "lon": lon},  # Centraliza Paragominas
+    mapbox_center={"lat": df_locais['lat'].mean(), "lon": df_locais['lon'].mean()},  # Centraliza os locais
     showlegend=False,  # Remover legenda
     margin={"r":0,"t":40,"l":0,"b":0}  # Remover margens do gráfico
 )
 
+# Estilo da descrição do produto, cujo texto vem dos dados (descricao_periodo)
+ESTILO_DESCRICAO = {'fontSize': '16px', 'lineHeight': '1.6', 'color': '#555555'}
+ARMAZENAMENTO_CLIENTE = config.MODO_CLIENTE or config.MODO_ESTATICO
 
-app.layout = dbc.Container(
-    [
-        html.Meta(
-        name='viewport',
-        content='width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no'
-    ),
-    
-        html.Link(
-        rel="stylesheet",
-        href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css"
-    ),
 
-        # Banner (Logo no topo)
-        # Navbar com título
-        dbc.Navbar(
-            dbc.Container(
-                [
-                    dbc.Row(
-                        dbc.Col(
-                            html.H1("VARIABILIDADE DA SECA NA REGIÃO DE PARAGOMINAS", 
-                                    style={
-                                        'color': '#FFFFFF',  # Cor do título na navbar
-                                        'fontWeight': '600',  # Negrito
-                                        'fontSize': '24px',  # Tamanho da fonte
-                                    }),
-                        ),
-                        align="center",  # Centraliza o conteúdo
-                    ),
-                ]
-            ),
-            color="primary",  # Cor de fundo da navbar (pode ser 'primary', 'secondary', etc.)
-            dark=True,  # Para garantir que o texto fique visível (fundo escuro e texto claro)
-            style={'marginBottom': '30px'},  # Adiciona margem inferior para descolar a navbar
+# Árvore do layout com os componentes que dependem dos dados (controle deslizante de anos, descrição e, nos
+# modos cliente e estático, os dados do navegador). Sem eles, serve de estrutura para validar os callbacks.
+def montar_layout(seletor_anos, descricao, armazenamento_cliente):
+    return dbc.Container(
+        [
+            html.Meta(
+            name='viewport',
+            content='width=device-width, initial-scale=1.0, maximum-scale=1.0, user-scalable=no'
         ),
-        
-        # Layout com duas colunas principais (esquerda para controles, direita para gráficos)
-        dbc.Row(
-            [
-                # Coluna para os controles
-                dbc.Col(
+    
+            html.Link(
+            rel="stylesheet",
+            href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css"
+        ),
+
+            # Banner (Logo no topo)
+            # Navbar com título
+            dbc.Navbar(
+                dbc.Container(
                     [
-                        controls,
-                         html.H3(
-                            "Dashboard SPEI", 
-                            style={
-                                'fontWeight': '600',  # Negrito
-                                'fontSize': '24px',  # Tamanho maior
-                                'marginBottom': '15px',  # Espaço abaixo do título
-                                'color': '#007bff',  # Cor azul para o título
-                            }
-                        ),
-                        # Descrição do produto
-                        html.P(
-                            "Este produto apresenta os resultados de uma análise da variabilidade climática no município de Paragominas, no estado do Pará, Brasil, entre 1981 e 2022. O foco está na avaliação do índice SPEI (Standardized Precipitation Evapotranspiration Index).",
-                            style={'fontSize': '16px', 'lineHeight': '1.6', 'color': '#555555'}
-                        ),
-                        dcc.Graph(
-                            id="mapa-paragominas",
-                            figure=mapa_paragominas,
-                            config={"responsive": True},
+                        dbc.Row(
+                            dbc.Col(
+                                html.H1("VARIABILIDADE DA SECA NA REGIÃO DE PARAGOMINAS", 
+                                        style={
+                                            'color': '#FFFFFF',  # Cor do título na navbar
+                                            'fontWeight': '600',  # Negrito
+                                            'fontSize': '24px',  # Tamanho da fonte
+                                        }),
+                            ),
+                            align="center",  # Centraliza o conteúdo
                         ),
-                    ],  # Coloque o controle aqui novamente se precisar, ou defina conforme o layout desejado
-                    xs=12,
-                    sm=12,
-                    md=3,  # A coluna de configurações ocupa 3 das 12 colunas do grid
-                    style={'backgroundColor': '#FFFFFF', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}
+                    ]
                 ),
+                color="primary",  # Cor de fundo da navbar (pode ser 'primary', 'secondary', etc.)
+                dark=True,  # Para garantir que o texto fique visível (fundo escuro e texto claro)
+                style={'marginBottom': '30px'},  # Adiciona margem inferior para descolar a navbar
+            ),
+        
+            # Layout com duas colunas principais (esquerda para controles, direita para gráficos)
+            dbc.Row(
+                [
+                    # Coluna para os controles
+                    dbc.Col(
+                        [
+                            criar_controles(seletor_anos),
+                            # Seleção normalizada compartilhada pelos gráficos e a chave da última figura de cada um
+                            dcc.Store(id='selecao'),
+                            dcc.Store(id='selecao-pendente'),
+                            dcc.Store(id='periodos-comparacao', data=[]),
+                            *[dcc.Store(id=f'{id_grafico}-chave') for id_grafico in CONSTRUTORES],
+                            *([armazenamento_cliente] if armazenamento_cliente is not None else []),
+                             html.H3(
+                                "Dashboard SPEI", 
+                                style={
+                                    'fontWeight': '600',  # Negrito
+                                    'fontSize': '24px',  # Tamanho maior
+                                    'marginBottom': '15px',  # Espaço abaixo do título
+                                    'color': '#007bff',  # Cor azul para o título
+                                }
+                            ),
+                            # Descrição do produto
+                            descricao,
+                            dcc.Graph(
+                                id="mapa-paragominas",
+                                figure=mapa_paragominas,
+                                config={"responsive": True},
+                            ),
+                        ],  # Coloque o controle aqui novamente se precisar, ou defina conforme o layout desejado
+                        xs=12,
+                        sm=12,
+                        md=3,  # A coluna de configurações ocupa 3 das 12 colunas do grid
+                        style={'backgroundColor': '#FFFFFF', 'padding': '20px', 'borderRadius': '8px', 'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}
+                    ),
                 
-                # Coluna para os gráficos (com vários gráficos empilhados verticalmente)
-                dbc.Col(
-                    [
-                        # Card de "Análise SPEI"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Análise SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="spei-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                        # Card de "Distribuição de Categorias"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Distribuição de Categorias", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="barras-empilhadas-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                        # Card de "Média Mensal"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Média Mensal", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="media-mensal-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                        # Card de "Histograma de SPEI"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Histograma de SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="histograma-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                        # Card de "Dispersão SPEI"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Dispersão SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="scatter-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                        # Card de "Boxplot SPEI por Ano"
-                        dbc.Card(
-                            [
-                                dbc.CardHeader("Boxplot SPEI por Ano", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
-                                dcc.Graph(id="boxplot-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
-                            ],
-                            className="card-shadow",
-                            style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
-                        ),
-                    ],
-                    xs=12,
-                    sm=12,
-                    md=9,  # A coluna de gráficos ocupa 9 das 12 colunas do grid
-                ),
-            ],
-            align="start",
-            style={'marginBottom': '20px'},
-        ),
+                    # Coluna para os gráficos (com vários gráficos empilhados verticalmente)
+                    dbc.Col(
+                        [
+                            # Card de "Análise SPEI"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Análise SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="spei-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Distribuição de Categorias"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Distribuição de Categorias", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="barras-empilhadas-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Média Mensal"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Média Mensal", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="media-mensal-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Histograma de SPEI"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Histograma de SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="histograma-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Dispersão SPEI"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Dispersão SPEI", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="scatter-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Boxplot SPEI por Ano"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Boxplot SPEI por Ano", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="boxplot-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}  # Adicionando margem inferior
+                            ),
+                            # Card de "Eventos de Seca"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Eventos de Seca", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dbc.CardBody(id="eventos-conteudo"),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}
+                            ),
+                            # Card de "Comparação de Períodos"
+                            dbc.Card(
+                                [
+                                    dbc.CardHeader("Comparação de Períodos", style={'backgroundColor': '#F8F9FA', 'fontWeight': '600'}),
+                                    dcc.Graph(id="comparacao-categorias-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                    dcc.Graph(id="comparacao-mensal-graph", config={'responsive': True}, style={'width': '100%', 'height': '400px'}),
+                                    dbc.CardBody(id="comparacao-resumo"),
+                                ],
+                                className="card-shadow",
+                                style={'boxShadow': '0 4px 6px rgba(0, 0, 0, 0.1)', 'marginBottom': '20px'}
+                            ),
+                        ],
+                        xs=12,
+                        sm=12,
+                        md=9,  # A coluna de gráficos ocupa 9 das 12 colunas do grid
+                    ),
+                ],
+                align="start",
+                style={'marginBottom': '20px'},
+            ),
         
-        # Add the footer at the bottom
-        footer
-    ],
-    fluid=True,  # Para que o layout seja fluido e ocupe toda a largura da tela
-    style={'backgroundColor': '#F4F6F7'}  # Fundo levemente acinzentado
-)
+            # Add the footer at the bottom
+            footer
+        ],
+        fluid=True,  # Para que o layout seja fluido e ocupe toda a largura da tela
+        style={'backgroundColor': '#F4F6F7'}  # Fundo levemente acinzentado
+    )
 
-@app.callback(
-    [Output('ano-dropdown', 'options'),
-     Output('ano-dropdown', 'value')],  # Adicionando value aqui
-    Input('intervalo-dropdown', 'value')
-)
-def atualizar_ano_dropdown(intervalo):
-    anos_disponiveis = list(range(1981, 2023))  # Supondo que os dados vão até 2022
-    opcoes = []
-    
-    if intervalo == '5':
-        for ano in range(1981, 2023, 5):
-            ano_final = ano + 4
-            if ano_final <= anos_disponiveis[-1]:
-                opcoes.append({'label': f'{ano} a {ano_final}', 'value': f'{ano}-{ano_final}'})
-        if anos_disponiveis[-1] > 1981:
-            opcoes.append({'label': f'{anos_disponiveis[-2]} a {anos_disponiveis[-1]}', 'value': f'{anos_disponiveis[-2]}-{anos_disponiveis[-1]}'})
-            
-    elif intervalo == '10':
-        for ano in range(1981, 2023, 10):
-            ano_final = ano + 9
-            if ano_final <= anos_disponiveis[-1]:
-                opcoes.append({'label': f'{ano} a {ano_final}', 'value': f'{ano}-{ano_final}'})
-        if anos_disponiveis[-1] > 2020:
-            opcoes.append({'label': f'{anos_disponiveis[-2]} a {anos_disponiveis[-1]}', 'value': f'{anos_disponiveis[-2]}-{anos_disponiveis[-1]}'})
 
-    elif intervalo == 'all':
-        opcoes = [{'label': '1981 a 2022', 'value': '1981-2022'}]
+# Layout da versão atual dos dados. Cada versão é uma árvore nova, trocada de uma só vez sob trava_dados e nunca
+# alterada depois: a requisição que já pegou a anterior a serializa inteira, sem misturar as duas versões
+layout_atual = {'arvore': None}
 
-    # Define o value como a primeira opção se houver opções
-    valor_default = opcoes[0]['value'] if opcoes else None
 
-    return opcoes, valor_default  # Retornando as opções e o valor padrão
+# Monta o layout com a versão atual dos dados e o publica
+def preencher_layout():
+    spei_escalas = dados.obter()
+    armazenamento_cliente = None
+    if config.MODO_ESTATICO:
+        armazenamento_cliente = dcc.Store(id='dados-cliente', data=dados_estaticos(
+            spei_escalas, atualizar_ano_dropdown, config.SERVIDOR_FALLBACK))
+    elif ARMAZENAMENTO_CLIENTE:
+        armazenamento_cliente = dcc.Store(id='dados-cliente', data=dados_cliente(spei_escalas, atualizar_ano_dropdown))
+    layout_atual['arvore'] = montar_layout(criar_seletor_anos(*spei_escalas.anos_disponiveis()),
+                                           html.P(descricao_periodo(), style=ESTILO_DESCRICAO),
+                                           armazenamento_cliente)
 
 
-@app.callback(
-    [Output('spei-graph', 'figure'),
-     Output('barras-empilhadas-graph', 'figure'),
-     Output('media-mensal-graph', 'figure'),
-     Output('histograma-graph', 'figure'),
-     Output('scatter-graph', 'figure'),
-     Output('boxplot-graph', 'figure')],
-    Input('ano-dropdown', 'value')
-)
-def atualizar_graficos(intervalo):
-    if not intervalo:  # Se não houver intervalo selecionado
-        raise dash.exceptions.PreventUpdate
+# Layout servido a cada carregamento da página: o primeiro espera a carga dos dados, se ainda não terminou
+def servir_layout():
+    arvore = layout_atual['arvore']
+    if arvore is None:
+        with trava_dados:
+            if layout_atual['arvore'] is None:
+                preencher_layout()
+            arvore = layout_atual['arvore']
+    return arvore
 
-    if intervalo == '1981-2022':
-        ano_inicial, ano_final = 1981, 2022
-    else:
-        ano_inicial, ano_final = map(int, intervalo.split('-'))
-
-    spei_filtrado = filtrar_por_ano(spei_1, ano_inicial, ano_final)
-    categorias = spei_filtrado.apply(categorizar_spei)
-    dados_ano = spei_filtrado.groupby(spei_filtrado.index.year).apply(lambda x: x.apply(categorizar_spei).value_counts(normalize=True) * 100).unstack(fill_value=0)
-
-    font_style = dict(family='Arial, sans-serif', size=12, color='black')
-
-    # Gráfico de linha SPEI
-    linha_figure = {
-    'data': [
-        go.Scatter(
-            x=spei_filtrado.index,
-            y=spei_filtrado.values,
-            mode='lines',
-            name=f'SPEI de {ano_inicial} a {ano_final + 1}',
-            line=dict(color='gray', width=2)  # Espessura da linha
-        )
-    ],
-    'layout': go.Layout(
-        xaxis={
-            'title': 'Data',
-            'title_font': dict(color='black', size=14),
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey',
-        },
-        yaxis={
-            'title': 'SPEI',
-            'range': [-3, 3],
-            'title_font': dict(color='black', size=14),
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey',
-        },
-        plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-        paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-        font=dict(color='black', size=12),  # Tamanho da fonte,
-        margin=dict(t=40, l=50, r=40, b=50),  # Margens
-        legend=dict(title='Legenda', font=font_style)
-    )
-}
 
-    # Dicionário de cores atualizado
-    cores_categorias = {
-        'Umidade extrema': '#1e3a8a',
-        'Umidade severa': '#1d4ed8',
-        'Umidade moderada': '#0ea5e9',
-        'Umidade fraca': '#93c5fd',
-        'Seca fraca': '#fca5a5',
-        'Seca moderada': '#ef4444',
-        'Seca severa': '#b91c1c',
-        'Seca extrema': '#7f1d1d',
-    }
+# A estrutura fixa valida os callbacks sem precisar dos dados durante o import
+app.validation_layout = montar_layout(criar_seletor_anos(), html.P(style=ESTILO_DESCRICAO),
+                                      dcc.Store(id='dados-cliente') if ARMAZENAMENTO_CLIENTE else None)
+app.layout = servir_layout
 
-    # Gráfico de barras empilhadas atualizado
-    barras_figure = {
-        'data': [
-            go.Bar(
-                x=dados_ano.index,
-                y=dados_ano.get(categoria, pd.Series([0] * len(dados_ano.index))),
-                name=categoria,
-                marker=dict(color=cores_categorias[categoria])  # Usando as cores atualizadas
-            ) for categoria in [
-                'Umidade extrema',
-                'Umidade severa',
-                'Umidade moderada',
-                'Umidade fraca',
-                'Seca fraca',
-                'Seca moderada',
-                'Seca severa',
-                'Seca extrema',             
-            ]
-        ],
-        'layout': go.Layout(
-            barmode='stack',
-            xaxis={
-                'title': 'Ano',
-                'title_font': dict(color='black', size=12),
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey',
-            },
-            yaxis={
-                'title': 'Porcentagem',
-                'title_font': dict(color='black', size=12),
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey',
-            },
-            plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-            paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-            font=dict(color='black', size=12),  # Tamanho da fonte
-            legend=dict(traceorder='normal', font=dict(size=12)),  # Tamanho da fonte da legenda
-            margin=dict(t=20, l=40, r=40, b=40),  # Margens
-            bargap=0.1  # Espaçamento entre as barras
-        )
-    }
+# Um callback por gráfico: cada card é atualizado em paralelo, sem esperar pelo mais lento,
+# e devolve no_update quando a figura já exibida corresponde à seleção
+def registrar_callback_grafico(id_grafico):
+    # Os gráficos de linha e dispersão também respondem ao zoom, buscando o trecho visível com mais detalhe
+    detalhavel = id_grafico in GRAFICOS_DETALHAVEIS
+    entradas = [Input('selecao', 'data')] + ([Input(id_grafico, 'relayoutData')] if detalhavel else [])
 
-    # Gráfico de média mensal
-    media_mensal = spei_filtrado.resample('M').mean()
-    media_mensal_por_mes = media_mensal.groupby(media_mensal.index.month).mean()  # Média por mês
-    meses = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-    
-    media_mensal_figure = {
-    'data': [
-        go.Bar(
-            x=meses,
-            y=media_mensal_por_mes.values,
-            name='Média Mensal de SPEI',
-            marker=dict(color='gray', opacity=0.7)  # Adicionando opacidade
-        )
-    ],
-    'layout': go.Layout(
-        xaxis={
-            'title': 'Meses',
-            'title_font': dict(color='black', size=12),
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey',  # Cor da grade
-        },
-        yaxis={
-            'title': 'SPEI',
-            'title_font': dict(color='black', size=12),
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey',
-        },
-        plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-        paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-        font=dict(color='black', size=12),  # Tamanho da fonte
-        margin=dict(t=20, l=40, r=25, b=40),  # Margens
+    @app.callback(
+        [Output(id_grafico, 'figure'),
+         Output(f'{id_grafico}-chave', 'data')],
+        entradas,
+        State(f'{id_grafico}-chave', 'data')
     )
-}
+    def atualizar_grafico(selecao, *resto):
+        *relayout, chave_atual = resto
+        if not selecao:
+            raise dash.exceptions.PreventUpdate
+        selecao = validar_selecao(selecao)
 
-    # Gráfico de histograma
-    histograma_figure = {
-        'data': [
-            go.Histogram(
-                x=spei_filtrado.values,
-                marker=dict(color='gray', opacity=0.75)  # Adicionando opacidade
-            )
-        ],
-        'layout': go.Layout(
-            xaxis={
-                'title': 'SPEI',
-                'title_font': dict(color='black', size=12),
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey',  # Cor da grade
-            },
-            yaxis={
-                'title': 'Frequência',
-                'title_font': dict(color='black', size=12),
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey',
-            },
-            plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-            paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-            font=dict(color='black', size=12),  # Tamanho da fonte
-            margin=dict(t=20, l=40, r=25, b=40),  # Margens
-        )
-    }
+        chave = [selecao['ano_inicial'], selecao['ano_final'], selecao['escala'], selecao['local']]
+        if relayout and dash.ctx.triggered_id == id_grafico:
+            faixa = faixa_do_relayout(relayout[0])
+            if faixa is False:
+                raise dash.exceptions.PreventUpdate
+            if faixa:
+                cubo = dados.obter().cubo(selecao['escala'], selecao['local'])
+                if not precisa_detalhar(cubo, selecao['ano_inicial'], selecao['ano_final']):
+                    raise dash.exceptions.PreventUpdate  # Todos os pontos já estão no navegador
+                chave.append(faixa)
+        if chave == chave_atual:
+            return dash.no_update, dash.no_update
 
+        return obter_figura(id_grafico, *chave), chave
 
-    # Gráfico de dispersão
-    scatter_figure = {
-    'data': [
-        go.Scatter(
-            x=spei_filtrado.index,
-            y=spei_filtrado.values,
-            mode='markers',
-            marker=dict(color='gray', size=7, opacity=0.8)  # Aumentando o tamanho e adicionando opacidade
-        )
-    ],
-    'layout': go.Layout(
-        xaxis={
-            'title': 'Data',
-            'title_font': dict(color='black', size=12),  # Tamanho da fonte do título
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey'  # Cor da grade
-        },
-        yaxis={
-            'title': 'SPEI',
-            'range': [-3, 3],
-            'title_font': dict(color='black', size=12),  # Tamanho da fonte do título
-            'tickfont': dict(color='black', size=12),
-            'showgrid': True,
-            'gridcolor': 'lightgrey'  # Cor da grade
-        },
-        plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-        paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-        margin=dict(t=20, l=40, r=25, b=40),  # Margens
-        font=dict(color='black', size=12)  # Tamanho da fonte
-    )
-}
+    return atualizar_grafico
 
 
-    # Gráfico de boxplot por ano
-    boxplot_figure = {
-        'data': [
-            go.Box(
-                y=spei_filtrado[spei_filtrado.index.year == ano].values,
-                name=str(ano),
-                marker=dict(color='gray'),
-                boxmean='sd'  # Adiciona a média e desvio padrão
-            ) for ano in spei_filtrado.index.year.unique()
-        ],
-        'layout': go.Layout(
-            yaxis={
-                'title': 'SPEI',
-                'range': [-3, 3],
-                'title_font': dict(color='black', size=12),  # Tamanho da fonte do título
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey'  # Cor da grade
-            },
-            xaxis={
-                'title': 'Ano',
-                'title_font': dict(color='black', size=12),  # Tamanho da fonte do título
-                'tickfont': dict(color='black', size=12),
-                'showgrid': True,
-                'gridcolor': 'lightgrey'  # Cor da grade
-            },
-            plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
-            paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
-            margin=dict(t=30, l=40, r=25, b=40),  # Margens
-            font=dict(color='black', size=12)  # Tamanho da fonte
-        )
+if config.MODO_CLIENTE:
+    registrar_callbacks_cliente(app)
+elif config.MODO_ESTATICO:
+    registrar_callbacks_estaticos(app)
+else:
+    app.callback(
+        [Output('ano-dropdown', 'options'),
+         Output('ano-dropdown', 'value')],  # Adicionando value aqui
+        Input('intervalo-dropdown', 'value')
+    )(atualizar_ano_dropdown)
+    app.callback(Output('anos-slider', 'value'), Input('ano-dropdown', 'value'))(aplicar_atalho)
+    entradas_selecao = [Input('anos-slider', 'value'),
+                        Input('escala-dropdown', 'value'),
+                        Input('mapa-paragominas', 'clickData')]
+    if gerenciador_segundo_plano is None:
+        app.callback(Output('selecao', 'data'), entradas_selecao)(atualizar_selecao)
+    else:
+        app.callback(
+            [Output('selecao', 'data'),
+             Output('selecao-pendente', 'data')],
+            entradas_selecao
+        )(encaminhar_selecao)
+        app.callback(
+            Output('selecao', 'data', allow_duplicate=True),
+            Input('selecao-pendente', 'data'),
+            background=True,
+            progress=[Output('progresso-calculo', 'value'), Output('progresso-calculo', 'max')],
+            running=[(Output('progresso-container', 'style'), {'display': 'block'}, {'display': 'none'})],
+            cancel=entradas_selecao,
+            interval=500,
+            prevent_initial_call=True,
+        )(preparar_selecao)
+    for id_grafico in CONSTRUTORES:
+        registrar_callback_grafico(id_grafico)
+    app.callback(
+        Output('eventos-conteudo', 'children'),
+        Input('selecao', 'data')
+    )(atualizar_eventos)
+    app.callback(
+        Output('periodos-comparacao', 'data'),
+        [Input('adicionar-comparacao', 'n_clicks'),
+         Input('limpar-comparacao', 'n_clicks')],
+        [State('anos-slider', 'value'),
+         State('periodos-comparacao', 'data')],
+        prevent_initial_call=True,
+    )(atualizar_periodos)
+    app.callback(
+        [Output(id_grafico, 'figure') for id_grafico in CONSTRUTORES_COMPARACAO] + [Output('comparacao-resumo', 'children')],
+        [Input('periodos-comparacao', 'data'),
+         Input('selecao', 'data')]
+    )(atualizar_comparacao)
+
+# Prontidão para o balanceador/orquestrador: 200 quando os dados já foram carregados, 503 enquanto carregam
+@app.server.route('/pronto')
+def prontidao():
+    if dados.pronto():
+        return jsonify({'pronto': True, 'tempo_carga': dados.tempo_carga})
+    return jsonify({'pronto': False, 'erro': dados.erro}), 503
+
+
+# Saída (id do primeiro componente atualizado) de uma requisição de callback, usada como rótulo das métricas
+# O id vem do corpo enviado pelo navegador: só ids de saídas registradas em app.callback_map viram rótulo, os
+# demais contam como 'outro' (sem rótulos arbitrários nem uma série nova por id forjado)
+def saida_callback():
+    corpo = request.get_json(silent=True) or {}
+    saidas = corpo.get('outputs')
+    saida = saidas[0] if isinstance(saidas, list) and saidas else saidas
+    if not isinstance(saida, dict):
+        return 'desconhecida'
+    return saida.get('id') if saida.get('id') in ids_saidas() else 'outro'
+
+
+# Ids dos componentes atualizados pelos callbacks do servidor, das chaves do app.callback_map
+# ('id.prop', '..id.prop...id.prop..', com o sufixo '@hash' das saídas duplicadas)
+def ids_saidas():
+    return {
+        saida.rsplit('.', 1)[0]
+        for chave in app.callback_map
+        for saida in chave.split('@')[0].strip('.').split('...')
     }
 
-    return linha_figure, barras_figure, media_mensal_figure, histograma_figure, scatter_figure, boxplot_figure 
+
+# Cronômetro (e, com SPEI_DIRETORIO_PERFIL, o cProfile) de cada requisição de callback
+@app.server.before_request
+def iniciar_medicao():
+    if request.path.endswith('/_dash-update-component'):
+        g.inicio_callback = time.perf_counter()
+        if config.DIRETORIO_PERFIL:
+            g.perfil = cProfile.Profile()
+            g.perfil.enable()
+
+
+@app.server.after_request
+def registrar_medicao(resposta):
+    inicio = g.pop('inicio_callback', None)
+    if inicio is None:
+        return resposta
+    saida = saida_callback()
+    metricas.observar('callback_segundos', time.perf_counter() - inicio, saida=saida)
+    if not resposta.direct_passthrough:
+        metricas.observar('resposta_bytes', len(resposta.get_data()), LIMITES_BYTES, saida=saida)
+
+    perfil = g.pop('perfil', None)
+    if perfil is not None:
+        perfil.disable()
+        try:
+            os.makedirs(config.DIRETORIO_PERFIL, exist_ok=True)
+            perfil.dump_stats(os.path.join(config.DIRETORIO_PERFIL, f'{time.time_ns()}-{os.getpid()}-{saida}.prof'))
+        except OSError:
+            pass
+    return resposta
+
+
+# Compressão e cabeçalhos de cache das respostas (registrada depois da medição, roda antes dela: as métricas
+# de tamanho contam os bytes já comprimidos)
+registrar_camada_http(app.server, config.NIVEL_COMPRESSAO)
+
+
+# Métricas deste worker no formato de texto do Prometheus: tempos das etapas e dos callbacks, tamanho das
+# respostas e o cache de figuras
+@app.server.route('/metrics')
+def exportar_metricas():
+    estatisticas = cache_figuras.estatisticas()
+    texto = metricas.texto({
+        'cache_figuras_acertos_total': ('counter', 'Figuras servidas pelo cache', estatisticas['acertos']),
+        'cache_figuras_falhas_total': ('counter', 'Figuras construídas por falta no cache', estatisticas['falhas']),
+        'cache_figuras_taxa_acertos': ('gauge', 'Fração das figuras servidas pelo cache', estatisticas['taxa_acertos']),
+        'cache_figuras_entradas': ('gauge', 'Figuras no cache em memória', estatisticas['entradas_memoria']),
+        'dados_prontos': ('gauge', 'Dados carregados (1) ou ainda carregando (0)', int(dados.pronto())),
+        'dados_carga_segundos': ('gauge', 'Tempo da carga dos dados', dados.tempo_carga or 0.0),
+    })
+    return Response(texto, mimetype='text/plain; version=0.0.4')
+
+
+# Contadores do cache de figuras (acertos, falhas e taxa de acerto deste worker)
+@app.server.route('/cache-figuras')
+def estatisticas_cache_figuras():
+    return jsonify(cache_figuras.estatisticas())
+
+
+# Parâmetros de uma exportação (escala, local e anos), com os padrões do dashboard; ValueError se inválidos
+def parametros_exportacao(argumentos, spei_escalas):
+    primeiro_ano, ultimo_ano = spei_escalas.anos_disponiveis()
+    escala = int(argumentos.get('escala', ESCALAS[0]))
+    local = argumentos.get('local', locais[0]['id'])
+    ano_inicial = int(argumentos.get('ano_inicial', primeiro_ano))
+    ano_final = int(argumentos.get('ano_final', ultimo_ano))
+    if escala not in ESCALAS:
+        raise ValueError(f'Escala inválida: {escala} (disponíveis: {", ".join(map(str, ESCALAS))})')
+    if local not in locais_por_id:
+        raise ValueError(f'Local desconhecido: {local}')
+    if ano_inicial > ano_final:
+        raise ValueError('ano_inicial maior que ano_final')
+    return {'escala': escala, 'local': local, 'ano_inicial': ano_inicial, 'ano_final': ano_final}
+
+
+# Exportação em lote das séries do SPEI com as categorias (/api/spei/serie.csv) e das porcentagens anuais de
+# cada categoria (/api/spei/percentuais.csv), em CSV, JSON ou Parquet (com o pyarrow instalado). A resposta é
+# gerada em blocos e leva um ETag da versão dos dados: clientes que repetem a consulta recebem 304.
+@app.server.route('/api/spei/<tabela>.<formato>')
+def exportar_spei(tabela, formato):
+    if tabela not in exportacao.TABELAS:
+        return jsonify({'erro': f'Tabela desconhecida: {tabela}'}), 404
+    if formato not in exportacao.formatos_disponiveis():
+        return jsonify({'erro': f'Formato indisponível: {formato}',
+                        'formatos': exportacao.formatos_disponiveis()}), 400
+
+    spei_escalas = dados.obter()
+    try:
+        parametros = parametros_exportacao(request.args, spei_escalas)
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+
+    etag = '-'.join([cache_figuras.versao or '', tabela, formato, *map(str, parametros.values())])
+    if request.if_none_match.contains(etag):
+        resposta = Response(status=304)
+        resposta.set_etag(etag)
+        return resposta
+
+    blocos = exportacao.TABELAS[tabela](spei_escalas, **parametros)
+    metadados = {'tabela': tabela, 'versao': cache_figuras.versao, **parametros}
+    resposta = Response(stream_with_context(exportacao.exportar(blocos, formato, metadados)),
+                        content_type=exportacao.FORMATOS[formato])
+    resposta.set_etag(etag)
+    resposta.headers['Cache-Control'] = 'no-cache'
+    nome = f'spei-{parametros["escala"]}-{tabela}-{parametros["local"]}-{parametros["ano_inicial"]}-{parametros["ano_final"]}'
+    resposta.headers['Content-Disposition'] = f'attachment; filename="{nome}.{formato}"'
+    return resposta
+
+
+# Figuras e eventos de uma seleção (mesmos parâmetros da exportação), para as páginas do modo estático hospedadas
+# em outro domínio: por isso liberada a qualquer origem (CORS)
+@app.server.route('/api/figuras')
+def figuras_api():
+    try:
+        selecao = parametros_exportacao(request.args, dados.obter())
+    except ValueError as erro:
+        return jsonify({'erro': str(erro)}), 400
+    resposta = Response(json.dumps(conteudo_selecao(selecao), cls=plotly.utils.PlotlyJSONEncoder),
+                        mimetype='application/json')
+    resposta.headers['Access-Control-Allow-Origin'] = '*'
+    return resposta
+
+
+# SPEI com os balanços relidos: se os meses já conhecidos não mudaram, os novos são anexados a `spei_escalas`
+# (só as janelas que terminam neles são calculadas, com os parâmetros guardados); se mudaram (revisão dos dados),
+# tudo é recalculado nas `escalas`. Devolve o SPEI e o número de meses novos.
+def incorporar_balancos(spei_escalas, novos_balancos, escalas):
+    atuais = spei_escalas.balancos
+    if len(novos_balancos) >= len(atuais) and novos_balancos.iloc[:len(atuais)].equals(atuais):
+        return spei_escalas, spei_escalas.anexar(novos_balancos.iloc[len(atuais):])
+    return calcular_spei(novos_balancos, escalas), len(novos_balancos) - len(atuais)
+
+
+# Relê as planilhas (pelo cache binário, refeito só para as que mudaram) e incorpora os meses novos ao SPEI.
+# A planilha alterada é lida inteira, pois só assim se sabe se meses antigos foram revistos. O layout servido a
+# partir daí (opções de anos, descrição e dados do modo cliente) já inclui os meses novos.
+def atualizar_dados():
+    with trava_dados:
+        spei_escalas = dados.obter()
+        if config.MEMORIA_COMPARTILHADA:
+            # Os meses novos mudam a versão das planilhas: um processo publica a nova versão e os demais a mapeiam
+            meses_atuais = len(spei_escalas.balancos)  # Antes de carregar_dados, que anexa a spei_escalas
+            dados.substituir(carregar_dados(spei_escalas))
+            preencher_layout()
+            return len(dados.obter().balancos) - meses_atuais
+
+        novo, meses_novos = incorporar_balancos(spei_escalas, extrair_balancos(locais),
+                                                spei_escalas.escalas_calculadas())
+        if novo is not spei_escalas:
+            dados.substituir(novo)
+        cache_figuras.versao = versao_figuras(novo)
+        preencher_layout()
+        return meses_novos
+
+
+# Instante (time.monotonic) da última atualização aceita pela rota, neste processo
+ultima_atualizacao = {'instante': None}
+trava_rota_atualizacao = threading.Lock()
+
+
+# Incorpora meses novos sem reiniciar o servidor (ex.: chamado pelo job que baixa os dados do TerraClimate).
+# Só responde com o segredo de config.TOKEN_ATUALIZACAO no cabeçalho X-Token-Atualizacao e aceita no máximo uma
+# atualização a cada config.INTERVALO_MINIMO_ATUALIZACAO segundos
+@app.server.route('/atualizar-dados', methods=['POST'])
+def rota_atualizar_dados():
+    if not config.TOKEN_ATUALIZACAO:
+        return jsonify({'erro': 'Atualização pela rota desligada (SPEI_TOKEN_ATUALIZACAO vazio)'}), 404
+    token = request.headers.get('X-Token-Atualizacao', '')
+    if not hmac.compare_digest(token.encode(), config.TOKEN_ATUALIZACAO.encode()):
+        return jsonify({'erro': 'Token de atualização inválido'}), 403
+    with trava_rota_atualizacao:
+        agora = time.monotonic()
+        anterior = ultima_atualizacao['instante']
+        if anterior is not None and agora - anterior < config.INTERVALO_MINIMO_ATUALIZACAO:
+            espera = int(config.INTERVALO_MINIMO_ATUALIZACAO - (agora - anterior)) + 1
+            resposta = jsonify({'erro': f'Atualização recente: tente de novo em {espera} s'})
+            resposta.status_code = 429
+            resposta.headers['Retry-After'] = str(espera)
+            return resposta
+        ultima_atualizacao['instante'] = agora
+    meses_novos = atualizar_dados()
+    return jsonify({'meses_novos': meses_novos, 'ultimo_mes': f'{dados.obter().balancos.index[-1]:%Y-%m}'})
+
+
+# Verificação periódica das planilhas em segundo plano (cada worker verifica as suas)
+def verificar_dados_periodicamente():
+    versao = versao_dados(*arquivos_dados)
+    while True:
+        time.sleep(config.INTERVALO_ATUALIZACAO)
+        try:
+            versao_atual = versao_dados(*arquivos_dados)
+            if versao_atual != versao:
+                atualizar_dados()
+                versao = versao_atual
+        except OSError:
+            pass  # Planilha sendo substituída: tenta de novo na próxima verificação
+
+
+# Inicia a verificação periódica, se configurada (com o preload do gunicorn, chamada em cada worker após o fork)
+def iniciar_verificacao_periodica():
+    if config.INTERVALO_ATUALIZACAO > 0:
+        threading.Thread(target=verificar_dados_periodicamente, daemon=True).start()
+
+
+# Sob o gunicorn.conf.py quem inicia é o post_fork de cada worker (o master só importa o app)
+if not config.VERIFICACAO_POST_FORK:
+    iniciar_verificacao_periodica()
+
+
+# Carga dos dados: em segundo plano (padrão) ou já durante o import, como nas versões anteriores
+if config.CARGA_ADIADA:
+    dados.aquecer()
+else:
+    dados.obter()
+
 
 if __name__ == '__main__':
     app.run_server(host='0.0.0.0', port=8000)
@@ -0,0 +1,481 @@
+// Callbacks do modo cliente (SPEI_MODO_CLIENTE=1): o recorte por intervalo de anos e a montagem
+// das figuras rodam no navegador, a partir dos dados enviados uma única vez no dcc.Store 'dados-cliente'.
+// As figuras reproduzem as construídas em figuras.py, usando os modelos (layout e estilos) gerados pelo servidor;
+// os arrays numéricos usam typed arrays, equivalentes aos arrays compactos (base64) enviados pelo servidor.
+// O modo estático (SPEI_MODO_ESTATICO=1) reaproveita as opções de anos, a seleção e a comparação de períodos e lê
+// as figuras prontas.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    spei: (function () {
+        function copiar(objeto) {
+            return JSON.parse(JSON.stringify(objeto));
+        }
+
+        function doisDigitos(numero) {
+            return (numero < 10 ? '0' : '') + numero;
+        }
+
+        // Valores ausentes (null) viram NaN, como no array float32 do servidor
+        function float32(valores) {
+            return Float32Array.from(valores, function (valor) { return valor === null ? NaN : valor; });
+        }
+
+        // Trecho contíguo da série da escala selecionada entre ano_inicial e ano_final
+        function recortar(dados, selecao) {
+            var serie = dados.series[selecao.local][String(selecao.escala)];
+            var partes = serie.inicio.split('-');
+            var mesZero = Number(partes[0]) * 12 + Number(partes[1]) - 1;
+            var inicio = Math.max(0, selecao.ano_inicial * 12 - mesZero);
+            var fim = Math.min(serie.valores.length, (selecao.ano_final + 1) * 12 - mesZero);
+            var recorte = {datas: [], anos: [], meses: [], valores: [], codigos: []};
+            for (var k = inicio; k < fim; k++) {
+                var mes = mesZero + k;
+                var ano = Math.floor(mes / 12);
+                recorte.datas.push(ano + '-' + doisDigitos(mes % 12 + 1));
+                recorte.anos.push(ano);
+                recorte.meses.push(mes % 12);
+                recorte.valores.push(serie.valores[k]);
+                recorte.codigos.push(serie.codigos[k]);
+            }
+            return recorte;
+        }
+
+        // Anos do recorte, na ordem, com a posição do primeiro mês de cada um
+        function anosDoRecorte(recorte) {
+            var anos = [];
+            var inicios = [];
+            for (var k = 0; k < recorte.anos.length; k++) {
+                if (k === 0 || recorte.anos[k] !== recorte.anos[k - 1]) {
+                    anos.push(recorte.anos[k]);
+                    inicios.push(k);
+                }
+            }
+            inicios.push(recorte.anos.length);
+            return {anos: anos, inicios: inicios};
+        }
+
+        function valido(recorte, k) {
+            return recorte.valores[k] !== null && recorte.codigos[k] >= 0;
+        }
+
+        // Quantil com interpolação linear, como np.percentile (valores já ordenados)
+        function quantil(ordenados, fracao) {
+            var posicao = (ordenados.length - 1) * fracao;
+            var abaixo = Math.floor(posicao);
+            var acima = Math.min(abaixo + 1, ordenados.length - 1);
+            var t = posicao - abaixo;
+            var diferenca = ordenados[acima] - ordenados[abaixo];
+            return t >= 0.5 ? ordenados[acima] - diferenca * (1 - t) : ordenados[abaixo] + diferenca * t;
+        }
+
+        // Estatísticas de uma caixa do boxplot, como em agregados.CuboAgregado
+        function caixa(valores) {
+            var ordenados = valores.slice().sort(function (a, b) { return a - b; });
+            var q1 = quantil(ordenados, 0.25);
+            var q3 = quantil(ordenados, 0.75);
+            var amplitude = 1.5 * (q3 - q1);
+            var inferior = q1;
+            var superior = q3;
+            var soma = 0;
+            ordenados.forEach(function (valor) {
+                if (valor >= q1 - amplitude && valor < inferior) { inferior = valor; }
+                if (valor <= q3 + amplitude && valor > superior) { superior = valor; }
+                soma += valor;
+            });
+            var media = soma / ordenados.length;
+            var quadrados = 0;
+            ordenados.forEach(function (valor) { quadrados += (valor - media) * (valor - media); });
+            return {q1: q1, mediana: quantil(ordenados, 0.5), q3: q3, inferior: inferior, superior: superior,
+                    media: media, desvio: Math.sqrt(quadrados / ordenados.length)};
+        }
+
+        // Componente do dash_html_components, no formato que os callbacks devolvem
+        function componente(tipo, filhos, props) {
+            return {type: tipo, namespace: 'dash_html_components', props: Object.assign({children: filhos}, props || {})};
+        }
+
+        // Rótulo de um período, como figuras.rotulo_periodo
+        function rotuloPeriodo(anoInicial, anoFinal) {
+            return anoInicial === anoFinal ? String(anoInicial) : anoInicial + ' a ' + anoFinal;
+        }
+
+        // Número com `casas` decimais na tabela da comparação, ou o texto de valor ausente, como figuras.formatar_valor
+        function formatarValor(valor, casas, dados) {
+            return isFinite(valor) ? valor.toFixed(casas) : dados.valor_ausente;
+        }
+
+        // Agregados anuais da escala e do local da seleção (modo_cliente._estatisticas_cliente): os enviados pelo
+        // servidor (modo estático) ou, no modo cliente, montados a partir da série
+        function estatisticasAnuais(dados, selecao) {
+            if (dados.estatisticas) {
+                return dados.estatisticas[selecao.local][String(selecao.escala)];
+            }
+            var serie = dados.series[selecao.local][String(selecao.escala)];
+            var partes = serie.inicio.split('-');
+            var mesZero = Number(partes[0]) * 12 + Number(partes[1]) - 1;
+            var estatisticas = {ano_inicial: Math.floor(mesZero / 12), contagem: [], mensal: []};
+            for (var k = 0; k < serie.valores.length; k++) {
+                var mes = mesZero + k;
+                var linha = Math.floor(mes / 12) - estatisticas.ano_inicial;
+                if (linha === estatisticas.mensal.length) {
+                    estatisticas.contagem.push(dados.categorias.map(function () { return 0; }));
+                    estatisticas.mensal.push(dados.meses.map(function () { return null; }));
+                }
+                estatisticas.mensal[linha][mes % 12] = serie.valores[k];
+                if (serie.valores[k] !== null && serie.codigos[k] >= 0) {
+                    estatisticas.contagem[linha][serie.codigos[k]] += 1;
+                }
+            }
+            return estatisticas;
+        }
+
+        // Estatísticas de um período [ano_inicial, ano_final] somando as linhas anuais dos seus anos, como
+        // CuboAgregado.percentual_periodo, media_mensal e resumo
+        function combinarPeriodo(estatisticas, periodo, dados) {
+            var primeira = Math.max(0, periodo[0] - estatisticas.ano_inicial);
+            var ultima = Math.min(estatisticas.mensal.length, periodo[1] - estatisticas.ano_inicial + 1);
+            var contagem = dados.categorias.map(function () { return 0; });
+            var soma = dados.meses.map(function () { return 0; });
+            var quantos = dados.meses.map(function () { return 0; });
+            var n = 0;
+            var total = 0;
+            var quadrados = 0;
+            for (var linha = primeira; linha < ultima; linha++) {
+                estatisticas.contagem[linha].forEach(function (meses, codigo) { contagem[codigo] += meses; });
+                estatisticas.mensal[linha].forEach(function (valor, mes) {
+                    if (valor !== null) {
+                        soma[mes] += valor;
+                        quantos[mes] += 1;
+                        n += 1;
+                        total += valor;
+                        quadrados += valor * valor;
+                    }
+                });
+            }
+            var classificados = contagem.reduce(function (a, b) { return a + b; }, 0);
+            var media = n ? total / n : NaN;
+            return {
+                percentuais: contagem.map(function (meses) { return classificados ? meses / classificados * 100 : 0; }),
+                media_mensal: soma.map(function (valor, mes) { return quantos[mes] ? valor / quantos[mes] : NaN; }),
+                contagem: n,
+                media: media,
+                desvio: n > 1 ? Math.sqrt(Math.max(quadrados - n * media * media, 0) / (n - 1)) : NaN
+            };
+        }
+
+        // 'AAAA-MM' -> 'MM/AAAA', como nas datas do card de eventos do servidor
+        function mesAno(data) {
+            var partes = data.split('-');
+            return partes[1] + '/' + partes[0];
+        }
+
+        function serieTemporal(selecao, dados, idGrafico) {
+            if (!selecao) {
+                return window.dash_clientside.no_update;
+            }
+            var recorte = recortar(dados, selecao);
+            var figura = copiar(dados.modelos[idGrafico]);
+            figura.data[0].x = recorte.datas;
+            figura.data[0].y = float32(recorte.valores);
+            return figura;
+        }
+
+        return {
+            opcoes_anos: function (intervalo, dados) {
+                var opcoes = dados.opcoes_anos[intervalo] || [[], null];
+                return [opcoes[0], opcoes[1]];
+            },
+
+            // Modo estático (snapshot.py): as figuras e os eventos da seleção vêm de um arquivo JSON pré-calculado;
+            // se a seleção não foi pré-calculada, do servidor ao vivo (/api/figuras), quando configurado
+            figuras_estaticas: function (selecao, dados) {
+                var saidas = dados.graficos.length + 1;
+                if (!selecao) {
+                    return Array(saidas).fill(window.dash_clientside.no_update);
+                }
+                function lerJson(resposta) {
+                    if (!resposta.ok) {
+                        throw new Error('HTTP ' + resposta.status);
+                    }
+                    return resposta.json();
+                }
+                var arquivo = [selecao.ano_inicial, selecao.ano_final, selecao.escala, selecao.local].join('-') + '.json';
+                return fetch(dados.diretorio + '/' + encodeURIComponent(arquivo)).then(lerJson).catch(function (erro) {
+                    if (!dados.servidor) {
+                        throw erro;
+                    }
+                    var parametros = ['escala', 'local', 'ano_inicial', 'ano_final'].map(function (nome) {
+                        return nome + '=' + encodeURIComponent(selecao[nome]);
+                    });
+                    return fetch(dados.servidor + '/api/figuras?' + parametros.join('&')).then(lerJson);
+                }).then(function (conteudo) {
+                    return dados.graficos.map(function (idGrafico) { return conteudo[idGrafico]; }).concat([conteudo.eventos]);
+                }).catch(function () {
+                    return Array(saidas).fill(window.dash_clientside.no_update);
+                });
+            },
+
+            // Atalho do ano-dropdown ('1981-1990') para o controle deslizante de anos
+            atalho_anos: function (intervalo) {
+                if (!intervalo) {
+                    return window.dash_clientside.no_update;
+                }
+                return intervalo.split('-').map(Number);
+            },
+
+            selecao: function (anos, escala, clique, dados) {
+                if (!anos) {
+                    return window.dash_clientside.no_update;
+                }
+                // Local clicado no mapa (id no customdata do ponto); sem clique, o primeiro do registro
+                var local = dados.locais[0];
+                if (clique && clique.points && clique.points.length && clique.points[0].customdata) {
+                    var clicado = clique.points[0].customdata[0];
+                    if (dados.locais.indexOf(clicado) >= 0) {
+                        local = clicado;
+                    }
+                }
+                return {ano_inicial: anos[0], ano_final: anos[1], escala: escala, local: local};
+            },
+
+            // Lista de períodos comparados, como atualizar_periodos (app.py)
+            periodos: function (adicionar, limpar, anos, periodos, dados) {
+                var disparos = window.dash_clientside.callback_context.triggered.map(function (disparo) {
+                    return disparo.prop_id;
+                });
+                if (disparos.indexOf('limpar-comparacao.n_clicks') >= 0) {
+                    return [];
+                }
+                periodos = periodos || [];
+                anos = anos && [Math.min(anos[0], anos[1]), Math.max(anos[0], anos[1])];
+                var repetido = anos && periodos.some(function (periodo) {
+                    return periodo[0] === anos[0] && periodo[1] === anos[1];
+                });
+                if (!anos || repetido) {
+                    return window.dash_clientside.no_update;
+                }
+                return periodos.concat([anos]).slice(-dados.cores_periodos.length);
+            },
+
+            // Card de comparação: mesmos gráficos e tabela de atualizar_comparacao (app.py), com cada período
+            // combinado a partir dos agregados anuais
+            comparacao: function (periodos, selecao, dados) {
+                if (!selecao) {
+                    return Array(3).fill(window.dash_clientside.no_update);
+                }
+                periodos = periodos || [];
+                var estatisticas = estatisticasAnuais(dados, selecao);
+                var combinados = periodos.map(function (periodo) { return combinarPeriodo(estatisticas, periodo, dados); });
+                var rotulos = periodos.map(function (periodo) { return rotuloPeriodo(periodo[0], periodo[1]); });
+
+                var categorias = copiar(dados.modelos['comparacao-categorias-graph']);
+                categorias.data.forEach(function (traco) {
+                    var codigo = dados.categorias.indexOf(traco.name);
+                    traco.x = rotulos;
+                    traco.y = Float32Array.from(combinados, function (combinado) { return combinado.percentuais[codigo]; });
+                });
+
+                var mensal = copiar(dados.modelos['comparacao-mensal-graph']);
+                var modelo = mensal.data[0];
+                mensal.data = combinados.map(function (combinado, i) {
+                    var traco = copiar(modelo);
+                    traco.x = dados.meses;
+                    traco.y = Float32Array.from(combinado.media_mensal);
+                    traco.name = rotulos[i];
+                    traco.line.color = dados.cores_periodos[i % dados.cores_periodos.length];
+                    return traco;
+                });
+
+                if (!periodos.length) {
+                    return [categorias, mensal, [componente('P', dados.texto_comparacao_vazia)]];
+                }
+                var cabecalho = componente('Thead', componente('Tr', dados.colunas_comparacao.map(function (coluna) {
+                    return componente('Th', coluna);
+                })));
+                var linhas = componente('Tbody', combinados.map(function (combinado, i) {
+                    var seca = combinado.percentuais.slice(0, dados.limite_seca + 1).reduce(function (a, b) { return a + b; }, 0);
+                    return componente('Tr', [
+                        componente('Td', rotulos[i]),
+                        componente('Td', combinado.contagem),
+                        componente('Td', formatarValor(combinado.media, 2, dados)),
+                        componente('Td', formatarValor(combinado.desvio, 2, dados)),
+                        componente('Td', combinado.contagem ? formatarValor(seca, 1, dados) : dados.valor_ausente)
+                    ]);
+                }));
+                return [categorias, mensal, [componente('Table', [cabecalho, linhas], {className: 'table table-sm table-striped'})]];
+            },
+
+            linha: function (selecao, dados) {
+                var figura = serieTemporal(selecao, dados, 'spei-graph');
+                if (selecao) {
+                    figura.data[0].name = 'SPEI-' + selecao.escala + ' de ' + selecao.ano_inicial + ' a ' + (selecao.ano_final + 1);
+                }
+                return figura;
+            },
+
+            dispersao: function (selecao, dados) {
+                return serieTemporal(selecao, dados, 'scatter-graph');
+            },
+
+            histograma: function (selecao, dados) {
+                if (!selecao) {
+                    return window.dash_clientside.no_update;
+                }
+                var recorte = recortar(dados, selecao);
+                var bordas = dados.bordas_histograma;
+                var contagens = bordas.slice(1).map(function () { return 0; });
+                for (var k = 0; k < recorte.valores.length; k++) {
+                    if (valido(recorte, k)) {
+                        // Classe [borda, próxima borda); fora de [-4, 4] entra nas classes extremas
+                        var classe = 0;
+                        while (classe < contagens.length - 1 && recorte.valores[k] >= bordas[classe + 1]) {
+                            classe++;
+                        }
+                        contagens[classe] += 1;
+                    }
+                }
+                var ocupadas = [];
+                contagens.forEach(function (contagem, classe) {
+                    if (contagem > 0) { ocupadas.push(classe); }
+                });
+                var primeira = ocupadas.length ? ocupadas[0] : 0;
+                var ultima = ocupadas.length ? ocupadas[ocupadas.length - 1] + 1 : 0;
+                var figura = copiar(dados.modelos['histograma-graph']);
+                figura.data[0].x = Float32Array.from(contagens.slice(primeira, ultima), function (contagem, i) {
+                    return (bordas[primeira + i] + bordas[primeira + i + 1]) / 2;
+                });
+                figura.data[0].y = Int32Array.from(contagens.slice(primeira, ultima));
+                return figura;
+            },
+
+            barras_empilhadas: function (selecao, dados) {
+                if (!selecao) {
+                    return window.dash_clientside.no_update;
+                }
+                var recorte = recortar(dados, selecao);
+                var grupos = anosDoRecorte(recorte);
+                var contagem = grupos.anos.map(function () {
+                    return dados.categorias.map(function () { return 0; });
+                });
+                var totais = grupos.anos.map(function () { return 0; });
+                for (var i = 0; i < grupos.anos.length; i++) {
+                    for (var k = grupos.inicios[i]; k < grupos.inicios[i + 1]; k++) {
+                        if (valido(recorte, k)) {
+                            contagem[i][recorte.codigos[k]] += 1;
+                            totais[i] += 1;
+                        }
+                    }
+                }
+                var figura = copiar(dados.modelos['barras-empilhadas-graph']);
+                figura.data.forEach(function (traco) {
+                    var codigo = dados.categorias.indexOf(traco.name);
+                    traco.x = Int16Array.from(grupos.anos);
+                    traco.y = Float32Array.from(contagem, function (linha, i) {
+                        return totais[i] > 0 ? linha[codigo] / totais[i] * 100 : 0;
+                    });
+                });
+                return figura;
+            },
+
+            media_mensal: function (selecao, dados) {
+                if (!selecao) {
+                    return window.dash_clientside.no_update;
+                }
+                var recorte = recortar(dados, selecao);
+                var soma = dados.meses.map(function () { return 0; });
+                var contagem = dados.meses.map(function () { return 0; });
+                for (var k = 0; k < recorte.valores.length; k++) {
+                    if (valido(recorte, k)) {
+                        soma[recorte.meses[k]] += recorte.valores[k];
+                        contagem[recorte.meses[k]] += 1;
+                    }
+                }
+                var figura = copiar(dados.modelos['media-mensal-graph']);
+                figura.data[0].x = dados.meses;
+                figura.data[0].y = Float32Array.from(soma, function (total, mes) {
+                    return contagem[mes] > 0 ? total / contagem[mes] : NaN;
+                });
+                return figura;
+            },
+
+            boxplot: function (selecao, dados) {
+                if (!selecao) {
+                    return window.dash_clientside.no_update;
+                }
+                var recorte = recortar(dados, selecao);
+                var grupos = anosDoRecorte(recorte);
+                var caixas = grupos.anos.map(function (ano, i) {
+                    var valores = [];
+                    for (var k = grupos.inicios[i]; k < grupos.inicios[i + 1]; k++) {
+                        if (recorte.valores[k] !== null) { valores.push(recorte.valores[k]); }
+                    }
+                    return caixa(valores);
+                });
+                function coluna(nome) {
+                    return Float32Array.from(caixas, function (estatisticas) { return estatisticas[nome]; });
+                }
+                var figura = copiar(dados.modelos['boxplot-graph']);
+                var traco = figura.data[0];
+                traco.x = grupos.anos.map(String);
+                traco.q1 = coluna('q1');
+                traco.median = coluna('mediana');
+                traco.q3 = coluna('q3');
+                traco.lowerfence = coluna('inferior');
+                traco.upperfence = coluna('superior');
+                traco.mean = coluna('media');
+                traco.sd = coluna('desvio');
+                return figura;
+            },
+
+            // Card de eventos de seca: mesmo conteúdo de componentes_eventos (app.py), a partir da tabela de
+            // eventos enviada pelo servidor (eventos que tocam o período: fim >= janeiro do ano inicial e
+            // início <= dezembro do ano final)
+            eventos: function (selecao, dados) {
+                if (!selecao) {
+                    return window.dash_clientside.no_update;
+                }
+                var tabela = dados.eventos[selecao.local][String(selecao.escala)];
+                var primeiroMes = selecao.ano_inicial + '-01';
+                var ultimoMes = selecao.ano_final + '-12';
+                var indices = [];
+                tabela.inicio.forEach(function (inicio, i) {
+                    if (tabela.fim[i] >= primeiroMes && inicio <= ultimoMes) { indices.push(i); }
+                });
+                if (!indices.length) {
+                    return [componente('P', 'Nenhum evento de seca no período.')];
+                }
+                var longo = indices[0];
+                var severo = indices[0];
+                var mesesSeca = 0;
+                indices.forEach(function (i) {
+                    if (tabela.duracao[i] > tabela.duracao[longo]) { longo = i; }
+                    if (tabela.severidade[i] > tabela.severidade[severo]) { severo = i; }
+                    mesesSeca += tabela.meses_seca[i];
+                });
+                var texto = indices.length + ' eventos de seca (' + mesesSeca + ' meses secos). ' +
+                    'Mais longo: ' + tabela.duracao[longo] + ' meses (' + mesAno(tabela.inicio[longo]) + ' a ' +
+                    mesAno(tabela.fim[longo]) + '). ' +
+                    'Mais severo: severidade ' + tabela.severidade[severo].toFixed(2) + ', pico de ' +
+                    tabela.pico[severo].toFixed(2) + ' (' + dados.categorias[tabela.categoria_pico[severo]] + ') em ' +
+                    mesAno(tabela.data_pico[severo]) + '.';
+                var cabecalho = componente('Thead', componente('Tr', dados.colunas_eventos.map(function (coluna) {
+                    return componente('Th', coluna);
+                })));
+                var linhas = componente('Tbody', indices.map(function (i) {
+                    return componente('Tr', [
+                        componente('Td', mesAno(tabela.inicio[i])),
+                        componente('Td', mesAno(tabela.fim[i]) + (tabela.em_curso[i] ? ' (em curso)' : '')),
+                        componente('Td', tabela.duracao[i]),
+                        componente('Td', tabela.severidade[i].toFixed(2)),
+                        componente('Td', tabela.pico[i].toFixed(2)),
+                        componente('Td', dados.categorias[tabela.categoria_pico[i]])
+                    ]);
+                }));
+                return [
+                    componente('P', texto),
+                    componente('Div', componente('Table', [cabecalho, linhas], {className: 'table table-sm table-striped'}),
+                               {style: dados.estilo_tabela_eventos})
+                ];
+            }
+        };
+    })()
+});
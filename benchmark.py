@@ -0,0 +1,663 @@
+import argparse
+import gzip
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from categorias import CATEGORIAS
+from figuras import GRAFICOS_DETALHAVEIS
+from indices import categorizar_spei, classificar_spei, spei_lote
+from serie_mensal import SerieMensal
+
+
+# Série sintética de SPEI mensal (normal padrão) com `n` meses a partir de 1981
+# (índice em segundos para que séries muito longas não estourem o limite de datas em nanossegundos)
+def serie_sintetica(n, semente=0):
+    gerador = np.random.default_rng(semente)
+    meses = np.datetime64('1981-01', 'M') + np.arange(n)
+    return pd.Series(gerador.standard_normal(n), index=pd.DatetimeIndex(meses.astype('datetime64[s]'), name='data'))
+
+
+# Corpo da requisição do callback de um gráfico quando a seleção muda (os gráficos detalháveis também
+# recebem o relayoutData, vazio)
+def corpo_callback(id_grafico, selecao, chave_atual=None):
+    entradas = [{'id': 'selecao', 'property': 'data', 'value': selecao}]
+    if id_grafico in GRAFICOS_DETALHAVEIS:
+        entradas.append({'id': id_grafico, 'property': 'relayoutData', 'value': None})
+    return {
+        'output': f'..{id_grafico}.figure...{id_grafico}-chave.data..',
+        'outputs': [{'id': id_grafico, 'property': 'figure'}, {'id': f'{id_grafico}-chave', 'property': 'data'}],
+        'inputs': entradas,
+        'state': [{'id': f'{id_grafico}-chave', 'property': 'data', 'value': chave_atual}],
+        'changedPropIds': ['selecao.data'],
+    }
+
+
+# Menor tempo médio por chamada (s) em `repeticoes` rodadas de `numero` chamadas
+def cronometrar(funcao, numero=5, repeticoes=5):
+    return min(timeit.repeat(funcao, number=numero, repeat=repeticoes)) / numero
+
+
+# Cópia da cadeia if/elif que classificava o SPEI antes da tabela de limiares (com as lacunas [-2,00; -1,99) e
+# [-1,00; -0,99), que caíam em 'Seca extrema'): a linha de base de bench_classificacao
+def _categorizar_cadeia(spei_value):
+    if spei_value >= 2.00:
+        return 'Umidade extrema'
+    elif 1.50 <= spei_value < 2.00:
+        return 'Umidade severa'
+    elif 1.00 <= spei_value < 1.50:
+        return 'Umidade moderada'
+    elif 0 <= spei_value < 1.00:
+        return 'Umidade fraca'
+    elif -0.99 <= spei_value < 0:
+        return 'Seca fraca'
+    elif -1.50 <= spei_value < -1.00:
+        return 'Seca moderada'
+    elif -1.99 <= spei_value < -1.50:
+        return 'Seca severa'
+    else:
+        return 'Seca extrema'
+
+
+# Classificação elemento a elemento com a cadeia antiga (Series.apply) contra a classificação vetorizada
+def bench_classificacao(tamanhos):
+    for n in tamanhos:
+        serie = serie_sintetica(n)
+        t_apply = cronometrar(lambda: serie.apply(_categorizar_cadeia))
+        t_vetor = cronometrar(lambda: classificar_spei(serie))
+        print(f'classificação n={n:>8}: apply {t_apply * 1e3:9.3f} ms | vetorizada {t_vetor * 1e3:9.3f} ms | {t_apply / t_vetor:7.1f}x')
+
+
+# Eventos de seca como se faz à mão: um laço mês a mês (mesmos critérios e unificação de detectar_eventos)
+def _eventos_laco(serie, categoria_limite='Seca moderada', intervalo_maximo=1, duracao_minima=1):
+    limite = CATEGORIAS.index(categoria_limite)
+    eventos, atual = [], None
+    for posicao, (valor, codigo) in enumerate(zip(serie.valores.astype('float64'), serie.codigos)):
+        if not 0 <= codigo <= limite:
+            continue
+        if atual is not None and posicao - atual['fim'] - 1 <= intervalo_maximo:
+            atual['fim'] = posicao
+            atual['severidade'] -= valor
+            if valor < atual['pico']:
+                atual['pico'] = valor
+        else:
+            atual = {'inicio': posicao, 'fim': posicao, 'severidade': -valor, 'pico': valor}
+            eventos.append(atual)
+    return [evento for evento in eventos if evento['fim'] - evento['inicio'] + 1 >= duracao_minima]
+
+
+# Detecção dos eventos de seca em séries longas (laço contra run-length vetorizado, conferindo que dão os
+# mesmos eventos) e consulta de um intervalo de anos na tabela pronta, como faz cada requisição
+def bench_eventos(tamanhos):
+    from eventos import detectar_eventos, eventos_intervalo
+
+    for n in tamanhos:
+        serie = SerieMensal.de_serie(serie_sintetica(n))
+        tabela = detectar_eventos(serie)
+        laco = _eventos_laco(serie)
+        if len(laco) != len(tabela) or not np.allclose([evento['severidade'] for evento in laco], tabela['severidade']):
+            raise SystemExit(f'eventos n={n}: o laço e a detecção vetorizada divergem')
+
+        ano_final = int(serie.anos()[-1])
+        t_laco = cronometrar(lambda: _eventos_laco(serie), numero=1, repeticoes=3)
+        t_vetor = cronometrar(lambda: detectar_eventos(serie), numero=1, repeticoes=3)
+        t_consulta = cronometrar(lambda: eventos_intervalo(tabela, ano_final - 9, ano_final), numero=100)
+        print(f'eventos n={n:>8} ({len(tabela):6d} eventos): laço {t_laco * 1e3:9.2f} ms | '
+              f'vetorizado {t_vetor * 1e3:8.2f} ms | {t_laco / t_vetor:6.1f}x | consulta 10 anos {t_consulta * 1e6:7.1f} µs')
+
+
+# Balanço hídrico sintético (tempo × local) com `locais` séries de `n` meses
+def balancos_sinteticos(locais, n=504, semente=0):
+    gerador = np.random.default_rng(semente)
+    meses = np.datetime64('1981-01', 'M') + np.arange(n)
+    sazonal = 60 * np.sin(2 * np.pi * np.arange(n) / 12)[:, None]
+    return pd.DataFrame(sazonal + gerador.normal(0, 40, (n, locais)),
+                        index=pd.DatetimeIndex(meses.astype('datetime64[s]'), name='data'),
+                        columns=[f'local-{j}' for j in range(locais)])
+
+
+# Tempo do SPEI em lote de `locais` séries sintéticas com 1, 2, 4, ... processos (até o número de núcleos, ou
+# os números em `contagens`), com o ganho sobre a execução em série; o resultado deve ser idêntico para
+# qualquer número de processos
+def bench_agendador(locais, escalas=(1,), contagens=None):
+    balancos = balancos_sinteticos(locais)
+    nucleos = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    contagens = sorted({1, *contagens} if contagens else
+                       {2 ** k for k in range(nucleos.bit_length()) if 2 ** k <= nucleos} | {nucleos})
+    print(f'agendador: {nucleos} núcleo(s) disponível(is)')
+
+    referencia = None
+    for processos in contagens:
+        inicio = time.perf_counter()
+        resultado = spei_lote(balancos, escalas, processos)
+        tempo = time.perf_counter() - inicio
+        if referencia is None:
+            referencia, tempo_serie = resultado, tempo
+        identico = all(np.array_equal(resultado[e].to_numpy(), referencia[e].to_numpy(), equal_nan=True) for e in escalas)
+        print(f'agendador {locais} séries x {len(escalas)} escala(s), {processos:>3} processo(s): '
+              f'{tempo:8.2f} s | {tempo_serie / tempo:5.2f}x | {"idêntico" if identico else "DIFERENTE"}')
+
+
+# Executado em um processo novo: tempos (s) do início do import do app até o fim do import, até a primeira
+# resposta do /pronto e até a primeira resposta de um callback de gráfico
+_SCRIPT_INICIALIZACAO = """
+import json, time
+inicio = time.perf_counter()
+import app
+from benchmark import corpo_callback
+importado = time.perf_counter() - inicio
+cliente = app.app.server.test_client()
+status_pronto = cliente.get('/pronto').status_code
+pronto = time.perf_counter() - inicio
+selecao = {'ano_inicial': 1981, 'ano_final': 1990, 'escala': 1, 'local': app.locais[0]['id']}
+cliente.post('/_dash-update-component', json=corpo_callback('spei-graph', selecao))
+print(json.dumps({'import': importado, 'pronto': pronto, 'status_pronto': status_pronto,
+                  'callback': time.perf_counter() - inicio}))
+"""
+
+
+# Tempo do import até a primeira resposta, com a carga adiada (padrão) e com a carga durante o import,
+# com o cache binário das planilhas já pronto ou vazio (`frio`: as planilhas são lidas do Excel)
+def bench_inicializacao(frio=False):
+    for adiada in ('1', '0'):
+        with tempfile.TemporaryDirectory() as diretorio:
+            ambiente = dict(os.environ, SPEI_CARGA_ADIADA=adiada, SPEI_DIRETORIO_CACHE_FIGURAS='')
+            if frio:
+                ambiente['SPEI_DIRETORIO_CACHE'] = diretorio
+            saida = subprocess.run([sys.executable, '-c', _SCRIPT_INICIALIZACAO], env=ambiente, check=True,
+                                   capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        tempos = json.loads(saida.stdout.strip().splitlines()[-1])
+        print(f'inicialização carga {"adiada " if adiada == "1" else "no import"}{" (cache frio)" if frio else ""}: '
+              f'import {tempos["import"]:6.2f} s | /pronto {tempos["pronto"]:6.2f} s ({tempos["status_pronto"]}) | '
+              f'1º callback {tempos["callback"]:6.2f} s')
+
+
+# PSS (memória proporcional, em MiB) de um processo e dos seus filhos, pelo /proc (somente Linux)
+def _pss_mib(pid):
+    pids = [pid]
+    for tarefa in os.listdir(f'/proc/{pid}/task'):
+        with open(f'/proc/{pid}/task/{tarefa}/children') as f:
+            pids += [int(filho) for filho in f.read().split()]
+    total = 0
+    for processo in pids:
+        with open(f'/proc/{processo}/smaps_rollup') as f:
+            total += sum(int(linha.split()[1]) for linha in f if linha.startswith('Pss:'))
+    return total / 1024, len(pids) - 1
+
+
+# Sobe o gunicorn com 1, 2, 4... workers, com a configuração de memória compartilhada (gunicorn.conf.py)
+# e sem ela (cada worker importa o app e calcula tudo), e mede o tempo até servir a primeira figura de
+# cada worker e a memória total (PSS) do master com os workers
+def bench_gunicorn(contagens=(1, 2, 4), porta=8765):
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    selecao = {'ano_inicial': 1981, 'ano_final': 2022, 'escala': 24, 'local': None}
+    corpo = json.dumps(corpo_callback('spei-graph', selecao)).encode()
+
+    for compartilhada in (True, False):
+        for workers in contagens:
+            # Sem a configuração do projeto (o gunicorn lê ./gunicorn.conf.py por padrão), cada worker importa o app
+            configuracao = 'gunicorn.conf.py' if compartilhada else os.devnull
+            comando = [sys.executable, '-m', 'gunicorn', '-c', configuracao, '-w', str(workers),
+                       '-b', f'127.0.0.1:{porta}', 'app:server']
+            ambiente = dict(os.environ, SPEI_DIRETORIO_CACHE_FIGURAS='', SPEI_ESCALAS_INICIAIS='1')
+            inicio = time.perf_counter()
+            processo = subprocess.Popen(comando, cwd=diretorio, env=ambiente,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                # Espera todos os workers subirem e envia requisições simultâneas suficientes para que cada
+                # um construa uma figura (SPEI-24)
+                while _pss_mib(processo.pid)[1] < workers:
+                    if processo.poll() is not None:
+                        raise RuntimeError('o gunicorn terminou antes de subir os workers')
+                    time.sleep(0.05)
+
+                def pedir(_):
+                    while True:
+                        try:
+                            pedido = urllib.request.Request(f'http://127.0.0.1:{porta}/_dash-update-component', data=corpo,
+                                                            headers={'Content-Type': 'application/json'})
+                            return urllib.request.urlopen(pedido, timeout=300).read()
+                        except OSError:
+                            time.sleep(0.05)
+
+                with ThreadPoolExecutor(workers) as executor:
+                    list(executor.map(pedir, range(4 * workers)))
+                tempo = time.perf_counter() - inicio
+                pss, filhos = _pss_mib(processo.pid)
+            finally:
+                processo.terminate()
+                processo.wait()
+            print(f'gunicorn {"compartilhada" if compartilhada else "por worker  "} {filhos} worker(s): '
+                  f'{tempo:6.2f} s até responder | PSS total {pss:7.1f} MiB | {pss / (filhos + 1):6.1f} MiB por processo')
+
+
+# Suíte reprodutível: os tempos vão para um JSON (com a versão do código e do ambiente) que pode ser
+# comparado com o de outro commit por --comparar. Sementes fixas; o menor tempo das repetições é a medida
+# principal e a mediana acompanha para indicar o ruído.
+class Suite:
+    def __init__(self, repeticoes=3):
+        self.repeticoes = repeticoes
+        self.resultados = []
+
+    def medir(self, nome, funcao, numero=1, repeticoes=None, **parametros):
+        tempos = [t / numero for t in timeit.repeat(funcao, number=numero, repeat=repeticoes or self.repeticoes)]
+        resultado = {'nome': nome, 'parametros': parametros, 'melhor_s': min(tempos),
+                     'mediana_s': statistics.median(tempos), 'repeticoes': len(tempos), 'numero': numero}
+        self.resultados.append(resultado)
+        detalhe = ' '.join(f'{chave}={valor}' for chave, valor in parametros.items())
+        print(f'{nome:<24} {detalhe:<40} {resultado["melhor_s"] * 1e3:12.3f} ms')
+        return resultado
+
+
+def _ambiente():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+    }
+
+
+# Dados distribuídos em dados/: leitura do Excel, cache binário, extrair_dados por acumulado,
+# ajuste do spei (pacote) e do lote, classificação e figuras para cada valor do ano-dropdown
+def _suite_dados(suite):
+    import spei as si
+
+    import app
+    from indices import ESCALAS
+    from ingestao import carregar_serie, extrair_balanco, extrair_dados, ler_planilha
+
+    app.cache_figuras.diretorio = None  # Somente memória: `limpar()` força a construção das figuras
+    local = app.locais[0]
+    for arquivo in (local['etp'], local['prp']):
+        suite.medir('ingestao_excel', lambda: ler_planilha(arquivo), arquivo=os.path.basename(arquivo))
+        suite.medir('ingestao_cache', lambda: carregar_serie(arquivo), numero=20, arquivo=os.path.basename(arquivo))
+
+    for acumulado in ESCALAS:
+        suite.medir('extrair_dados', lambda: extrair_dados(local['etp'], local['prp'], acumulado), numero=10,
+                    acumulado=acumulado)
+
+    balanco = extrair_balanco(local['etp'], local['prp'])
+    for escala in ESCALAS:
+        acumulado = balanco.rolling(escala).sum().dropna()
+        suite.medir('si_spei', lambda: si.spei(acumulado), escala=escala)
+    suite.medir('spei_lote', lambda: spei_lote(balanco.to_frame(), ESCALAS, 1), escalas='1-24')
+
+    serie = app.dados.obter().serie(1).para_series()
+    suite.medir('categorizar_spei', lambda: serie.apply(categorizar_spei), numero=10, n=len(serie))
+    suite.medir('classificar_spei', lambda: classificar_spei(serie), numero=50, n=len(serie))
+
+    for intervalo in ('5', '10', 'all'):
+        for opcao in app.atualizar_ano_dropdown(intervalo)[0]:
+            def construir():
+                app.cache_figuras.limpar()
+                app.atualizar_graficos(opcao['value'], 1)
+            suite.medir('atualizar_graficos', construir, numero=5, intervalo=intervalo, anos=opcao['value'])
+            suite.medir('atualizar_graficos_cache', lambda: app.atualizar_graficos(opcao['value'], 1), numero=50,
+                        intervalo=intervalo, anos=opcao['value'])
+
+
+# Séries sintéticas com `fator` vezes o comprimento (um local) e `fator` vezes o número de locais
+# (comprimento original): classificação, agregação, figuras do período inteiro e ajuste em lote
+def _suite_sintetica(suite, fatores, n_original=504, ajuste_maximo=100):
+    from agregados import CuboAgregado
+    from eventos import detectar_eventos, eventos_intervalo
+    from figuras import CONSTRUTORES
+
+    for fator in fatores:
+        serie = serie_sintetica(n_original * fator)
+        compacta = SerieMensal.de_serie(serie)
+        cubo = CuboAgregado(compacta)
+        ano_inicial, ano_final = int(cubo.anos[0]), int(cubo.anos[-1])
+        suite.medir('classificar_spei', lambda: classificar_spei(serie), fator_comprimento=fator, n=len(serie))
+        suite.medir('serie_compacta', lambda: SerieMensal.de_serie(serie), fator_comprimento=fator, n=len(serie))
+        suite.medir('cubo_agregado', lambda: CuboAgregado(compacta), fator_comprimento=fator, n=len(serie))
+        tabela = detectar_eventos(compacta)
+        suite.medir('detectar_eventos', lambda: detectar_eventos(compacta), fator_comprimento=fator, n=len(serie))
+        suite.medir('eventos_intervalo', lambda: eventos_intervalo(tabela, ano_final - 9, ano_final), numero=100,
+                    fator_comprimento=fator, n=len(serie))
+        suite.medir('figuras_periodo_inteiro',
+                    lambda: [construir(cubo, ano_inicial, ano_final, 1) for construir in CONSTRUTORES.values()],
+                    fator_comprimento=fator, n=len(serie))
+        suite.medir('spei_lote', lambda: spei_lote(balancos_sinteticos(1, n_original * fator), (1,), 1),
+                    repeticoes=1, fator_comprimento=fator, n=len(serie))
+
+        # Ajustes crescem com o número de locais (12 por local e escala): limitado por `ajuste_maximo`
+        if fator <= ajuste_maximo:
+            balancos = balancos_sinteticos(fator, n_original)
+            suite.medir('spei_lote', lambda: spei_lote(balancos, (1,), None), repeticoes=1,
+                        fator_locais=fator, locais=fator)
+
+
+def executar_suite(saida, fatores=(10, 100, 1000), repeticoes=3, ajuste_maximo=100):
+    suite = Suite(repeticoes)
+    _suite_dados(suite)
+    _suite_sintetica(suite, fatores, ajuste_maximo=ajuste_maximo)
+    with open(saida, 'w', encoding='utf-8') as f:
+        json.dump({'ambiente': _ambiente(), 'resultados': suite.resultados}, f, indent=1, ensure_ascii=False)
+    print(f'resultados gravados em {saida}')
+
+
+# Compara dois JSONs da suíte (ex.: antes e depois de uma mudança): razão novo/antigo do melhor tempo,
+# destacando o que ficou mais de `tolerancia` mais lento
+def comparar_suites(antigo, novo, tolerancia=0.1):
+    def indexar(arquivo):
+        with open(arquivo, encoding='utf-8') as f:
+            return {(r['nome'], json.dumps(r['parametros'], sort_keys=True)): r for r in json.load(f)['resultados']}
+
+    anteriores, atuais = indexar(antigo), indexar(novo)
+    regressoes = 0
+    for chave, resultado in atuais.items():
+        if chave not in anteriores:
+            continue
+        razao = resultado['melhor_s'] / anteriores[chave]['melhor_s']
+        marca = ' <-- mais lento' if razao > 1 + tolerancia else ''
+        regressoes += bool(marca)
+        print(f'{chave[0]:<24} {chave[1]:<60} {razao:6.2f}x{marca}')
+    return regressoes
+
+
+# Orçamento (bytes) da soma das respostas dos seis gráficos na visão 'Todos os anos' (SPEI-1)
+ORCAMENTO_PAYLOAD_TODOS = 40_000
+
+
+# Bytes das respostas dos callbacks dos gráficos em cada valor do ano-dropdown
+# (primeira exibição e repetição da mesma seleção, que deve devolver no_update)
+def bench_payload(escala=1):
+    import app
+
+    cliente = app.app.server.test_client()
+
+    def chamar(id_grafico, selecao, chave_atual):
+        resposta = cliente.post('/_dash-update-component', json=corpo_callback(id_grafico, selecao, chave_atual))
+        return len(resposta.data)
+
+    totais = {}
+    for intervalo in ('5', '10', 'all'):
+        for opcao in app.atualizar_ano_dropdown(intervalo)[0]:
+            ano_inicial, ano_final = app.interpretar_intervalo(opcao['value'])
+            local = app.locais[0]['id']
+            selecao = {'ano_inicial': ano_inicial, 'ano_final': ano_final, 'escala': escala, 'local': local}
+            chave = [ano_inicial, ano_final, escala, local]
+            primeira = {id_grafico: chamar(id_grafico, selecao, None) for id_grafico in app.CONSTRUTORES}
+            repeticao = sum(chamar(id_grafico, selecao, chave) for id_grafico in app.CONSTRUTORES)
+            totais[opcao['value']] = sum(primeira.values())
+            detalhe = ' '.join(f'{id_grafico.replace("-graph", "")}={tamanho}' for id_grafico, tamanho in primeira.items())
+            print(f'payload {opcao["value"]:>9}: {totais[opcao["value"]]:7d} B (repetição {repeticao} B) | {detalhe}')
+    return totais
+
+
+# Bytes transferidos em uma sessão (página, estáticos locais, layout, dependências e os callbacks dos gráficos
+# na seleção inicial), sem compressão/cache, na primeira visita com gzip e na volta à página com o cache do
+# navegador (estáticos imutáveis não são pedidos; o resto é revalidado com If-None-Match)
+def bench_sessao():
+    import re
+
+    import app
+
+    app.dados.obter()
+    cliente = app.app.server.test_client()
+    intervalo = app.atualizar_ano_dropdown('5')[1]
+    ano_inicial, ano_final = app.interpretar_intervalo(intervalo)
+    selecao = {'ano_inicial': ano_inicial, 'ano_final': ano_final, 'escala': 1, 'local': app.locais[0]['id']}
+
+    def sessao(comprimir, cache=None):
+        cabecalhos = {'Accept-Encoding': 'gzip, br'} if comprimir else {}
+        total = 0
+        guardadas = {}
+
+        def pedir(url, corpo=None):
+            nonlocal total
+            extras = dict(cabecalhos)
+            if cache is not None:
+                if cache.get(url, {}).get('imutavel'):
+                    return cache[url]['corpo']
+                if 'etag' in cache.get(url, {}):
+                    extras['If-None-Match'] = cache[url]['etag']
+            if corpo is None:
+                resposta = cliente.get(url, headers=extras)
+            else:
+                resposta = cliente.post(url, json=corpo, headers=extras)
+            dados = resposta.get_data()
+            total += len(dados) + sum(len(nome) + len(valor) + 4 for nome, valor in resposta.headers.items())
+            if resposta.status_code == 304:
+                return cache[url]['corpo']
+            if resposta.headers.get('Content-Encoding') == 'gzip':
+                dados = gzip.decompress(dados)
+            entrada = {'corpo': dados, 'imutavel': 'immutable' in resposta.headers.get('Cache-Control', '')}
+            if resposta.headers.get('ETag'):
+                entrada['etag'] = resposta.headers['ETag']
+            guardadas[url] = entrada
+            return dados
+
+        pagina = pedir('/').decode('utf-8')
+        for url in re.findall(r'(?:src|href)="(/[^"]+)"', pagina):
+            pedir(url)
+        pedir('/_dash-layout')
+        pedir('/_dash-dependencies')
+        for id_grafico in app.CONSTRUTORES:
+            pedir('/_dash-update-component', corpo_callback(id_grafico, selecao))
+        return total, guardadas
+
+    sem_camada, _ = sessao(False)
+    primeira, guardadas = sessao(True)
+    volta, _ = sessao(True, cache=guardadas)
+    for nome, total in (('sem compressão', sem_camada), ('primeira visita', primeira), ('volta à página', volta)):
+        print(f'sessão {nome:>15}: {total:9d} B ({total / sem_camada:6.1%})')
+    return {'sem_compressao': sem_camada, 'primeira_visita': primeira, 'volta': volta}
+
+
+# Memória retida (tracemalloc) por local e escala: séries, cubos e tabelas de eventos de `locais` locais
+# sintéticos com `n` meses em todas as escalas, montados a partir de tabelas de SPEI prontas (sem os ajustes).
+# O balanço hídrico, um por local e não por escala, é descontado.
+def bench_memoria(locais=10, tamanhos=(504, 5040)):
+    import gc
+    import tracemalloc
+
+    from indices import ESCALAS, SPEIMultiescala
+
+    def construir(n):
+        gerador = np.random.default_rng(1)
+        tabelas = {}
+        for escala in ESCALAS:
+            tabela = gerador.standard_normal((locais, n))
+            tabela[:, :escala - 1] = np.nan
+            tabelas[escala] = tabela
+        parametros = {escala: np.ones((locais, 12, 3)) for escala in ESCALAS}
+        spei_escalas = SPEIMultiescala.de_tabelas(balancos_sinteticos(locais, n), tabelas, parametros)
+        for escala in ESCALAS:
+            for local in spei_escalas.locais:
+                spei_escalas.eventos(escala, local)
+        return spei_escalas
+
+    for n in tamanhos:
+        gc.collect()
+        tracemalloc.start()
+        spei_escalas = construir(n)
+        gc.collect()
+        retida = tracemalloc.get_traced_memory()[0] - spei_escalas.balancos.memory_usage(deep=True).sum()
+        tracemalloc.stop()
+        por_serie = retida / (locais * len(ESCALAS))
+        print(f'memória n={n:>6} meses: {por_serie / 1024:8.1f} KiB por local-escala ({por_serie / n:6.1f} B/mês)')
+        del spei_escalas
+
+
+# Recortes por ano de séries diárias de `anos` anos: máscaras booleanas sobre index.year a cada pedido (como o
+# antigo filtrar_por_ano, e uma máscara por ano no boxplot) contra o índice de anos, montado uma vez, com uma
+# busca binária por intervalo e fatias contíguas por ano, conferindo que dão os mesmos pontos
+def bench_indice_anos(anos=(100,)):
+    from indice_anos import IndiceAnos
+
+    for total in anos:
+        datas = pd.date_range('1925-01-01', f'{1925 + total - 1}-12-31', freq='D', unit='s', name='data')
+        serie = pd.Series(np.random.default_rng(0).standard_normal(len(datas)), index=datas)
+        indice = IndiceAnos.de_datas(serie.index)
+        ano_final = int(indice.anos[-1])
+        ano_inicial = ano_final - 9
+
+        def mascara_intervalo():
+            return serie[(serie.index.year >= ano_inicial) & (serie.index.year <= ano_final)]
+
+        def mascaras_anuais():
+            return [serie[serie.index.year == ano] for ano in range(ano_inicial, ano_final + 1)]
+
+        def fatia_intervalo():
+            return serie.iloc[indice.posicoes(ano_inicial, ano_final)]
+
+        def fatias_anuais():
+            return [serie.iloc[trecho] for _, trecho in indice.trechos(ano_inicial, ano_final)]
+
+        if not mascara_intervalo().equals(fatia_intervalo()) or \
+                not all(a.equals(b) for a, b in zip(mascaras_anuais(), fatias_anuais())):
+            raise SystemExit(f'índice de anos ({total} anos): as fatias e as máscaras divergem')
+
+        t_indice = cronometrar(lambda: IndiceAnos.de_datas(serie.index))
+        t_mascara = cronometrar(mascara_intervalo, numero=20)
+        t_fatia = cronometrar(fatia_intervalo, numero=20)
+        t_mascaras = cronometrar(mascaras_anuais, numero=5)
+        t_fatias = cronometrar(fatias_anuais, numero=5)
+        print(f'índice de anos ({total} anos, {len(serie)} dias): montagem {t_indice * 1e3:7.3f} ms')
+        print(f'  intervalo de 10 anos: máscara {t_mascara * 1e6:9.1f} µs | fatia {t_fatia * 1e6:8.1f} µs | '
+              f'{t_mascara / t_fatia:6.1f}x')
+        print(f'  10 grupos anuais:     máscaras {t_mascaras * 1e6:8.1f} µs | fatias {t_fatias * 1e6:7.1f} µs | '
+              f'{t_mascaras / t_fatias:6.1f}x')
+
+
+# Estatísticas de um período recalculadas com o pandas a partir da série inteira, como antes do cubo (máscaras
+# em index.year, classificação, value_counts e groupby por mês): o que cada combinação nova custaria sem os
+# agregados anuais
+def _periodo_pandas(serie, ano_inicial, ano_final):
+    filtrada = serie[(serie.index.year >= ano_inicial) & (serie.index.year <= ano_final)].dropna()
+    percentual = classificar_spei(filtrada).value_counts(normalize=True, sort=False) * 100
+    media_mensal = filtrada.groupby(filtrada.index.month).mean()
+    return percentual, media_mensal, filtrada.mean(), filtrada.std()
+
+
+# Comparação de períodos: tempo por combinação de dois períodos sorteados respondida pelos agregados anuais do
+# cubo, contra o recálculo com o pandas, em séries com estes `tamanhos` (meses). O tempo por combinação não
+# depende de quantas combinações já foram pedidas (nada é guardado entre elas).
+def bench_comparacao(combinacoes=(10, 100, 1000), tamanhos=(504, 5040)):
+    from agregados import CuboAgregado
+
+    for n in tamanhos:
+        serie_pandas = serie_sintetica(n)
+        cubo = CuboAgregado(SerieMensal.de_serie(serie_pandas))
+        primeiro, ultimo = int(cubo.anos[0]), int(cubo.anos[-1])
+        gerador = np.random.default_rng(0)
+        for quantidade in combinacoes:
+            periodos = np.sort(gerador.integers(primeiro, ultimo + 1, size=(quantidade, 2, 2)), axis=2).tolist()
+
+            def pelo_cubo():
+                for periodo in periodos:
+                    for ano_inicial, ano_final in periodo:
+                        cubo.percentual_periodo(ano_inicial, ano_final)
+                        cubo.media_mensal(ano_inicial, ano_final)
+                        cubo.resumo(ano_inicial, ano_final)
+
+            def pelo_pandas():
+                for periodo in periodos:
+                    for ano_inicial, ano_final in periodo:
+                        _periodo_pandas(serie_pandas, ano_inicial, ano_final)
+
+            ano_inicial, ano_final = periodos[0][0]
+            percentual, media_mensal, _, desvio = _periodo_pandas(serie_pandas, ano_inicial, ano_final)
+            if not (np.allclose(percentual.to_numpy(), cubo.percentual_periodo(ano_inicial, ano_final), atol=1e-4)
+                    and np.allclose(media_mensal.to_numpy(), cubo.media_mensal(ano_inicial, ano_final), atol=1e-5)
+                    and np.isclose(desvio, cubo.resumo(ano_inicial, ano_final)['desvio'], atol=1e-5)):
+                raise SystemExit(f'comparação n={n}: os agregados e o pandas divergem')
+
+            t_cubo = cronometrar(pelo_cubo, numero=1, repeticoes=3) / quantidade
+            t_pandas = cronometrar(pelo_pandas, numero=1, repeticoes=3) / quantidade
+            print(f'comparação n={n:>6} meses, {quantidade:5d} combinações: agregados {t_cubo * 1e6:8.1f} µs | '
+                  f'pandas {t_pandas * 1e6:9.1f} µs por combinação | {t_pandas / t_cubo:5.1f}x')
+
+
+# Falha (código de saída 1) se a visão 'Todos os anos' passar do orçamento de bytes
+def verificar_orcamento():
+    import app
+
+    todos = app.atualizar_ano_dropdown('all')[1]
+    total = bench_payload()[todos]
+    print(f'orçamento {todos}: {total} B de {ORCAMENTO_PAYLOAD_TODOS} B')
+    if total > ORCAMENTO_PAYLOAD_TODOS:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmarks do dashboard SPEI')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[504, 5040, 50400])
+    parser.add_argument('--payload', action='store_true', help='mede os bytes das respostas dos callbacks')
+    parser.add_argument('--series', type=int, default=0,
+                        help='mede o SPEI em lote de N séries sintéticas por número de processos (ex.: 1000)')
+    parser.add_argument('--processos', type=int, nargs='+',
+                        help='com --series, números de processos medidos (padrão: potências de 2 até os núcleos)')
+    parser.add_argument('--inicializacao', action='store_true',
+                        help='mede o tempo do import até a primeira resposta, com e sem a carga adiada')
+    parser.add_argument('--frio', action='store_true', help='com --inicializacao, parte do cache das planilhas vazio')
+    parser.add_argument('--gunicorn', type=int, nargs='*',
+                        help='mede memória e tempo de subida do gunicorn com estes números de workers (padrão 1 2 4)')
+    parser.add_argument('--suite', metavar='SAIDA.json', help='roda a suíte completa e grava os tempos em JSON')
+    parser.add_argument('--fatores', type=int, nargs='+', default=[10, 100, 1000],
+                        help='com --suite, fatores de escala das séries sintéticas')
+    parser.add_argument('--ajuste-maximo', type=int, default=100,
+                        help='com --suite, maior número de locais sintéticos no ajuste em lote')
+    parser.add_argument('--comparar', nargs=2, metavar=('ANTIGO.json', 'NOVO.json'),
+                        help='compara dois resultados da suíte')
+    parser.add_argument('--sessao', action='store_true',
+                        help='mede os bytes transferidos por sessão, com e sem compressão e cache HTTP')
+    parser.add_argument('--eventos', type=int, nargs='*',
+                        help='mede a detecção dos eventos de seca em séries destes tamanhos (padrão 504 50400 504000)')
+    parser.add_argument('--memoria', type=int, nargs='*',
+                        help='mede a memória retida por local-escala em séries destes tamanhos (padrão 504 5040)')
+    parser.add_argument('--indice-anos', type=int, nargs='*',
+                        help='mede os recortes por ano em séries diárias com estes números de anos (padrão 100)')
+    parser.add_argument('--comparacao', type=int, nargs='*',
+                        help='mede a comparação de períodos com estes números de combinações (padrão 10 100 1000)')
+    parser.add_argument('--orcamento', action='store_true', help='verifica o orçamento de bytes da visão com todos os anos')
+    args = parser.parse_args()
+
+    if args.suite:
+        executar_suite(args.suite, args.fatores, ajuste_maximo=args.ajuste_maximo)
+    elif args.comparar:
+        raise SystemExit(1 if comparar_suites(*args.comparar) else 0)
+    elif args.orcamento:
+        verificar_orcamento()
+    elif args.comparacao is not None:
+        bench_comparacao(tuple(args.comparacao) or (10, 100, 1000))
+    elif args.indice_anos is not None:
+        bench_indice_anos(tuple(args.indice_anos) or (100,))
+    elif args.memoria is not None:
+        bench_memoria(tamanhos=tuple(args.memoria) or (504, 5040))
+    elif args.sessao:
+        bench_sessao()
+    elif args.eventos is not None:
+        bench_eventos(args.eventos or [504, 50400, 504000])
+    elif args.gunicorn is not None:
+        bench_gunicorn(tuple(args.gunicorn) or (1, 2, 4))
+    elif args.inicializacao:
+        bench_inicializacao(args.frio)
+    elif args.series:
+        bench_agendador(args.series, contagens=args.processos)
+    else:
+        bench_classificacao(args.tamanhos)
+        if args.payload:
+            bench_payload()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import plotly.utils
+
+from ingestao import gravar_atomico, hash_arquivo
+from metricas import metricas
+
+
+# Identificador do código que gera as figuras: muda quando qualquer um dos arquivos muda
+def versao_codigo(*arquivos):
+    h = hashlib.sha256()
+    for arquivo in arquivos:
+        h.update(hash_arquivo(arquivo).encode())
+    return h.hexdigest()[:8]
+
+
+# Cache LRU das figuras dos callbacks, com uma camada em memória por worker e uma camada em disco
+# compartilhada entre os workers do gunicorn. A chave inclui a versão dos dados: quando as planilhas
+# mudam, as entradas antigas deixam de ser encontradas e acabam removidas pelo LRU. Pedidos simultâneos da
+# mesma figura (vários usuários na mesma seleção) esperam a construção em andamento em vez de repeti-la.
+class CacheFiguras:
+    def __init__(self, versao, tamanho_maximo=128, diretorio=None):
+        self.versao = versao
+        self.tamanho_maximo = tamanho_maximo
+        self.diretorio = diretorio or None
+        self.acertos = 0
+        self.falhas = 0
+        self._memoria = OrderedDict()
+        self._construindo = {}
+        self._trava = threading.Lock()
+
+        if self.diretorio:
+            try:
+                os.makedirs(self.diretorio, exist_ok=True)
+            except OSError:
+                self.diretorio = None
+
+    def _hash(self, chave):
+        return hashlib.sha1(json.dumps([self.versao, chave], sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _arquivo(self, hash_chave):
+        return os.path.join(self.diretorio, hash_chave + '.json')
+
+    def _ler_disco(self, hash_chave):
+        if not self.diretorio:
+            return None
+        arquivo = self._arquivo(hash_chave)
+        try:
+            with open(arquivo, encoding='utf-8') as f:
+                valor = json.load(f)
+            os.utime(arquivo)  # Marca como usado recentemente para o LRU do disco
+        except (OSError, ValueError):
+            return None
+        return valor
+
+    def _gravar_disco(self, hash_chave, texto):
+        if not self.diretorio:
+            return
+        try:
+            gravar_atomico(self._arquivo(hash_chave), lambda f: f.write(texto.encode('utf-8')))
+            arquivos = [os.path.join(self.diretorio, nome) for nome in os.listdir(self.diretorio) if nome.endswith('.json')]
+            if len(arquivos) > self.tamanho_maximo:
+                arquivos.sort(key=lambda arquivo: os.stat(arquivo).st_mtime_ns)
+                for arquivo in arquivos[:len(arquivos) - self.tamanho_maximo]:
+                    os.remove(arquivo)
+        except OSError:
+            # Outro worker pode ter removido o arquivo no meio da varredura; o cache continua válido
+            pass
+
+    def _guardar_memoria(self, hash_chave, valor):
+        with self._trava:
+            self._memoria[hash_chave] = valor
+            self._memoria.move_to_end(hash_chave)
+            while len(self._memoria) > self.tamanho_maximo:
+                self._memoria.popitem(last=False)
+
+    # Devolve as figuras da chave, construindo-as com `construir()` apenas quando não estão em cache
+    def obter(self, chave, construir):
+        hash_chave = self._hash(chave)
+        with self._trava:
+            valor = self._memoria.get(hash_chave)
+            if valor is not None:
+                self._memoria.move_to_end(hash_chave)
+                self.acertos += 1
+                return valor
+
+        valor = self._ler_disco(hash_chave)
+        if valor is not None:
+            with self._trava:
+                self.acertos += 1
+            self._guardar_memoria(hash_chave, valor)
+            return valor
+
+        with self._trava:
+            em_andamento = self._construindo.get(hash_chave)
+            if em_andamento is None:
+                self._construindo[hash_chave] = threading.Event()
+        if em_andamento is not None:
+            em_andamento.wait()
+            with self._trava:
+                valor = self._memoria.get(hash_chave)
+                if valor is not None:
+                    self.acertos += 1
+                    return valor
+            return self.obter(chave, construir)  # A construção falhou: tenta de novo
+
+        try:
+            with self._trava:
+                self.falhas += 1
+            valor = construir()
+            with metricas.medir('serializacao'):
+                texto = json.dumps(valor, cls=plotly.utils.PlotlyJSONEncoder)
+                valor = json.loads(texto)
+            self._gravar_disco(hash_chave, texto)
+            self._guardar_memoria(hash_chave, valor)
+            return valor
+        finally:
+            with self._trava:
+                self._construindo.pop(hash_chave).set()
+
+    def limpar(self):
+        with self._trava:
+            self._memoria.clear()
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            'acertos': self.acertos,
+            'falhas': self.falhas,
+            'taxa_acertos': self.acertos / total if total else 0.0,
+            'entradas_memoria': len(self._memoria),
+            'diretorio': self.diretorio,
+            'versao': self.versao,
+        }
@@ -0,0 +1,148 @@
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # Brotli é opcional: sem o pacote, só gzip
+    brotli = None
+
+# Tipos de conteúdo que valem a pena comprimir (imagens e fontes já vêm comprimidas)
+TIPOS_COMPRIMIVEIS = (
+    'text/', 'application/json', 'application/javascript', 'application/x-javascript', 'image/svg+xml',
+)
+
+# Respostas menores que isso vão sem compressão (o cabeçalho do gzip não compensa)
+TAMANHO_MINIMO = 500
+
+# Cabeçalho dos recursos estáticos versionados: a URL muda a cada versão, então nunca precisam ser revalidados
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+# Rotas GET revalidadas por ETag a cada visita: as do Dash, cujo corpo só muda com o código ou com os dados, a
+# API e as estatísticas do cache de figuras. Os callbacks (POST /_dash-update-component) ficam de fora.
+ROTAS_REVALIDADAS = ('/', '/_dash-layout', '/_dash-dependencies', '/cache-figuras')
+PREFIXOS_REVALIDADOS = ('/api/',)
+
+
+# Se o cliente aceita a codificação (Accept-Encoding)
+def _aceita(codificacao):
+    return request.accept_encodings[codificacao] > 0
+
+
+# Codificação escolhida para a requisição: brotli (se instalado e aceito), gzip ou nenhuma
+def codificacao_preferida():
+    if brotli is not None and _aceita('br'):
+        return 'br'
+    if _aceita('gzip'):
+        return 'gzip'
+    return None
+
+
+# Comprime o corpo na codificação pedida (mtime=0: o mesmo corpo dá sempre os mesmos bytes)
+def comprimir(dados, codificacao, nivel=6):
+    if codificacao == 'br':
+        return brotli.compress(dados, quality=min(nivel + 3, 11))
+    return gzip.compress(dados, compresslevel=nivel, mtime=0)
+
+
+# Recursos estáticos versionados (bundles do Dash e /assets com ?m=) já comprimidos, para não repetir
+# a compressão dos arquivos grandes a cada visitante
+class CacheComprimidos:
+    def __init__(self, tamanho_maximo=64):
+        self.tamanho_maximo = tamanho_maximo
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, comprimir_dados):
+        with self._trava:
+            if chave in self._entradas:
+                self._entradas.move_to_end(chave)
+                return self._entradas[chave]
+        dados = comprimir_dados()
+        with self._trava:
+            self._entradas[chave] = dados
+            while len(self._entradas) > self.tamanho_maximo:
+                self._entradas.popitem(last=False)
+        return dados
+
+
+# Bundles do Dash com fingerprint, o favicon com ?v= e arquivos de /assets com ?m= (data de modificação)
+def _estatico_versionado(resposta):
+    if request.path.startswith('/_dash-component-suites/'):
+        return resposta.cache_control.max_age is not None  # Dash só define max-age nos arquivos com fingerprint
+    if request.path == '/_favicon.ico':
+        return 'v' in request.args
+    return request.path.startswith('/assets/') and 'm' in request.args
+
+
+# ETag fraco do corpo sem compressão: vale para as versões gzip, brotli e sem compressão, que têm o mesmo conteúdo
+def _etag_fraco(resposta):
+    resposta.add_etag()
+    resposta.set_etag(resposta.get_etag()[0], weak=True)
+
+
+# Respostas 200 a GET das rotas revalidadas com o corpo já pronto e sem ETag próprio (a exportação, gerada em
+# blocos, traz o da versão dos dados)
+def _revalidavel(resposta):
+    return (request.method in ('GET', 'HEAD')
+            and resposta.status_code == 200
+            and (request.path in ROTAS_REVALIDADAS or request.path.startswith(PREFIXOS_REVALIDADOS))
+            and (resposta.direct_passthrough or not resposta.is_streamed)
+            and resposta.get_etag()[0] is None)
+
+
+# Respostas textuais, ainda sem compressão, com o corpo já pronto ou vindo de um arquivo (/assets)
+def _comprimivel(resposta):
+    return (resposta.status_code == 200
+            and (resposta.direct_passthrough or not resposta.is_streamed)
+            and 'Content-Encoding' not in resposta.headers
+            and (resposta.mimetype or '').startswith(TIPOS_COMPRIMIVEIS))
+
+
+# Camada HTTP do servidor: cache imutável dos estáticos versionados, ETag (e 304) nas rotas GET revalidadas
+# (HTML, layout, dependências e API) e compressão gzip/brotli de tudo que for texto, inclusive as respostas dos
+# callbacks. As respostas em streaming (exportação) seguem sem compressão.
+def registrar_camada_http(servidor, nivel=6):
+    comprimidos = CacheComprimidos()
+
+    @servidor.after_request
+    def camada_http(resposta):
+        if request.method not in ('GET', 'HEAD', 'POST'):
+            return resposta
+
+        imutavel = _estatico_versionado(resposta)
+        if imutavel:
+            resposta.headers['Cache-Control'] = CACHE_IMUTAVEL
+        elif _revalidavel(resposta):
+            resposta.direct_passthrough = False
+            _etag_fraco(resposta)
+            resposta.headers['Cache-Control'] = 'no-cache'
+            resposta.make_conditional(request)
+
+        if not _comprimivel(resposta):
+            return resposta
+        resposta.vary.add('Accept-Encoding')
+        codificacao = codificacao_preferida() if nivel > 0 else None
+        if codificacao is None:
+            return resposta
+
+        resposta.direct_passthrough = False
+        dados = resposta.get_data()
+        if len(dados) < TAMANHO_MINIMO:
+            return resposta
+        if imutavel:
+            chave = (request.full_path, codificacao)
+            comprimido = comprimidos.obter(chave, lambda: comprimir(dados, codificacao, nivel))
+        else:
+            comprimido = comprimir(dados, codificacao, nivel)
+
+        resposta.set_data(comprimido)
+        resposta.headers['Content-Encoding'] = codificacao
+        etag, fraco = resposta.get_etag()
+        if etag and not fraco:
+            resposta.set_etag(etag, weak=True)  # ETag do arquivo (/assets): a versão comprimida tem o mesmo conteúdo
+        return resposta
+
+    return camada_http
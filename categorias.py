@@ -0,0 +1,33 @@
+import numpy as np
+
+# Categorias do SPEI da mais seca para a mais úmida; LIMIARES[i] é o limite inferior de CATEGORIAS[i + 1]
+CATEGORIAS = (
+    'Seca extrema',
+    'Seca severa',
+    'Seca moderada',
+    'Seca fraca',
+    'Umidade fraca',
+    'Umidade moderada',
+    'Umidade severa',
+    'Umidade extrema',
+)
+LIMIARES = (-2.00, -1.50, -1.00, 0.00, 1.00, 1.50, 2.00)
+
+CORES_CATEGORIAS = {
+    'Umidade extrema': '#1e3a8a',
+    'Umidade severa': '#1d4ed8',
+    'Umidade moderada': '#0ea5e9',
+    'Umidade fraca': '#93c5fd',
+    'Seca fraca': '#fca5a5',
+    'Seca moderada': '#ef4444',
+    'Seca severa': '#b91c1c',
+    'Seca extrema': '#7f1d1d',
+}
+
+
+# Códigos (posição em CATEGORIAS) de um array de SPEI; -1 para valores ausentes
+def codificar_spei(valores):
+    valores = np.asarray(valores, dtype='float64')
+    codigos = np.digitize(valores, LIMIARES).astype('int8')
+    codigos[np.isnan(valores)] = -1
+    return codigos
@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from indices import SPEIMultiescala
+from ingestao import gravar_atomico
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos (use o preload do gunicorn)
+    fcntl = None
+
+
+# Os subdiretórios das versões levam o prefixo PREFIXO_VERSAO: a limpeza das versões antigas só remove esses,
+# e o que mais houver no diretório (ex.: um DIRETORIO_COMPARTILHADO apontado para /dev/shm) fica intacto.
+PREFIXO_VERSAO = 'spei-versao-'
+
+
+# Conjunto de dados publicado em disco (de preferência em /dev/shm) para ser mapeado por vários processos.
+# Cada versão fica em um subdiretório com o eixo de tempo, o balanço hídrico e, por escala, o SPEI (float32),
+# os códigos das categorias (int8) e os parâmetros das distribuições, todos em .npy (local × tempo, linhas
+# contíguas), no mesmo formato das séries compactas (serie_mensal.SerieMensal), que passam a ser views
+# deles. Os workers abrem os arquivos com mmap somente leitura: as páginas ficam uma única vez na memória,
+# qualquer que seja o número de workers, e anexar-se a uma versão pronta leva milissegundos.
+def _diretorio_versao(diretorio, versao):
+    return os.path.join(diretorio, PREFIXO_VERSAO + versao)
+
+
+# Grava todas as escalas de `spei_escalas` na versão pedida; o meta.json é gravado por último e marca
+# a versão como completa. Versões antigas (com PREFIXO_VERSAO) são removidas (processos que ainda as mapeiam
+# não são afetados).
+def publicar(spei_escalas, diretorio, versao):
+    destino = _diretorio_versao(diretorio, versao)
+    os.makedirs(destino, exist_ok=True)
+    spei_escalas.calcular()
+
+    indice = spei_escalas.balancos.index
+    gravar_atomico(os.path.join(destino, 'datas.npy'),
+                   lambda f: np.save(f, indice.to_numpy(dtype='datetime64[ns]')))
+    gravar_atomico(os.path.join(destino, 'balancos.npy'),
+                   lambda f: np.save(f, np.ascontiguousarray(spei_escalas.balancos.to_numpy(dtype='float64').T)))
+    for escala in spei_escalas.escalas:
+        tabela = np.full((len(spei_escalas.locais), len(indice)), np.nan, dtype='float32')
+        codigos = np.full(tabela.shape, -1, dtype='int8')
+        for j, local in enumerate(spei_escalas.locais):
+            serie = spei_escalas.serie(escala, local)
+            inicio = int((serie.inicio - spei_escalas.inicio).astype('int64'))
+            tabela[j, inicio:inicio + len(serie)] = serie.valores
+            codigos[j, inicio:inicio + len(serie)] = serie.codigos
+        gravar_atomico(os.path.join(destino, f'spei-{escala}.npy'), lambda f: np.save(f, tabela))
+        gravar_atomico(os.path.join(destino, f'codigos-{escala}.npy'), lambda f: np.save(f, codigos))
+        gravar_atomico(os.path.join(destino, f'parametros-{escala}.npy'),
+                       lambda f: np.save(f, spei_escalas.parametros(escala)))
+    gravar_atomico(os.path.join(destino, 'meta.json'), lambda f: f.write(json.dumps({
+        'locais': list(spei_escalas.locais),
+        'escalas': list(spei_escalas.escalas),
+    }).encode('utf-8')))
+
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        if nome.startswith(PREFIXO_VERSAO) and caminho != destino and os.path.isdir(caminho):
+            shutil.rmtree(caminho, ignore_errors=True)
+
+
+# SPEIMultiescala sobre os arrays mapeados de uma versão publicada, ou None se ela não existe (ou está incompleta)
+def anexar(diretorio, versao, **opcoes):
+    origem = _diretorio_versao(diretorio, versao)
+    try:
+        with open(os.path.join(origem, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        datas = np.load(os.path.join(origem, 'datas.npy'), mmap_mode='r')
+        balancos = np.load(os.path.join(origem, 'balancos.npy'), mmap_mode='r')
+        tabelas = {escala: np.load(os.path.join(origem, f'spei-{escala}.npy'), mmap_mode='r') for escala in meta['escalas']}
+        codigos = {escala: np.load(os.path.join(origem, f'codigos-{escala}.npy'), mmap_mode='r')
+                   for escala in meta['escalas']}
+        parametros = {escala: np.load(os.path.join(origem, f'parametros-{escala}.npy')) for escala in meta['escalas']}
+    except (OSError, ValueError, KeyError):
+        return None
+
+    balancos = pd.DataFrame(balancos.T, index=pd.DatetimeIndex(datas, name='data'), columns=meta['locais'])
+    return SPEIMultiescala.de_tabelas(balancos, tabelas, parametros, codigos, **opcoes)
+
+
+# Anexa-se à versão publicada ou, se ela ainda não existe, calcula com `calcular()` e publica. Uma trava
+# de arquivo garante que, com vários workers subindo juntos, apenas um faça o cálculo.
+def carregar_ou_publicar(diretorio, versao, calcular, **opcoes):
+    spei_escalas = anexar(diretorio, versao, **opcoes)
+    if spei_escalas is not None:
+        return spei_escalas
+
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, '.trava'), 'w') as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        spei_escalas = anexar(diretorio, versao, **opcoes)
+        if spei_escalas is None:
+            publicar(calcular(), diretorio, versao)
+            spei_escalas = anexar(diretorio, versao, **opcoes)
+    return spei_escalas
@@ -0,0 +1,81 @@
+import os
+
+# Diretório base do projeto (os caminhos relativos não dependem do diretório de execução)
+DIRETORIO_BASE = os.path.dirname(os.path.abspath(__file__))
+
+# Diretório do cache binário das planilhas do TerraClimate (em hosts somente leitura, apontar para /tmp)
+DIRETORIO_CACHE = os.environ.get('SPEI_DIRETORIO_CACHE', os.path.join(DIRETORIO_BASE, 'dados', '.cache'))
+
+# Escalas do SPEI (em meses) calculadas já na inicialização; as demais são calculadas no primeiro uso
+ESCALAS_INICIAIS = tuple(int(e) for e in os.environ.get('SPEI_ESCALAS_INICIAIS', '1').split(',') if e.strip())
+
+# Cache de figuras: diretório compartilhado entre os workers (vazio = somente memória) e número máximo de entradas
+DIRETORIO_CACHE_FIGURAS = os.environ.get('SPEI_DIRETORIO_CACHE_FIGURAS', os.path.join(DIRETORIO_CACHE, 'figuras'))
+TAMANHO_CACHE_FIGURAS = int(os.environ.get('SPEI_TAMANHO_CACHE_FIGURAS', '128'))
+
+# Modo cliente: a série é enviada uma única vez à página e o filtro por anos e as figuras rodam no navegador
+MODO_CLIENTE = os.environ.get('SPEI_MODO_CLIENTE', '0').lower() in ('1', 'true', 'sim')
+
+# Registro dos locais (municípios/pontos de grade) e número de processos para os ajustes do SPEI
+# (1 = em série; 0 = um processo por núcleo)
+ARQUIVO_LOCAIS = os.environ.get('SPEI_ARQUIVO_LOCAIS', os.path.join(DIRETORIO_BASE, 'dados', 'locais.json'))
+PROCESSOS = int(os.environ.get('SPEI_PROCESSOS', '1'))
+
+# Calibração do SPEI: período fixo 'AAAA-AAAA' em que as distribuições são ajustadas (vazio = série inteira)
+# e quantos meses anexados disparam o reajuste das distribuições quando não há calibração fixa (0 = nunca)
+CALIBRACAO = tuple(int(ano) for ano in os.environ['SPEI_CALIBRACAO'].split('-')) if os.environ.get('SPEI_CALIBRACAO') else None
+REAJUSTE_MESES = int(os.environ.get('SPEI_REAJUSTE_MESES', '12'))
+
+# Intervalo (s) entre as verificações de planilhas novas com o servidor em execução (0 = desligado)
+INTERVALO_ATUALIZACAO = float(os.environ.get('SPEI_INTERVALO_ATUALIZACAO', '0'))
+# A verificação é iniciada pelo post_fork de cada worker (gunicorn.conf.py), não no import do app: com o
+# preload, o import roda no master do gunicorn
+VERIFICACAO_POST_FORK = os.environ.get('SPEI_VERIFICACAO_POST_FORK', '0').lower() in ('1', 'true', 'sim')
+
+# Rota POST /atualizar-dados: segredo compartilhado esperado no cabeçalho X-Token-Atualizacao (vazio = rota
+# desligada) e intervalo mínimo (s) entre duas atualizações aceitas
+TOKEN_ATUALIZACAO = os.environ.get('SPEI_TOKEN_ATUALIZACAO', '')
+INTERVALO_MINIMO_ATUALIZACAO = float(os.environ.get('SPEI_INTERVALO_MINIMO_ATUALIZACAO', '60'))
+
+# Carga adiada: o servidor sobe sem os dados, que são carregados por uma thread de aquecimento (ou pelo
+# primeiro callback); com '0' tudo é carregado durante o import
+CARGA_ADIADA = os.environ.get('SPEI_CARGA_ADIADA', '1').lower() in ('1', 'true', 'sim')
+
+# Memória compartilhada: o SPEI de todas as escalas é calculado uma única vez (no master do gunicorn, com
+# preload_app, ou pelo primeiro worker) e publicado em arquivos .npy que os workers mapeiam somente leitura
+MEMORIA_COMPARTILHADA = os.environ.get('SPEI_MEMORIA_COMPARTILHADA', '0').lower() in ('1', 'true', 'sim')
+DIRETORIO_COMPARTILHADO = os.environ.get(
+    'SPEI_DIRETORIO_COMPARTILHADO',
+    '/dev/shm/dashboard-spei' if os.path.isdir('/dev/shm') else os.path.join(DIRETORIO_CACHE, 'compartilhado'),
+)
+
+# Diretório para um perfil do cProfile (.prof) por requisição de callback (vazio = desligado)
+DIRETORIO_PERFIL = os.environ.get('SPEI_DIRETORIO_PERFIL', '')
+
+# Nível da compressão gzip/brotli das respostas HTTP (0 = sem compressão; o cache dos estáticos e os ETags continuam)
+NIVEL_COMPRESSAO = int(os.environ.get('SPEI_NIVEL_COMPRESSAO', '6'))
+
+# Eventos de seca: categoria limite (ela e as mais secas contam como seca), maior interrupção (meses) unida ao
+# evento e duração mínima (meses)
+CRITERIOS_EVENTOS = {
+    'categoria_limite': os.environ.get('SPEI_EVENTOS_CATEGORIA', 'Seca moderada'),
+    'intervalo_maximo': int(os.environ.get('SPEI_EVENTOS_INTERVALO', '1')),
+    'duracao_minima': int(os.environ.get('SPEI_EVENTOS_DURACAO_MINIMA', '1')),
+}
+
+# Número de processos que atendem às requisições (o gunicorn.conf.py informa o seu `workers`; fora dele vale o
+# WEB_CONCURRENCY, que o gunicorn também lê)
+WORKERS = int(os.environ.get('SPEI_WORKERS', os.environ.get('WEB_CONCURRENCY', '1')))
+
+# Threads dos callbacks em segundo plano (cálculo de uma escala nova do SPEI fora da requisição; 0 = desligado).
+# As tarefas ficam na memória do processo que as recebeu e o navegador consulta o resultado em outra requisição,
+# que pode cair em outro worker: o modo exige um único worker. Sem SPEI_TAREFAS_SEGUNDO_PLANO ele fica ligado
+# (2 threads) com um worker e desligado com mais, como nos 2 workers do Procfile (WEB_CONCURRENCY=1 o liga);
+# pedido explicitamente com mais de um worker, o app não sobe.
+TAREFAS_SEGUNDO_PLANO = int(os.environ.get('SPEI_TAREFAS_SEGUNDO_PLANO', '2' if WORKERS <= 1 else '0'))
+
+# Modo estático (gerado por snapshot.py): a página roda só com arquivos estáticos (ex.: em uma CDN), com as figuras
+# de todas as seleções pré-calculadas em JSON; o servidor ao vivo em SERVIDOR_FALLBACK (vazio = nenhum) responde
+# às seleções que não foram pré-calculadas
+MODO_ESTATICO = os.environ.get('SPEI_MODO_ESTATICO', '0').lower() in ('1', 'true', 'sim')
+SERVIDOR_FALLBACK = os.environ.get('SPEI_SERVIDOR_FALLBACK', '').rstrip('/')
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from categorias import CATEGORIAS
+
+# Critérios padrão dos eventos de seca: meses na categoria limite ou mais secos, interrupções de até
+# `intervalo_maximo` meses unidas ao evento anterior e eventos com pelo menos `duracao_minima` meses
+CRITERIOS_PADRAO = {'categoria_limite': 'Seca moderada', 'intervalo_maximo': 1, 'duracao_minima': 1}
+
+COLUNAS = ('inicio', 'fim', 'duracao', 'meses_seca', 'severidade', 'intensidade', 'pico', 'data_pico',
+           'categoria_pico', 'em_curso')
+
+# Card de eventos (servidor e modo cliente): títulos das colunas exibidas e rolagem quando há muitos eventos
+TITULOS = ('Início', 'Fim', 'Duração (meses)', 'Severidade', 'Pico', 'Categoria do pico')
+ESTILO_TABELA = {'maxHeight': '320px', 'overflowY': 'auto'}
+
+
+# Eventos de seca de uma série de SPEI (serie_mensal.SerieMensal), detectados por run-length sobre os códigos
+# das categorias guardados na série (os mesmos limiares de categorizar_spei), sem laço em Python. Sequências
+# de meses secos separadas por até `intervalo_maximo` meses são unidas (pooling). Uma linha por evento, em
+# ordem cronológica:
+# início e fim (último mês), duração em meses (com as interrupções), meses secos, severidade (-soma do SPEI
+# nos meses secos), intensidade (severidade por mês seco), pico (menor SPEI), data e categoria do pico e se o
+# evento continua no último mês da série.
+def detectar_eventos(serie, categoria_limite='Seca moderada', intervalo_maximo=1, duracao_minima=1):
+    valores = serie.valores.astype('float64')
+    codigos = serie.codigos
+    limite = CATEGORIAS.index(categoria_limite)
+    seca = (codigos >= 0) & (codigos <= limite)
+
+    bordas = np.diff(np.concatenate(([0], seca.view(np.int8), [0])))
+    inicios = np.flatnonzero(bordas == 1)
+    fins = np.flatnonzero(bordas == -1)  # exclusivos
+
+    # Pooling: uma interrupção curta não abre um evento novo
+    if len(inicios):
+        novo = np.concatenate(([True], inicios[1:] - fins[:-1] > intervalo_maximo))
+        ultimos = np.concatenate((np.flatnonzero(novo)[1:] - 1, [len(inicios) - 1]))
+        inicios, fins = inicios[novo], fins[ultimos]
+
+    duracao = fins - inicios
+    manter = duracao >= duracao_minima
+    inicios, fins, duracao = inicios[manter], fins[manter], duracao[manter]
+
+    # Somas e mínimos por evento com reduceat sobre os trechos [início, fim) (os trechos entre eventos são
+    # descartados); o pico é o menor SPEI do evento, na sua primeira ocorrência
+    if len(inicios):
+        trechos = np.column_stack((inicios, fins)).ravel()
+        meses_seca = np.add.reduceat(np.append(seca, False).astype(np.int64), trechos)[::2]
+        severidade = -np.add.reduceat(np.append(np.where(seca, valores, 0.0), 0.0), trechos)[::2]
+        pico = np.minimum.reduceat(np.append(np.where(seca, valores, np.inf), np.inf), trechos)[::2]
+
+        candidatos = np.flatnonzero(seca)
+        evento = np.searchsorted(inicios, candidatos, side='right') - 1
+        dentro = (evento >= 0) & (candidatos < fins[np.maximum(evento, 0)])
+        candidatos, evento = candidatos[dentro], evento[dentro]
+        no_pico = valores[candidatos] == pico[evento]
+        _, primeiros = np.unique(evento[no_pico], return_index=True)
+        posicao_pico = candidatos[no_pico][primeiros]
+    else:
+        meses_seca = posicao_pico = np.empty(0, dtype=np.int64)
+        severidade = pico = np.empty(0)
+
+    # Datas calculadas só nas posições usadas, pelo eixo mensal de passo fixo (em segundos: vale para séries
+    # fora do intervalo das datas em nanossegundos)
+    def datas(posicoes):
+        return serie.datas(posicoes).astype('datetime64[s]')
+
+    return pd.DataFrame({
+        'inicio': datas(inicios),
+        'fim': datas(fins - 1),
+        'duracao': duracao,
+        'meses_seca': meses_seca,
+        'severidade': severidade,
+        'intensidade': severidade / np.maximum(meses_seca, 1),
+        'pico': pico,
+        'data_pico': datas(posicao_pico),
+        'categoria_pico': pd.Categorical.from_codes(codigos[posicao_pico], categories=CATEGORIAS, ordered=True),
+        'em_curso': fins == len(valores),
+    }, columns=COLUNAS)
+
+
+# Eventos que tocam o intervalo de anos (fatia contígua da tabela, achada por busca binária: fins e inícios
+# são crescentes, pois os eventos não se sobrepõem)
+def eventos_intervalo(eventos, ano_inicial, ano_final):
+    primeiro = np.searchsorted(eventos['fim'].to_numpy(), np.datetime64(f'{ano_inicial}-01-01'), side='left')
+    ultimo = np.searchsorted(eventos['inicio'].to_numpy(), np.datetime64(f'{ano_final + 1}-01-01'), side='left')
+    return eventos.iloc[primeiro:ultimo]
+
+
+# Resumo de uma tabela de eventos: quantidade, meses secos e os eventos mais longo e mais severo
+def resumo_eventos(eventos):
+    if eventos.empty:
+        return {'quantidade': 0, 'meses_seca': 0, 'mais_longo': None, 'mais_severo': None}
+    return {
+        'quantidade': len(eventos),
+        'meses_seca': int(eventos['meses_seca'].sum()),
+        'mais_longo': eventos.iloc[int(eventos['duracao'].to_numpy().argmax())],
+        'mais_severo': eventos.iloc[int(eventos['severidade'].to_numpy().argmax())],
+    }
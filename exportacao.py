@@ -0,0 +1,177 @@
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+
+from eventos import eventos_intervalo
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional: sem o pyarrow, só CSV e JSON
+    pa = pq = None
+
+# Tipo de conteúdo de cada formato de exportação
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Linhas convertidas por vez: a resposta é gerada bloco a bloco, sem montar o arquivo inteiro na memória
+LINHAS_POR_BLOCO = 5000
+
+
+# Fatias das posições de um eixo indexado por ano (indice_anos.IndiceAnos) no intervalo, cada uma com anos
+# inteiros e até LINHAS_POR_BLOCO linhas; uma fatia vazia quando o intervalo não tem nenhum ano
+def _fatias_anuais(indice, ano_inicial, ano_final):
+    inicio = fim = None
+    for _, trecho in indice.trechos(ano_inicial, ano_final):
+        if inicio is not None and trecho.stop - inicio > LINHAS_POR_BLOCO:
+            yield slice(inicio, fim)
+            inicio = None
+        inicio = trecho.start if inicio is None else inicio
+        fim = trecho.stop
+    yield slice(0, 0) if inicio is None else slice(inicio, fim)
+
+
+# Série do SPEI no intervalo com a categoria de cada mês (as mesmas de categorizar_spei), em blocos de anos
+# inteiros montados das views da série compacta: só um bloco por vez vira DataFrame
+def tabela_serie(spei_escalas, escala, local, ano_inicial, ano_final):
+    cubo = spei_escalas.cubo(escala, local)
+    for fatia in _fatias_anuais(cubo.indice, ano_inicial, ano_final):
+        serie = cubo.serie[fatia]
+        yield pd.DataFrame({
+            'data': serie.datas().astype('datetime64[s]'),
+            'spei': serie.valores.astype('float64'),
+            'categoria': serie.categorias(),
+        })
+
+
+# Porcentagem de meses em cada categoria por ano, como no gráfico de barras empilhadas, em blocos de até
+# LINHAS_POR_BLOCO anos lidos das contagens anuais
+def tabela_percentuais(spei_escalas, escala, local, ano_inicial, ano_final):
+    cubo = spei_escalas.cubo(escala, local)
+    anos = cubo.anos_intervalo(ano_inicial, ano_final)
+    for inicio in range(0, max(len(anos), 1), LINHAS_POR_BLOCO):
+        bloco = anos[inicio:inicio + LINHAS_POR_BLOCO]
+        limites = (bloco[0], bloco[-1]) if len(bloco) else (ano_inicial, ano_final)
+        yield cubo.percentual_categorias(*limites).rename_axis('ano').reset_index()
+
+
+# Eventos de seca que tocam o intervalo, lidos da tabela já calculada da série
+def tabela_eventos(spei_escalas, escala, local, ano_inicial, ano_final):
+    yield from _blocos(eventos_intervalo(spei_escalas.eventos(escala, local), ano_inicial, ano_final).reset_index(drop=True))
+
+
+# Tabelas exportáveis pela API: geradores de blocos (DataFrames com as mesmas colunas; sempre ao menos um,
+# vazio quando o intervalo não tem linhas)
+TABELAS = {
+    'serie': tabela_serie,
+    'percentuais': tabela_percentuais,
+    'eventos': tabela_eventos,
+}
+
+
+# Fatias de até LINHAS_POR_BLOCO linhas de uma tabela já pronta (ao menos uma)
+def _blocos(tabela):
+    for inicio in range(0, max(len(tabela), 1), LINHAS_POR_BLOCO):
+        yield tabela.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+
+
+# Algarismos significativos dos números nos formatos textuais: o SPEI é guardado em float32 (cerca de 7
+# algarismos) e os dígitos além disso são só ruído da conversão para float64
+ALGARISMOS_SIGNIFICATIVOS = 7
+
+
+# Datas ISO, categorias como texto e números arredondados a ALGARISMOS_SIGNIFICATIVOS nos formatos textuais
+def _texto(bloco):
+    datas = {coluna: bloco[coluna].dt.strftime('%Y-%m-%d') for coluna in bloco.select_dtypes('datetime').columns}
+    categorias = {coluna: bloco[coluna].astype(object) for coluna in bloco.select_dtypes('category').columns}
+    numeros = {coluna: np.char.mod(f'%.{ALGARISMOS_SIGNIFICATIVOS}g', bloco[coluna].to_numpy()).astype('float64')
+               for coluna in bloco.select_dtypes('floating').columns}
+    return bloco.assign(**datas, **categorias, **numeros)
+
+
+# CSV com cabeçalho, convertido bloco a bloco
+def gerar_csv(blocos, metadados):
+    primeiro = next(blocos)
+    yield ','.join(primeiro.columns) + '\n'
+    for bloco in itertools.chain([primeiro], blocos):
+        if len(bloco):
+            yield _texto(bloco).to_csv(index=False, header=False)
+
+
+# JSON com os metadados da consulta e os registros em "dados"
+def gerar_json(blocos, metadados):
+    yield '{"metadados": ' + json.dumps(metadados, ensure_ascii=False) + ', "dados": ['
+    primeiro = True
+    for bloco in blocos:
+        registros = _texto(bloco).to_json(orient='records', force_ascii=False, double_precision=15)[1:-1]
+        if registros:
+            yield registros if primeiro else ',' + registros
+            primeiro = False
+    yield ']}'
+
+
+# Destino do ParquetWriter que guarda os bytes escritos até serem enviados
+class _Coletor:
+    def __init__(self):
+        self.partes = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def retirar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+# Parquet com um row group por bloco (o esquema vem do primeiro); os metadados da consulta vão nos metadados do arquivo
+def gerar_parquet(blocos, metadados):
+    coletor = _Coletor()
+    primeiro = next(blocos)
+    esquema = pa.Schema.from_pandas(primeiro, preserve_index=False).with_metadata(
+        {'spei': json.dumps(metadados, ensure_ascii=False)}
+    )
+    with pq.ParquetWriter(coletor, esquema) as escritor:
+        for bloco in itertools.chain([primeiro], blocos):
+            if len(bloco):
+                escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+                yield coletor.retirar()
+    yield coletor.retirar()
+
+
+# Gerador de cada formato
+GERADORES = {
+    'csv': gerar_csv,
+    'json': gerar_json,
+    'parquet': gerar_parquet,
+}
+
+
+# Formatos disponíveis neste ambiente
+def formatos_disponiveis():
+    return [formato for formato in FORMATOS if formato != 'parquet' or pa is not None]
+
+
+# Gerador dos pedaços da resposta (str ou bytes) de uma tabela (gerador de blocos de TABELAS) no formato pedido
+def exportar(blocos, formato, metadados):
+    if formato not in formatos_disponiveis():
+        raise ValueError(f'Formato indisponível: {formato} (disponíveis: {", ".join(formatos_disponiveis())})')
+    return GERADORES[formato](iter(blocos), metadados)
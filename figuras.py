@@ -0,0 +1,380 @@
+import base64
+
+import numpy as np
+import plotly.graph_objs as go
+import plotly.io as pio
+
+from categorias import CATEGORIAS, CORES_CATEGORIAS
+
+font_style = dict(family='Arial, sans-serif', size=12, color='black')
+
+meses = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+
+# Estilo comum a todos os gráficos (fontes, grade e fundos), registrado como template do plotly.
+# Títulos e rótulos dos eixos herdam a fonte do layout, então não precisam ser repetidos em cada eixo.
+TEMPLATE = go.layout.Template(
+    layout=go.Layout(
+        font=dict(color='black', size=12),
+        plot_bgcolor='rgba(255, 255, 255, 1)',  # Fundo do gráfico
+        paper_bgcolor='rgba(255, 255, 255, 1)',  # Fundo da área do gráfico
+        xaxis=dict(showgrid=True, gridcolor='lightgrey'),
+        yaxis=dict(showgrid=True, gridcolor='lightgrey'),
+    )
+)
+pio.templates['spei'] = TEMPLATE
+
+
+# Array numérico no formato compacto do plotly.js: typed array little-endian codificado em base64
+# (os traços são montados como dicionários porque o plotly.py 5 não valida esse formato)
+def array_compacto(valores, dtype='f4'):
+    dados = np.ascontiguousarray(valores, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(dados.tobytes()).decode('ascii')}
+
+
+# Datas como 'AAAA-MM' (séries mensais, que o plotly.js interpreta como o primeiro dia do mês) ou 'AAAA-MM-DD'
+def datas_compactas(datas):
+    datas = np.asarray(datas)
+    if len(datas) and (datas == datas.astype('datetime64[M]')).all():
+        return np.datetime_as_string(datas.astype('datetime64[M]')).tolist()
+    return np.datetime_as_string(datas.astype('datetime64[D]')).tolist()
+
+
+# Nível de detalhe dos gráficos de linha e dispersão: acima de PONTOS_MAXIMOS pontos no trecho visível a
+# série é reduzida no servidor, e o zoom (relayoutData) busca o trecho ampliado com mais resolução.
+# Traços com mais de PONTOS_WEBGL pontos são desenhados com WebGL (scattergl).
+PONTOS_MAXIMOS = 2000
+PONTOS_WEBGL = 1000
+GRAFICOS_DETALHAVEIS = ('spei-graph', 'scatter-graph')
+
+
+# Largest-Triangle-Three-Buckets: posições de `pontos` amostras que preservam a forma da linha
+# (sempre inclui o primeiro e o último ponto)
+def reduzir_lttb(x, y, pontos):
+    n = len(y)
+    if n <= pontos or pontos < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    limites = np.linspace(1, n - 1, pontos - 1).astype(np.int64)
+    escolhidos = np.empty(pontos, dtype=np.int64)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(pontos - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        proximo_fim = limites[i + 2] if i + 2 < len(limites) else n
+        # Média do próximo bucket como terceiro vértice do triângulo
+        x_medio = x[fim:proximo_fim].mean()
+        y_medio = y[fim:proximo_fim].mean()
+        areas = np.abs((x[anterior] - x_medio) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (y_medio - y[anterior]))
+        anterior = inicio + int(areas.argmax())
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+
+# Mínimo e máximo de cada um dos `pontos // 2` buckets, em ordem: preserva os extremos (secas e
+# períodos úmidos) na dispersão
+def reduzir_minmax(y, pontos):
+    n = len(y)
+    if n <= pontos:
+        return np.arange(n)
+    tamanho = -(-n // (pontos // 2))
+    blocos = np.full(tamanho * -(-n // tamanho), np.nan)
+    blocos[:n] = y
+    blocos = blocos.reshape(-1, tamanho)
+    base = np.arange(len(blocos)) * tamanho
+    minimos = base + np.where(np.isnan(blocos), np.inf, blocos).argmin(axis=1)
+    maximos = base + np.where(np.isnan(blocos), -np.inf, blocos).argmax(axis=1)
+    return np.unique(np.concatenate([minimos, maximos]))
+
+
+# Trecho da série no intervalo de anos e, com zoom, só a faixa visível [início, fim] do eixo x
+# (views da série compacta: as posições das datas saem do eixo mensal de passo fixo, sem busca)
+def serie_visivel(cubo, ano_inicial, ano_final, faixa=None):
+    serie = cubo.serie_intervalo(ano_inicial, ano_final)
+    if faixa:
+        serie = serie[serie.posicao(faixa[0], 'left'):serie.posicao(faixa[1], 'right')]
+    return serie
+
+
+# Se o intervalo tem mais pontos do que os enviados (ou seja, se o zoom traria mais detalhe)
+def precisa_detalhar(cubo, ano_inicial, ano_final):
+    return cubo.tamanho_intervalo(ano_inicial, ano_final) > PONTOS_MAXIMOS
+
+
+def _tipo_dispersao(pontos):
+    return 'scattergl' if pontos > PONTOS_WEBGL else 'scatter'
+
+
+def _eixo_x(eixo, faixa):
+    return {**eixo, 'range': list(faixa)} if faixa else eixo
+
+
+# Gráfico de linha SPEI
+def figura_linha(cubo, ano_inicial, ano_final, escala, faixa=None):
+    spei_filtrado = serie_visivel(cubo, ano_inicial, ano_final, faixa)
+    datas, valores = spei_filtrado.datas(), spei_filtrado.valores
+    if len(valores) > PONTOS_MAXIMOS:
+        escolhidos = reduzir_lttb(datas.astype('datetime64[s]').astype('int64'), valores, PONTOS_MAXIMOS)
+        datas, valores = datas[escolhidos], valores[escolhidos]
+
+    linha_figure = {
+        'data': [
+            dict(
+                type=_tipo_dispersao(len(valores)),
+                x=datas_compactas(datas),
+                y=array_compacto(valores),
+                mode='lines',
+                name=f'SPEI-{escala} de {ano_inicial} a {ano_final + 1}',
+                line=dict(color='gray', width=2)  # Espessura da linha
+            )
+        ],
+        'layout': go.Layout(
+            template='spei',
+            xaxis=_eixo_x({'title': 'Data', 'title_font': dict(size=14)}, faixa),
+            yaxis={'title': 'SPEI', 'range': [-3, 3], 'title_font': dict(size=14)},
+            margin=dict(t=40, l=50, r=40, b=50),  # Margens
+            legend=dict(title='Legenda', font=font_style)
+        )
+    }
+
+    return linha_figure
+
+
+# Gráfico de barras empilhadas com a porcentagem de cada categoria por ano
+def figura_barras_empilhadas(cubo, ano_inicial, ano_final, escala):
+    dados_ano = cubo.percentual_categorias(ano_inicial, ano_final)
+    anos = array_compacto(dados_ano.index, 'i2')
+
+    barras_figure = {
+        'data': [
+            dict(
+                type='bar',
+                x=anos,
+                y=array_compacto(dados_ano[categoria].values),
+                name=categoria,
+                marker=dict(color=CORES_CATEGORIAS[categoria])  # Usando as cores atualizadas
+            ) for categoria in reversed(CATEGORIAS)  # Da umidade extrema à seca extrema
+        ],
+        'layout': go.Layout(
+            template='spei',
+            barmode='stack',
+            xaxis={'title': 'Ano'},
+            yaxis={'title': 'Porcentagem'},
+            legend=dict(traceorder='normal', font=dict(size=12)),  # Tamanho da fonte da legenda
+            margin=dict(t=20, l=40, r=40, b=40),  # Margens
+            bargap=0.1  # Espaçamento entre as barras
+        )
+    }
+
+    return barras_figure
+
+
+# Gráfico de média mensal
+def figura_media_mensal(cubo, ano_inicial, ano_final, escala):
+    media_mensal_por_mes = cubo.media_mensal(ano_inicial, ano_final)  # Média por mês
+
+    media_mensal_figure = {
+        'data': [
+            dict(
+                type='bar',
+                x=meses,
+                y=array_compacto(media_mensal_por_mes),
+                name='Média Mensal de SPEI',
+                marker=dict(color='gray', opacity=0.7)  # Adicionando opacidade
+            )
+        ],
+        'layout': go.Layout(
+            template='spei',
+            xaxis={'title': 'Meses'},
+            yaxis={'title': 'SPEI'},
+            margin=dict(t=20, l=40, r=25, b=40),  # Margens
+        )
+    }
+
+    return media_mensal_figure
+
+
+# Gráfico de histograma, com as contagens das classes já somadas no servidor (barras de largura da classe)
+def figura_histograma(cubo, ano_inicial, ano_final, escala):
+    bordas, contagens = cubo.histograma_intervalo(ano_inicial, ano_final)
+    ocupadas = np.flatnonzero(contagens)
+    classes = slice(ocupadas[0], ocupadas[-1] + 1) if len(ocupadas) else slice(0, 0)
+    centros = (bordas[:-1] + bordas[1:]) / 2
+
+    histograma_figure = {
+        'data': [
+            dict(
+                type='bar',
+                x=array_compacto(centros[classes]),
+                y=array_compacto(contagens[classes], 'i4'),
+                width=float(bordas[1] - bordas[0]),
+                marker=dict(color='gray', opacity=0.75)  # Adicionando opacidade
+            )
+        ],
+        'layout': go.Layout(
+            template='spei',
+            xaxis={'title': 'SPEI'},
+            yaxis={'title': 'Frequência'},
+            margin=dict(t=20, l=40, r=25, b=40),  # Margens
+            bargap=0
+        )
+    }
+
+    return histograma_figure
+
+
+# Gráfico de dispersão
+def figura_dispersao(cubo, ano_inicial, ano_final, escala, faixa=None):
+    spei_filtrado = serie_visivel(cubo, ano_inicial, ano_final, faixa)
+    datas, valores = spei_filtrado.datas(), spei_filtrado.valores
+    if len(valores) > PONTOS_MAXIMOS:
+        escolhidos = reduzir_minmax(valores, PONTOS_MAXIMOS)
+        datas, valores = datas[escolhidos], valores[escolhidos]
+
+    scatter_figure = {
+        'data': [
+            dict(
+                type=_tipo_dispersao(len(valores)),
+                x=datas_compactas(datas),
+                y=array_compacto(valores),
+                mode='markers',
+                marker=dict(color='gray', size=7, opacity=0.8)  # Aumentando o tamanho e adicionando opacidade
+            )
+        ],
+        'layout': go.Layout(
+            template='spei',
+            xaxis=_eixo_x({'title': 'Data'}, faixa),
+            yaxis={'title': 'SPEI', 'range': [-3, 3]},
+            margin=dict(t=20, l=40, r=25, b=40),  # Margens
+        )
+    }
+
+    return scatter_figure
+
+
+# Gráfico de boxplot por ano, desenhado a partir das estatísticas anuais pré-calculadas (uma caixa por ano)
+def figura_boxplot(cubo, ano_inicial, ano_final, escala):
+    caixas = cubo.caixas_anuais(ano_inicial, ano_final)
+
+    boxplot_figure = {
+        'data': [
+            dict(
+                type='box',
+                x=[str(ano) for ano in caixas.index],
+                q1=array_compacto(caixas['q1'].values),
+                median=array_compacto(caixas['mediana'].values),
+                q3=array_compacto(caixas['q3'].values),
+                lowerfence=array_compacto(caixas['cerca_inferior'].values),
+                upperfence=array_compacto(caixas['cerca_superior'].values),
+                mean=array_compacto(caixas['media'].values),
+                sd=array_compacto(caixas['desvio'].values),
+                name='SPEI',
+                marker=dict(color='gray'),
+                boxmean='sd'  # Adiciona a média e desvio padrão
+            )
+        ],
+        'layout': go.Layout(
+            template='spei',
+            yaxis={'title': 'SPEI', 'range': [-3, 3]},
+            xaxis={'title': 'Ano'},
+            margin=dict(t=30, l=40, r=25, b=40),  # Margens
+        )
+    }
+
+    return boxplot_figure
+
+
+# Comparação de períodos: cor da linha de cada período, na ordem em que foram adicionados (também o número
+# máximo de períodos comparados de uma vez)
+CORES_PERIODOS = ('#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd', '#17becf')
+
+# Card de comparação (servidor e modo cliente): títulos das colunas da tabela e texto enquanto não há períodos
+TITULOS_COMPARACAO = ('Período', 'Meses', 'Média', 'Desvio padrão', 'Meses em seca (%)')
+TEXTO_COMPARACAO_VAZIA = (f'Escolha os anos no controle deslizante e clique em "Adicionar à comparação" '
+                          f'(até {len(CORES_PERIODOS)} períodos).')
+
+
+# Texto das células da comparação sem valor (ex.: média de um período sem meses com SPEI)
+VALOR_AUSENTE = '—'
+
+
+# Número com `casas` decimais para a tabela da comparação, ou VALOR_AUSENTE quando não há valor (NaN)
+def formatar_valor(valor, casas):
+    return VALOR_AUSENTE if valor is None or np.isnan(valor) else f'{valor:.{casas}f}'
+
+
+# Rótulo de um período ('1997 a 1998', ou só o ano quando começa e termina no mesmo)
+def rotulo_periodo(ano_inicial, ano_final):
+    return str(ano_inicial) if ano_inicial == ano_final else f'{ano_inicial} a {ano_final}'
+
+
+# Gráfico de barras empilhadas com a porcentagem de cada categoria em cada período comparado
+def figura_comparacao_categorias(cubo, periodos, escala):
+    percentuais = [cubo.percentual_periodo(ano_inicial, ano_final) for ano_inicial, ano_final in periodos]
+
+    comparacao_figure = {
+        'data': [
+            dict(
+                type='bar',
+                x=[rotulo_periodo(*periodo) for periodo in periodos],
+                y=array_compacto([percentual[categoria] for percentual in percentuais]),
+                name=categoria,
+                marker=dict(color=CORES_CATEGORIAS[categoria])
+            ) for categoria in reversed(CATEGORIAS)  # Da umidade extrema à seca extrema
+        ],
+        'layout': go.Layout(
+            template='spei',
+            barmode='stack',
+            xaxis={'title': 'Período', 'type': 'category'},
+            yaxis={'title': 'Porcentagem'},
+            legend=dict(traceorder='normal', font=dict(size=12)),
+            margin=dict(t=20, l=40, r=40, b=40),
+            bargap=0.3
+        )
+    }
+
+    return comparacao_figure
+
+
+# Gráfico da média mensal de SPEI de cada período comparado (uma linha por período)
+def figura_comparacao_mensal(cubo, periodos, escala):
+    comparacao_figure = {
+        'data': [
+            dict(
+                type='scatter',
+                x=meses,
+                y=array_compacto(cubo.media_mensal(ano_inicial, ano_final)),
+                mode='lines+markers',
+                name=rotulo_periodo(ano_inicial, ano_final),
+                line=dict(color=CORES_PERIODOS[i % len(CORES_PERIODOS)], width=2)
+            ) for i, (ano_inicial, ano_final) in enumerate(periodos)
+        ],
+        'layout': go.Layout(
+            template='spei',
+            xaxis={'title': 'Meses'},
+            yaxis={'title': 'SPEI'},
+            legend=dict(title='Período', font=font_style),
+            margin=dict(t=20, l=40, r=25, b=40),
+        )
+    }
+
+    return comparacao_figure
+
+
+# Construtor da figura de cada gráfico do dashboard, pelo id do componente
+CONSTRUTORES = {
+    'spei-graph': figura_linha,
+    'barras-empilhadas-graph': figura_barras_empilhadas,
+    'media-mensal-graph': figura_media_mensal,
+    'histograma-graph': figura_histograma,
+    'scatter-graph': figura_dispersao,
+    'boxplot-graph': figura_boxplot,
+}
+
+# Construtores dos gráficos do card de comparação, que recebem a lista de períodos ([ano_inicial, ano_final])
+# no lugar do intervalo
+CONSTRUTORES_COMPARACAO = {
+    'comparacao-categorias-graph': figura_comparacao_categorias,
+    'comparacao-mensal-graph': figura_comparacao_mensal,
+}
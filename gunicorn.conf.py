@@ -0,0 +1,31 @@
+import os
+
+# Configuração do gunicorn (gunicorn -c gunicorn.conf.py app:server). O app é importado uma única vez no
+# master (preload_app), que calcula o SPEI de todas as escalas e o publica em memória compartilhada; os
+# workers nascem por fork com os arrays já mapeados, sem reler as planilhas nem refazer os ajustes.
+os.environ.setdefault('SPEI_MEMORIA_COMPARTILHADA', '1')
+# Com preload a carga precisa terminar antes do fork: threads (como a de aquecimento) não passam aos workers.
+# Uma carga adiada pedida explicitamente não é sobrescrita em silêncio: o gunicorn não sobe.
+if os.environ.setdefault('SPEI_CARGA_ADIADA', '0').lower() in ('1', 'true', 'sim'):
+    raise RuntimeError('SPEI_CARGA_ADIADA=1 não funciona com o preload_app do gunicorn.conf.py: use SPEI_CARGA_ADIADA=0')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+# Os callbacks em segundo plano exigem um único worker: com os 2 workers padrão o app os desliga e avisa no log;
+# para ligá-los, use WEB_CONCURRENCY=1 (config.TAREFAS_SEGUNDO_PLANO). O número de workers deve vir daqui ou do
+# WEB_CONCURRENCY, não da opção -w, que o app não enxerga
+if os.environ.setdefault('SPEI_WORKERS', str(workers)) != str(workers):
+    raise RuntimeError(f"SPEI_WORKERS={os.environ['SPEI_WORKERS']} difere dos {workers} workers do gunicorn.conf.py")
+preload_app = True
+timeout = 120
+
+# A verificação periódica de dados novos fica só nos workers (post_fork): no import do app, feito pelo master,
+# ela não é iniciada
+os.environ['SPEI_VERIFICACAO_POST_FORK'] = '1'
+
+
+# Threads criadas no master não existem nos workers: a verificação periódica de dados novos roda em cada um
+def post_fork(server, worker):
+    import app
+
+    app.iniciar_verificacao_periodica()
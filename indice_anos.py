@@ -0,0 +1,54 @@
+import numpy as np
+
+from serie_mensal import ANO_EPOCA
+
+MESES = 12
+
+
+# Índice dos anos de um eixo de tempo crescente (mensal, diário...): os anos presentes e a posição em que cada
+# um começa, calculados uma vez. Um intervalo de anos vira uma busca binária nos anos e uma fatia das
+# posições, e os pontos de cada ano formam um trecho contíguo, sem máscaras booleanas nem cópias.
+class IndiceAnos:
+    def __init__(self, anos, inicios):
+        self.anos = anos  # Anos presentes no eixo, crescentes
+        self.inicios = inicios  # Posição do primeiro ponto de cada ano, mais o fim do eixo
+
+    # Índice de datas crescentes (array datetime64 ou DatetimeIndex, em qualquer frequência); anos sem
+    # nenhum ponto ficam de fora
+    @classmethod
+    def de_datas(cls, datas):
+        anos = np.asarray(datas).astype('datetime64[Y]').astype('int64') + ANO_EPOCA
+        primeiros = np.flatnonzero(np.diff(anos, prepend=anos[:1] - 1)) if len(anos) else np.empty(0, dtype='int64')
+        return cls(anos[primeiros], np.append(primeiros, len(anos)))
+
+    # Índice de um eixo mensal de passo fixo com `n` meses a partir de `mes_zero` (meses desde 1970-01),
+    # calculado sem olhar as datas
+    @classmethod
+    def mensal(cls, mes_zero, n):
+        deslocamento = mes_zero % MESES  # Mês do calendário da primeira posição
+        anos = np.arange(mes_zero // MESES, (mes_zero + n - 1) // MESES + 1) + ANO_EPOCA
+        return cls(anos, np.clip(np.arange(len(anos) + 1) * MESES - deslocamento, 0, n))
+
+    def __len__(self):
+        return len(self.anos)
+
+    # Fatia do eixo de anos que cobre [ano_inicial, ano_final]
+    def linhas(self, ano_inicial, ano_final):
+        return slice(int(np.searchsorted(self.anos, ano_inicial, side='left')),
+                     int(np.searchsorted(self.anos, ano_final, side='right')))
+
+    # Fatia das posições do eixo que cobrem [ano_inicial, ano_final]
+    def posicoes(self, ano_inicial, ano_final):
+        linhas = self.linhas(ano_inicial, ano_final)
+        return slice(int(self.inicios[linhas.start]), int(self.inicios[linhas.stop]))
+
+    # Pares (ano, fatia das posições) de cada ano presente em [ano_inicial, ano_final] (sem o intervalo, de
+    # todos os anos)
+    def trechos(self, ano_inicial=None, ano_final=None):
+        linhas = slice(0, len(self.anos)) if ano_inicial is None else self.linhas(ano_inicial, ano_final)
+        return [(int(self.anos[i]), slice(int(self.inicios[i]), int(self.inicios[i + 1])))
+                for i in range(linhas.start, linhas.stop)]
+
+    # Linha do eixo de anos de cada posição, para agregar por ano com bincount
+    def linha_de_cada_posicao(self):
+        return np.repeat(np.arange(len(self.anos)), np.diff(self.inicios))
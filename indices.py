@@ -0,0 +1,263 @@
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy.stats import fisk, norm
+
+import agendador
+from agregados import CuboAgregado
+from categorias import CATEGORIAS, LIMIARES, codificar_spei
+from eventos import CRITERIOS_PADRAO, detectar_eventos
+from indice_anos import IndiceAnos
+from metricas import metricas
+from serie_mensal import SerieMensal, mes_inicial
+
+# Escalas padrão do SPEI em meses: 1 (meteorológica), 3 e 6 (agrícolas), 12 e 24 (hidrológicas)
+ESCALAS = (1, 3, 6, 12, 24)
+
+
+# Classifica uma série de SPEI de uma só vez, devolvendo um categórico ordenado com o mesmo índice
+def classificar_spei(serie):
+    categorias = pd.Categorical.from_codes(codificar_spei(serie.values), categories=CATEGORIAS, ordered=True)
+    return pd.Series(categorias, index=serie.index, name='categoria')
+
+
+# Categoria de um único valor de SPEI, pela mesma tabela de limiares
+def categorizar_spei(spei_value):
+    if pd.isna(spei_value):
+        return None
+    return CATEGORIAS[bisect.bisect_right(LIMIARES, spei_value)]
+
+
+# Ajusta a log-logística (fisk) aos valores de um mês do calendário, exatamente como spei.spei
+def ajustar_distribuicao(valores):
+    return fisk.fit(valores, scale=np.std(valores))
+
+
+# Tarefa do agendador: parâmetros de um (local, escala, mês), ou None quando não há dados
+def _ajustar_tarefa(valores):
+    return ajustar_distribuicao(valores) if len(valores) else None
+
+
+# Parâmetros (c, loc, scale) da log-logística de cada local e mês do calendário, por escala: {escala: array
+# (local × mês × 3)}, com NaN nos meses sem dados. O ajuste usa os anos de `calibracao` (ano_inicial,
+# ano_final) ou toda a série quando None. Cada (local, escala, mês) é uma tarefa de ajuste independente,
+# distribuída pelo agendador entre `processos` processos (`progresso`: ver agendador.mapear).
+def ajustar_lote(balancos, escalas, processos=None, calibracao=None, progresso=None):
+    meses = balancos.index.month.to_numpy() - 1
+    calibrar = np.ones(len(balancos), dtype=bool)
+    if calibracao is not None:
+        calibrar[:] = False
+        calibrar[IndiceAnos.de_datas(balancos.index).posicoes(*calibracao)] = True
+
+    tarefas = []
+    posicoes = []
+    for j in range(balancos.shape[1]):
+        for escala in escalas:
+            coluna = balancos.iloc[:, j].rolling(escala).sum().to_numpy()
+            for mes in range(12):
+                tarefas.append(coluna[(meses == mes) & calibrar & ~np.isnan(coluna)])
+                posicoes.append((escala, j, mes))
+
+    parametros = {escala: np.full((balancos.shape[1], 12, 3), np.nan) for escala in escalas}
+    for (escala, j, mes), parametros_tarefa in zip(posicoes, agendador.mapear(_ajustar_tarefa, tarefas, processos, progresso)):
+        if parametros_tarefa is not None:
+            parametros[escala][j, mes] = parametros_tarefa
+    return parametros
+
+
+# Maior |SPEI| atribuído a valores fora do suporte da distribuição ajustada (probabilidade 0,001)
+LIMITE_SPEI = 3.09
+
+
+# SPEI de um bloco de somas acumuladas (tempo × local) com parâmetros já ajustados; `meses` é o mês do
+# calendário (0 a 11) de cada linha. Serve tanto para a série inteira quanto para meses recém-anexados.
+def aplicar_parametros(acumulado, meses, parametros):
+    resultado = np.full(acumulado.shape, np.nan)
+    for j in range(acumulado.shape[1]):
+        for mes in range(12):
+            if np.isnan(parametros[j, mes, 0]):
+                continue
+            linhas = (meses == mes) & ~np.isnan(acumulado[:, j])
+            spei = norm.ppf(fisk.cdf(acumulado[linhas, j], *parametros[j, mes]))
+            # Valores fora do suporte da distribuição (possível com calibração congelada) viram ±LIMITE_SPEI
+            resultado[linhas, j] = np.nan_to_num(spei, nan=np.nan, posinf=LIMITE_SPEI, neginf=-LIMITE_SPEI)
+    return resultado
+
+
+# SPEI de vários locais e escalas de uma vez. `balancos` é um DataFrame (tempo × local) com o balanço
+# hídrico mensal; devolve {escala: DataFrame} no mesmo formato, com NaN onde a janela de `escala` meses
+# ainda não completou.
+def spei_lote(balancos, escalas, processos=None, calibracao=None):
+    meses = balancos.index.month.to_numpy() - 1
+    parametros = ajustar_lote(balancos, escalas, processos, calibracao)
+    return {
+        escala: pd.DataFrame(aplicar_parametros(balancos.rolling(escala).sum().to_numpy(), meses, parametros[escala]),
+                             index=balancos.index, columns=balancos.columns)
+        for escala in escalas
+    }
+
+
+# SPEI de várias escalas para um ou mais locais, calculado uma única vez por escala (todos os locais e
+# as escalas pendentes juntos, em lote) e mantido em memória no formato compacto de serie_mensal.SerieMensal
+# (float32 e códigos int8 das categorias, sobre o eixo mensal de passo fixo). `balancos` é um DataFrame com
+# um local por coluna (ou uma Series, para um único local), mensal e sem lacunas.
+# Os parâmetros das distribuições ficam guardados: meses novos (`anexar`) são padronizados com eles,
+# recalculando só as janelas que os incluem. Com `calibracao` (ano_inicial, ano_final) os parâmetros
+# ficam congelados nesse período; sem ela, são reajustados à série inteira a cada `reajuste_meses`
+# meses anexados (0 = somente com `reajustar`). Os eventos de seca de cada série são detectados no
+# primeiro uso com `criterios_eventos` (ver eventos.CRITERIOS_PADRAO) e guardados até a série mudar.
+class SPEIMultiescala:
+    def __init__(self, balancos, escalas=ESCALAS, processos=None, calibracao=None, reajuste_meses=0,
+                 criterios_eventos=None):
+        if isinstance(balancos, pd.Series):
+            balancos = balancos.to_frame()
+        self.balancos = balancos
+        self.inicio = mes_inicial(balancos.index)
+        self.locais = tuple(balancos.columns)
+        self.escalas = tuple(escalas)
+        self.processos = processos
+        self.calibracao = calibracao
+        self.reajuste_meses = reajuste_meses
+        self.criterios_eventos = {**CRITERIOS_PADRAO, **(criterios_eventos or {})}
+        self.meses_desde_ajuste = 0
+        self._parametros = {}
+        self._series = {}
+        self._cubos = {}
+        self._eventos = {}
+        self._trava = threading.RLock()
+
+    # Reconstrói o objeto a partir de resultados já calculados (ex.: arrays mapeados da memória compartilhada),
+    # sem refazer os ajustes. `tabelas`, `parametros` e `codigos` são {escala: array (local × tempo)}, {escala:
+    # array (local × mês × 3)} e, opcionalmente, {escala: array int8 (local × tempo)} com as categorias. Com
+    # tabelas float32 e os códigos, as séries são views dos próprios arrays; sem os códigos, são classificadas.
+    @classmethod
+    def de_tabelas(cls, balancos, tabelas, parametros, codigos=None, **opcoes):
+        spei_escalas = cls(balancos, escalas=tuple(tabelas), **opcoes)
+        spei_escalas._parametros.update(parametros)
+        for escala, tabela in tabelas.items():
+            with metricas.medir('classificacao', escala=escala):
+                series = {
+                    local: SerieMensal.de_valores(spei_escalas.inicio, tabela[j], local,
+                                                  None if codigos is None else codigos[escala][j])
+                    for j, local in enumerate(spei_escalas.locais)
+                }
+            spei_escalas._guardar(escala, series)
+        return spei_escalas
+
+    # Guarda a série (SerieMensal) e o cubo de cada local de uma escala
+    def _guardar(self, escala, series):
+        for local, serie in series.items():
+            with metricas.medir('agregacao', escala=escala):
+                self._cubos[escala, local] = CuboAgregado(serie)
+            self._eventos.pop((escala, local), None)
+        self._series[escala] = series
+
+    # Ajusta as distribuições das escalas e recalcula as séries inteiras (chamado com a trava)
+    def _ajustar(self, escalas, progresso=None):
+        meses = self.balancos.index.month.to_numpy() - 1
+        with metricas.medir('ajuste'):
+            self._parametros.update(ajustar_lote(self.balancos, escalas, self.processos, self.calibracao, progresso))
+        for escala in escalas:
+            with metricas.medir('padronizacao', escala=escala):
+                spei = aplicar_parametros(self.balancos.rolling(escala).sum().to_numpy(), meses, self._parametros[escala])
+            with metricas.medir('classificacao', escala=escala):
+                series = {local: SerieMensal.de_valores(self.inicio, spei[:, j], local)
+                          for j, local in enumerate(self.locais)}
+            self._guardar(escala, series)
+
+    # Calcula as escalas que ainda faltam; ValueError para escalas fora de `self.escalas` (ex.: vindas de uma
+    # requisição), que nunca são ajustadas nem guardadas
+    def _calcular_escalas(self, escalas, progresso=None):
+        if all(escala in self._series for escala in escalas):
+            return
+        desconhecidas = [escala for escala in escalas if escala not in self.escalas]
+        if desconhecidas:
+            raise ValueError(f'Escalas não disponíveis: {desconhecidas} (disponíveis: {list(self.escalas)})')
+        with self._trava:
+            faltantes = [escala for escala in escalas if escala not in self._series]
+            if faltantes:
+                self._ajustar(faltantes, progresso)
+
+    # Série do SPEI (SerieMensal) na escala pedida, a partir do primeiro mês com janela completa; sem `local`,
+    # usa o primeiro
+    def serie(self, escala, local=None):
+        self._calcular_escalas((escala,))
+        return self._series[escala][local or self.locais[0]]
+
+    # Categorias da série na escala pedida como rótulos (os códigos int8 são classificados uma única vez,
+    # junto com o cálculo do SPEI, e ficam na própria série)
+    def categorias(self, escala, local=None):
+        return self.serie(escala, local).categorias()
+
+    # Agregados anuais (agregados.CuboAgregado) da escala pedida
+    def cubo(self, escala, local=None):
+        self._calcular_escalas((escala,))
+        return self._cubos[escala, local or self.locais[0]]
+
+    # Tabela dos eventos de seca da escala pedida (eventos.detectar_eventos), calculada uma vez por série
+    def eventos(self, escala, local=None):
+        self._calcular_escalas((escala,))
+        chave = (escala, local or self.locais[0])
+        if chave not in self._eventos:
+            with metricas.medir('eventos', escala=escala):
+                self._eventos[chave] = detectar_eventos(self._series[escala][chave[1]], **self.criterios_eventos)
+        return self._eventos[chave]
+
+    # Calcula as escalas pedidas (todas, sem `escalas`) que ainda faltam; `progresso(feitas, total)` acompanha
+    # os ajustes das distribuições
+    def calcular(self, escalas=None, progresso=None):
+        self._calcular_escalas(tuple(escalas or self.escalas), progresso)
+        return self
+
+    # Parâmetros (local × mês × 3) das distribuições ajustadas na escala pedida
+    def parametros(self, escala):
+        self._calcular_escalas((escala,))
+        return self._parametros[escala]
+
+    # Escalas já calculadas (as demais são calculadas no primeiro uso)
+    def escalas_calculadas(self):
+        return [escala for escala in self.escalas if escala in self._series]
+
+    # Primeiro e último ano com balanço hídrico
+    def anos_disponiveis(self):
+        return int(self.balancos.index[0].year), int(self.balancos.index[-1].year)
+
+    # Acrescenta meses novos do balanço hídrico (mesmas colunas; os meses já conhecidos são ignorados).
+    # Nas escalas já calculadas, só as janelas que terminam nos meses novos são somadas e padronizadas
+    # com os parâmetros guardados. Devolve o número de meses anexados.
+    def anexar(self, novos):
+        if isinstance(novos, pd.Series):
+            novos = novos.to_frame(self.locais[0])
+        with self._trava:
+            anterior = self.balancos
+            novos = novos.loc[novos.index > anterior.index[-1], list(self.locais)].sort_index()
+            if novos.empty:
+                return 0
+            balancos = pd.concat([anterior, novos])
+            mes_inicial(balancos.index)  # Os meses novos precisam continuar o eixo mensal, sem lacunas
+            self.balancos = balancos
+            meses = novos.index.month.to_numpy() - 1
+
+            for escala in list(self._series):
+                # Os `escala - 1` meses anteriores completam as janelas dos primeiros meses novos
+                contexto = anterior.iloc[len(anterior) - min(escala - 1, len(anterior)):]
+                acumulado = pd.concat([contexto, novos]).rolling(escala).sum().to_numpy()[len(contexto):]
+                spei = aplicar_parametros(acumulado, meses, self._parametros[escala])
+                inicio_novos = self.inicio + len(anterior)
+                self._guardar(escala, {
+                    local: self._series[escala][local].anexar(inicio_novos, spei[:, j])
+                    for j, local in enumerate(self.locais)
+                })
+
+            self.meses_desde_ajuste += len(novos)
+            if self.calibracao is None and self.reajuste_meses and self.meses_desde_ajuste >= self.reajuste_meses:
+                self.reajustar()
+            return len(novos)
+
+    # Reajusta as distribuições de todas as escalas já calculadas (ex.: após anexar um ano de dados)
+    def reajustar(self):
+        with self._trava:
+            self._ajustar(list(self._series))
+            self.meses_desde_ajuste = 0
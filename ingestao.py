@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# Versão do formato do cache (incrementar quando a estrutura dos arquivos mudar)
+VERSAO_CACHE = 1
+
+
+# Calcula o hash SHA-256 do arquivo de origem, lendo em blocos
+def hash_arquivo(caminho):
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+# Caminhos dos arquivos do cache (par .npy de datas/valores e metadados em JSON). O nome leva um hash do caminho
+# absoluto da planilha: planilhas com o mesmo nome em pastas diferentes (ex.: uma por local) não dividem o cache
+def _caminhos_cache(caminho, diretorio):
+    nome = os.path.splitext(os.path.basename(caminho))[0]
+    origem = hashlib.sha256(os.path.abspath(caminho).encode('utf-8')).hexdigest()[:16]
+    base = os.path.join(diretorio, f'{nome}-{origem}')
+    return base + '.datas.npy', base + '.valores.npy', base + '.json'
+
+
+def _ler_meta(arq_meta):
+    try:
+        with open(arq_meta, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('versao') == VERSAO_CACHE else None
+
+
+# Grava em arquivo temporário e renomeia, para que outro worker nunca leia um arquivo pela metade
+def gravar_atomico(destino, escrever):
+    temporario = f'{destino}.{os.getpid()}.tmp'
+    with open(temporario, 'wb') as f:
+        escrever(f)
+    os.replace(temporario, destino)
+
+
+def _gravar_meta(arq_meta, meta):
+    gravar_atomico(arq_meta, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+
+# Lê uma planilha do TerraClimate: primeira coluna com a data, segunda com o valor e a primeira linha com a unidade
+def ler_planilha(caminho):
+    df = pd.read_excel(caminho).iloc[1:, :2]
+    datas = pd.to_datetime(df.iloc[:, 0], format='%Y-%m-%d').to_numpy(dtype='datetime64[ns]')
+    valores = pd.to_numeric(df.iloc[:, 1], errors='coerce').to_numpy(dtype='float64')
+    return datas, valores
+
+
+# Carrega uma série do TerraClimate a partir do cache binário, reconstruindo-o quando a planilha muda
+def carregar_serie(caminho, diretorio_cache=None):
+    diretorio = diretorio_cache or config.DIRETORIO_CACHE
+    arq_datas, arq_valores, arq_meta = _caminhos_cache(caminho, diretorio)
+    info = os.stat(caminho)
+
+    sha256 = None
+    meta = _ler_meta(arq_meta)
+    if meta is not None and meta['tamanho'] == info.st_size:
+        valido = meta['mtime_ns'] == info.st_mtime_ns
+        if not valido:
+            sha256 = hash_arquivo(caminho)
+        if not valido and meta['sha256'] == sha256:
+            # Planilha tocada (ex.: checkout) mas com o mesmo conteúdo: apenas atualiza o mtime
+            meta['mtime_ns'] = info.st_mtime_ns
+            try:
+                _gravar_meta(arq_meta, meta)
+            except OSError:
+                pass
+            valido = True
+        if valido:
+            try:
+                datas = np.load(arq_datas, mmap_mode='r')
+                valores = np.load(arq_valores, mmap_mode='r')
+            except (OSError, ValueError):
+                pass
+            else:
+                return pd.Series(valores, index=pd.DatetimeIndex(datas, name='data'), name='dados')
+
+    datas, valores = ler_planilha(caminho)
+    try:
+        os.makedirs(diretorio, exist_ok=True)
+        gravar_atomico(arq_datas, lambda f: np.save(f, datas))
+        gravar_atomico(arq_valores, lambda f: np.save(f, valores))
+        # Os metadados são gravados por último: sem eles o cache é ignorado
+        _gravar_meta(arq_meta, {
+            'versao': VERSAO_CACHE,
+            'origem': os.path.basename(caminho),
+            'tamanho': info.st_size,
+            'mtime_ns': info.st_mtime_ns,
+            'sha256': sha256 or hash_arquivo(caminho),
+        })
+    except OSError:
+        # Sistema de arquivos somente leitura: segue sem cache
+        pass
+    return pd.Series(valores, index=pd.DatetimeIndex(datas, name='data'), name='dados')
+
+
+# Identificador do conteúdo das planilhas de origem, usado para invalidar caches derivados (ex.: figuras)
+def versao_dados(*caminhos, diretorio_cache=None):
+    diretorio = diretorio_cache or config.DIRETORIO_CACHE
+    h = hashlib.sha256(str(VERSAO_CACHE).encode())
+    for caminho in caminhos:
+        meta = _ler_meta(_caminhos_cache(caminho, diretorio)[2])
+        if meta is not None and meta['mtime_ns'] == os.stat(caminho).st_mtime_ns:
+            h.update(meta['sha256'].encode())
+        else:
+            h.update(hash_arquivo(caminho).encode())
+    return h.hexdigest()[:16]
+
+
+# Função para extrair o balanço hídrico mensal (precipitação - ETP)
+def extrair_balanco(path_etp, path_prp):
+    df = pd.concat({'etp': carregar_serie(path_etp), 'prp': carregar_serie(path_prp)}, axis=1, join='inner')
+    return (df['prp'] - df['etp']).rename('dados')
+
+
+# Balanço hídrico mensal de vários locais do registro, um por coluna (indexadas pelo id do local)
+def extrair_balancos(locais):
+    return pd.concat({local['id']: extrair_balanco(local['etp'], local['prp']) for local in locais}, axis=1)
+
+
+# Função para extrair o balanço hídrico acumulado em `acumulado` meses
+def extrair_dados(path_etp, path_prp, acumulado=1):
+    acumulado_hidrico = extrair_balanco(path_etp, path_prp).rolling(acumulado).sum().dropna()
+    df_preparado = pd.DataFrame({'dados': acumulado_hidrico.values}, index=acumulado_hidrico.index)
+
+    return df_preparado
+
+
+# Função para extrair dados somente de ETP e precipitação
+def extrair_etp_prp(path_etp, path_prp):
+    return pd.concat({'ETP': carregar_serie(path_etp), 'Precipitação': carregar_serie(path_prp)}, axis=1, join='inner')
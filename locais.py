@@ -0,0 +1,25 @@
+import json
+import os
+
+import config
+
+
+# Registro dos locais (municípios ou pontos de grade do TerraClimate) exibidos no dashboard.
+# Cada entrada tem id, nome, uf, lat, lon e as planilhas de ETP e precipitação, com caminhos
+# relativos ao diretório do próprio arquivo de registro.
+def carregar_locais(arquivo=None):
+    arquivo = arquivo or config.ARQUIVO_LOCAIS
+    with open(arquivo, encoding='utf-8') as f:
+        locais = json.load(f)
+
+    diretorio = os.path.dirname(os.path.abspath(arquivo))
+    ids = set()
+    for local in locais:
+        if local['id'] in ids:
+            raise ValueError(f"Local duplicado no registro {arquivo}: {local['id']}")
+        ids.add(local['id'])
+        local['etp'] = os.path.join(diretorio, local['etp'])
+        local['prp'] = os.path.join(diretorio, local['prp'])
+    if not locais:
+        raise ValueError(f'Nenhum local cadastrado em {arquivo}')
+    return locais
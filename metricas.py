@@ -0,0 +1,104 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites dos buckets dos histogramas de tempo (s) e de tamanho das respostas (bytes)
+LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LIMITES_BYTES = (1_000, 5_000, 10_000, 30_000, 100_000, 300_000, 1_000_000, 3_000_000)
+
+
+class Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.buckets = [0] * len(limites)
+        self.contagem = 0
+        self.soma = 0.0
+
+    def registrar(self, valor):
+        i = bisect.bisect_left(self.limites, valor)
+        if i < len(self.limites):
+            self.buckets[i] += 1
+        self.contagem += 1
+        self.soma += valor
+
+
+# Valor de rótulo com o escape do formato de texto do Prometheus (barra invertida, aspas e quebra de linha)
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _rotulos(rotulos):
+    return ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos)
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+# Métricas do processo (cada worker do gunicorn tem as suas), exportadas no formato de texto do Prometheus.
+# Cada série é um histograma identificado pelo nome e pelos rótulos.
+class Metricas:
+    def __init__(self, prefixo='spei'):
+        self.prefixo = prefixo
+        self._histogramas = {}
+        self._descricoes = {}
+        self._trava = threading.Lock()
+
+    def descrever(self, nome, descricao):
+        self._descricoes[nome] = descricao
+
+    def observar(self, nome, valor, limites=LIMITES_SEGUNDOS, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._trava:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = Histograma(limites)
+            histograma.registrar(valor)
+
+    # Tempo de uma etapa do pipeline ou dos callbacks, no histograma `etapa_segundos`
+    @contextmanager
+    def medir(self, etapa, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar('etapa_segundos', time.perf_counter() - inicio, etapa=etapa, **rotulos)
+
+    # Texto do /metrics: os histogramas e os valores avulsos em `valores` ({nome: (tipo, descrição, valor)})
+    def texto(self, valores=None):
+        with self._trava:
+            series = sorted((chave, list(h.buckets), h.contagem, h.soma, h.limites)
+                            for chave, h in self._histogramas.items())
+
+        linhas = []
+        nome_anterior = None
+        for (nome, rotulos), buckets, contagem, soma, limites in series:
+            completo = f'{self.prefixo}_{nome}'
+            if nome != nome_anterior:
+                if nome in self._descricoes:
+                    linhas.append(f'# HELP {completo} {self._descricoes[nome]}')
+                linhas.append(f'# TYPE {completo} histogram')
+                nome_anterior = nome
+            acumulado = 0
+            for limite, quantidade in zip(limites, buckets):
+                acumulado += quantidade
+                linhas.append(f'{completo}_bucket{{{_rotulos(rotulos + (("le", limite),))}}} {acumulado}')
+            linhas.append(f'{completo}_bucket{{{_rotulos(rotulos + (("le", "+Inf"),))}}} {contagem}')
+            sufixo = f'{{{_rotulos(rotulos)}}}' if rotulos else ''
+            linhas.append(f'{completo}_sum{sufixo} {_numero(soma)}')
+            linhas.append(f'{completo}_count{sufixo} {contagem}')
+
+        for nome, (tipo, descricao, valor) in (valores or {}).items():
+            completo = f'{self.prefixo}_{nome}'
+            linhas.append(f'# HELP {completo} {descricao}')
+            linhas.append(f'# TYPE {completo} {tipo}')
+            linhas.append(f'{completo} {_numero(valor)}')
+        return '\n'.join(linhas) + '\n'
+
+
+# Instância compartilhada pelos módulos do dashboard
+metricas = Metricas()
+metricas.descrever('etapa_segundos', 'Tempo de cada etapa da carga dos dados e dos callbacks')
+metricas.descrever('callback_segundos', 'Tempo de resposta das requisições de callback, por saída')
+metricas.descrever('resposta_bytes', 'Tamanho das respostas dos callbacks, por saída')
@@ -0,0 +1,227 @@
+import json
+
+import numpy as np
+import plotly.utils
+from dash import ClientsideFunction, Input, Output, State
+
+from agregados import BORDAS_HISTOGRAMA
+from categorias import CATEGORIAS
+from eventos import ESTILO_TABELA, TITULOS
+from figuras import (CONSTRUTORES, CONSTRUTORES_COMPARACAO, CORES_PERIODOS, TEXTO_COMPARACAO_VAZIA, TITULOS_COMPARACAO,
+                     VALOR_AUSENTE, meses)
+
+# Função JavaScript (assets/clientside.js, namespace 'spei') que monta cada gráfico no navegador
+FUNCOES_CLIENTE = {
+    'spei-graph': 'linha',
+    'barras-empilhadas-graph': 'barras_empilhadas',
+    'media-mensal-graph': 'media_mensal',
+    'histograma-graph': 'histograma',
+    'scatter-graph': 'dispersao',
+    'boxplot-graph': 'boxplot',
+}
+
+
+# Converte figuras (com objetos do plotly) em JSON puro
+def _json_puro(figura):
+    return json.loads(json.dumps(figura, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+# Modelo de cada gráfico: layout e estilo dos traços das figuras do servidor, sem os arrays de dados
+# (as estatísticas do boxplot também são recalculadas no navegador). Os gráficos de comparação são montados
+# com um único período: o traço da linha serve de modelo para as linhas de todos os períodos.
+def _modelos(spei_escalas, construtores=CONSTRUTORES):
+    escala = spei_escalas.escalas[0]
+    cubo = spei_escalas.cubo(escala)
+    ano_inicial, ano_final = int(cubo.anos[0]), int(cubo.anos[-1])
+    modelos = {}
+    for id_grafico, construir in construtores.items():
+        if id_grafico in CONSTRUTORES_COMPARACAO:
+            figura = _json_puro(construir(cubo, [(ano_inicial, ano_final)], escala))
+        else:
+            figura = _json_puro(construir(cubo, ano_inicial, ano_final, escala))
+        for traco in figura['data']:
+            for campo in ('x', 'y', 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'mean', 'sd'):
+                traco.pop(campo, None)
+        modelos[id_grafico] = figura
+    return modelos
+
+
+# Série de uma escala e local no formato do cliente: o da própria série compacta, mês inicial + valores
+# contíguos e códigos das categorias
+def _serie_cliente(spei_escalas, escala, local):
+    serie = spei_escalas.serie(escala, local)
+    return {
+        'inicio': str(serie.inicio),
+        'valores': [None if np.isnan(v) else float(v) for v in serie.valores],
+        'codigos': serie.codigos.tolist(),
+    }
+
+
+# Tabela de eventos de seca de uma escala e local, por colunas (datas 'AAAA-MM' e códigos das categorias)
+def _eventos_cliente(spei_escalas, escala, local):
+    tabela = spei_escalas.eventos(escala, local)
+    return {
+        'inicio': tabela['inicio'].dt.strftime('%Y-%m').tolist(),
+        'fim': tabela['fim'].dt.strftime('%Y-%m').tolist(),
+        'duracao': tabela['duracao'].tolist(),
+        'meses_seca': tabela['meses_seca'].tolist(),
+        'severidade': tabela['severidade'].tolist(),
+        'pico': tabela['pico'].tolist(),
+        'data_pico': tabela['data_pico'].dt.strftime('%Y-%m').tolist(),
+        'categoria_pico': tabela['categoria_pico'].cat.codes.tolist(),
+        'em_curso': tabela['em_curso'].tolist(),
+    }
+
+
+# Agregados anuais de uma escala e local (os do cubo): meses em cada categoria e SPEI de cada mês por ano, a
+# partir do primeiro ano. Qualquer período da comparação é a soma das linhas dos seus anos.
+def _estatisticas_cliente(spei_escalas, escala, local):
+    cubo = spei_escalas.cubo(escala, local)
+    return {
+        'ano_inicial': int(cubo.anos[0]) if len(cubo.anos) else None,
+        'contagem': cubo.contagem.tolist(),
+        'mensal': [[None if np.isnan(v) else float(v) for v in linha] for linha in cubo.matriz],
+    }
+
+
+# O que o card de comparação usa no navegador, nos modos cliente e estático: cores, títulos e texto do card,
+# categorias e posição da categoria limite dos eventos de seca (ela e as mais secas contam como seca)
+def _dados_comparacao(spei_escalas):
+    return {
+        'categorias': list(CATEGORIAS),
+        'meses': meses,
+        'cores_periodos': list(CORES_PERIODOS),
+        'colunas_comparacao': list(TITULOS_COMPARACAO),
+        'texto_comparacao_vazia': TEXTO_COMPARACAO_VAZIA,
+        'valor_ausente': VALOR_AUSENTE,
+        'limite_seca': CATEGORIAS.index(spei_escalas.criterios_eventos['categoria_limite']),
+    }
+
+
+# Dados enviados uma única vez à página: séries e eventos de seca de todos os locais e escalas, códigos das
+# categorias, opções do ano-dropdown e os modelos das figuras (os agregados anuais da comparação são
+# montados no navegador a partir das séries)
+def dados_cliente(spei_escalas, atualizar_ano_dropdown):
+    series = {
+        local: {str(escala): _serie_cliente(spei_escalas, escala, local) for escala in spei_escalas.escalas}
+        for local in spei_escalas.locais
+    }
+
+    eventos = {
+        local: {str(escala): _eventos_cliente(spei_escalas, escala, local) for escala in spei_escalas.escalas}
+        for local in spei_escalas.locais
+    }
+
+    return {
+        **_dados_comparacao(spei_escalas),
+        'series': series,
+        'eventos': eventos,
+        'locais': list(spei_escalas.locais),
+        'bordas_histograma': BORDAS_HISTOGRAMA.tolist(),
+        'colunas_eventos': list(TITULOS),
+        'estilo_tabela_eventos': ESTILO_TABELA,
+        'opcoes_anos': {intervalo: atualizar_ano_dropdown(intervalo) for intervalo in ('5', '10', 'all')},
+        'modelos': _modelos(spei_escalas, {**CONSTRUTORES, **CONSTRUTORES_COMPARACAO}),
+    }
+
+
+# Callbacks do navegador comuns aos modos cliente e estático: opções de anos, atalho do ano-dropdown para o
+# controle deslizante, seleção, lista de períodos e card de comparação
+def _registrar_controles(app):
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='opcoes_anos'),
+        [Output('ano-dropdown', 'options'),
+         Output('ano-dropdown', 'value')],
+        Input('intervalo-dropdown', 'value'),
+        State('dados-cliente', 'data'),
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='atalho_anos'),
+        Output('anos-slider', 'value'),
+        Input('ano-dropdown', 'value'),
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='selecao'),
+        Output('selecao', 'data'),
+        [Input('anos-slider', 'value'),
+         Input('escala-dropdown', 'value'),
+         Input('mapa-paragominas', 'clickData')],
+        State('dados-cliente', 'data'),
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='periodos'),
+        Output('periodos-comparacao', 'data'),
+        [Input('adicionar-comparacao', 'n_clicks'),
+         Input('limpar-comparacao', 'n_clicks')],
+        [State('anos-slider', 'value'),
+         State('periodos-comparacao', 'data'),
+         State('dados-cliente', 'data')],
+        prevent_initial_call=True,
+    )
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='comparacao'),
+        [Output(id_grafico, 'figure') for id_grafico in CONSTRUTORES_COMPARACAO] + [Output('comparacao-resumo', 'children')],
+        [Input('periodos-comparacao', 'data'),
+         Input('selecao', 'data')],
+        State('dados-cliente', 'data'),
+    )
+
+
+# No modo cliente todos os callbacks rodam no navegador: o servidor só entrega a página inicial
+def registrar_callbacks_cliente(app):
+    _registrar_controles(app)
+    for id_grafico, funcao in FUNCOES_CLIENTE.items():
+        app.clientside_callback(
+            ClientsideFunction(namespace='spei', function_name=funcao),
+            Output(id_grafico, 'figure'),
+            Input('selecao', 'data'),
+            State('dados-cliente', 'data'),
+        )
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='eventos'),
+        Output('eventos-conteudo', 'children'),
+        Input('selecao', 'data'),
+        State('dados-cliente', 'data'),
+    )
+
+
+# Diretório (relativo à página) das figuras pré-calculadas do modo estático e nome do arquivo de cada seleção
+# (o mesmo nome é montado em assets/clientside.js)
+DIRETORIO_FIGURAS = 'figuras'
+
+
+def arquivo_selecao(selecao):
+    return f"{selecao['ano_inicial']}-{selecao['ano_final']}-{selecao['escala']}-{selecao['local']}.json"
+
+
+# Dados da página no modo estático: só o que os callbacks do navegador precisam para montar a seleção e achar
+# o arquivo das figuras (as séries ficam de fora; as figuras já vêm prontas), mais os agregados anuais e os
+# modelos do card de comparação, que responde a qualquer combinação de períodos sem arquivo nem servidor
+def dados_estaticos(spei_escalas, atualizar_ano_dropdown, servidor=''):
+    estatisticas = {
+        local: {str(escala): _estatisticas_cliente(spei_escalas, escala, local) for escala in spei_escalas.escalas}
+        for local in spei_escalas.locais
+    }
+    return {
+        **_dados_comparacao(spei_escalas),
+        'estatisticas': estatisticas,
+        'modelos': _modelos(spei_escalas, CONSTRUTORES_COMPARACAO),
+        'locais': list(spei_escalas.locais),
+        'opcoes_anos': {intervalo: atualizar_ano_dropdown(intervalo) for intervalo in ('5', '10', 'all')},
+        'graficos': list(FUNCOES_CLIENTE),
+        'diretorio': DIRETORIO_FIGURAS,
+        'servidor': servidor,
+    }
+
+
+# No modo estático as opções de anos, a seleção e a comparação são montadas no navegador (como no modo cliente)
+# e as figuras e os eventos de cada seleção são lidos de um único arquivo JSON pré-calculado. Só os intervalos
+# dos atalhos são pré-calculados: outro intervalo do controle deslizante vem do servidor ao vivo, quando há um.
+def registrar_callbacks_estaticos(app):
+    _registrar_controles(app)
+    app.clientside_callback(
+        ClientsideFunction(namespace='spei', function_name='figuras_estaticas'),
+        [Output(id_grafico, 'figure') for id_grafico in FUNCOES_CLIENTE] + [Output('eventos-conteudo', 'children')],
+        Input('selecao', 'data'),
+        State('dados-cliente', 'data'),
+    )
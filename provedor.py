@@ -0,0 +1,52 @@
+import logging
+import threading
+import time
+
+
+# Dados carregados sob demanda: `carregar()` roda uma única vez, no primeiro `obter()` ou na thread de
+# aquecimento, e as chamadas concorrentes esperam a mesma carga em vez de repeti-la.
+class ProvedorDados:
+    def __init__(self, carregar):
+        self._carregar = carregar
+        self._valor = None
+        self._pronto = threading.Event()
+        self._trava = threading.Lock()
+        self.erro = None
+        self.tempo_carga = None
+
+    def obter(self):
+        if self._pronto.is_set():
+            return self._valor
+        with self._trava:
+            if not self._pronto.is_set():
+                inicio = time.perf_counter()
+                try:
+                    self._valor = self._carregar()
+                except Exception as erro:
+                    self.erro = repr(erro)
+                    raise
+                self.tempo_carga = time.perf_counter() - inicio
+                self.erro = None
+                self._pronto.set()
+        return self._valor
+
+    # Troca os dados já carregados (ex.: após recalcular com planilhas revisadas)
+    def substituir(self, valor):
+        with self._trava:
+            self._valor = valor
+            self._pronto.set()
+
+    def pronto(self):
+        return self._pronto.is_set()
+
+    # Inicia a carga em segundo plano; falhas ficam em `erro` e a carga é tentada de novo no próximo `obter()`
+    def aquecer(self):
+        def carregar():
+            try:
+                self.obter()
+            except Exception:
+                logging.exception('Falha ao carregar os dados do dashboard')
+
+        thread = threading.Thread(target=carregar, name='aquecimento-dados', daemon=True)
+        thread.start()
+        return thread
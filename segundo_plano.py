@@ -0,0 +1,195 @@
+import itertools
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import dash
+from dash.exceptions import PreventUpdate
+from dash.long_callback.managers import BaseLongCallbackManager
+
+from metricas import metricas
+
+# Versão do Dash contra a qual o gerenciador foi escrito (a mesma fixada no requirements.txt): ele monta o
+# contexto do callback com internos privados do Dash, que podem mudar ou sumir em outras versões
+VERSAO_DASH_TESTADA = '2.18.0'
+
+try:
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+    from dash.long_callback._proxy_set_props import ProxySetProps
+    _ERRO_INTERNOS = None
+except ImportError as erro:
+    _ERRO_INTERNOS = erro
+
+
+# Falha ao subir o app, e não no primeiro callback, se os internos do Dash usados aqui não existirem
+def verificar_internos_dash():
+    if _ERRO_INTERNOS is None and hasattr(context_value, 'set') and hasattr(ProxySetProps, '__setitem__'):
+        return
+    raise RuntimeError(f'GerenciadorLocal exige os internos do Dash {VERSAO_DASH_TESTADA} (instalado: '
+                       f'{dash.__version__}): {_ERRO_INTERNOS or "context_value/ProxySetProps incompatíveis"}. '
+                       f'Fixe dash=={VERSAO_DASH_TESTADA} ou use SPEI_TAREFAS_SEGUNDO_PLANO=0')
+
+
+# Levantada pelo `set_progress` de uma tarefa cancelada: interrompe o cálculo no próximo aviso de progresso
+class TarefaCancelada(Exception):
+    pass
+
+
+_CANCELADA = object()
+
+
+# Execução de um callback em segundo plano, compartilhada pelos pedidos idênticos (assinantes)
+class _Tarefa:
+    def __init__(self, id_tarefa, chave):
+        self.id = id_tarefa
+        self.chave = chave
+        self.assinantes = 1
+        self.cancelada = threading.Event()
+        self.concluida = threading.Event()
+        self.concluida_em = None
+
+
+# Gerenciador de callbacks em segundo plano (background=True) que roda as tarefas em threads do próprio
+# processo, sem broker nem dependências extras. Ao contrário do DiskcacheManager, que roda cada tarefa
+# em um subprocesso, o que a tarefa calcula (ex.: uma escala nova do SPEI) fica na memória do worker e
+# serve aos callbacks seguintes.
+# Pedidos idênticos (mesma função, entradas e `cache_by`) feitos enquanto a tarefa roda entram nela em
+# vez de iniciar outra; a tarefa só é cancelada quando todos os assinantes desistem (ex.: mudaram o
+# dropdown). O cancelamento é cooperativo: vale no próximo `set_progress`. Os resultados ficam
+# disponíveis por `expira` segundos para os assinantes que ainda não buscaram.
+# As tarefas vivem na memória de um único processo: só serve a um servidor com um worker (ver
+# config.TAREFAS_SEGUNDO_PLANO).
+class GerenciadorLocal(BaseLongCallbackManager):
+    def __init__(self, threads=2, expira=60, cache_by=None):
+        verificar_internos_dash()
+        self.expira = expira
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='segundo-plano')
+        self._ids = itertools.count(1)
+        self._tarefas = {}
+        self._em_andamento = {}
+        self._resultados = {}
+        self._progresso = {}
+        self._propriedades = {}
+        self._trava = threading.Lock()
+        super().__init__(cache_by)
+
+    # Descarta resultados vencidos e tarefas concluídas cujos assinantes não voltaram para buscar (ex.: a aba fechou)
+    def _limpar_expirados(self):
+        limite = time.monotonic() - self.expira
+        for chave in [chave for chave, (instante, _) in self._resultados.items() if instante < limite]:
+            del self._resultados[chave]
+            self._progresso.pop(chave, None)
+        for id_tarefa in [id_tarefa for id_tarefa, tarefa in self._tarefas.items()
+                          if tarefa.concluida_em is not None and tarefa.concluida_em < limite]:
+            del self._tarefas[id_tarefa]
+
+    def call_job_fn(self, key, job_fn, args, context):
+        with self._trava:
+            self._limpar_expirados()
+            id_tarefa = self._em_andamento.get(key)
+            if id_tarefa is not None:
+                self._tarefas[id_tarefa].assinantes += 1
+                return id_tarefa
+
+            id_tarefa = str(next(self._ids))
+            tarefa = self._tarefas[id_tarefa] = _Tarefa(id_tarefa, key)
+            if key in self._resultados:
+                tarefa.concluida_em = time.monotonic()
+                tarefa.concluida.set()  # Resultado recente da mesma chave: nada a calcular
+                return id_tarefa
+            self._em_andamento[key] = id_tarefa
+        self._executor.submit(job_fn, key, tarefa, args, context)
+        return id_tarefa
+
+    # Um assinante desistiu da tarefa ou já recebeu o resultado
+    def terminate_job(self, job):
+        if job is None:
+            return
+        with self._trava:
+            tarefa = self._tarefas.get(str(job))
+            if tarefa is None:
+                return
+            tarefa.assinantes -= 1
+            if tarefa.assinantes > 0:
+                return
+            del self._tarefas[str(job)]
+            if not tarefa.concluida.is_set():
+                tarefa.cancelada.set()
+                self._em_andamento.pop(tarefa.chave, None)
+
+    def terminate_unhealthy_job(self, job):
+        return False
+
+    def job_running(self, job):
+        tarefa = self._tarefas.get(str(job)) if job is not None else None
+        return tarefa is not None and not tarefa.concluida.is_set()
+
+    def make_job_fn(self, fn, progress, key=None):
+        def job_fn(chave, tarefa, argumentos, contexto):
+            def set_progress(valor):
+                if tarefa.cancelada.is_set():
+                    raise TarefaCancelada
+                self._progresso[chave] = list(valor) if isinstance(valor, (list, tuple)) else [valor]
+
+            def set_props(id_componente, propriedades):
+                self._propriedades.setdefault(chave, {})[id_componente] = propriedades
+
+            def rodar():
+                c = AttributeDict(**contexto)
+                c.ignore_register_page = False
+                c.updated_props = ProxySetProps(set_props)
+                context_value.set(c)
+                extras = [set_progress] if progress else []
+                try:
+                    if isinstance(argumentos, dict):
+                        return fn(*extras, **argumentos)
+                    if isinstance(argumentos, (list, tuple)):
+                        return fn(*extras, *argumentos)
+                    return fn(*extras, argumentos)
+                except PreventUpdate:
+                    return {'_dash_no_update': '_dash_no_update'}
+                except TarefaCancelada:
+                    raise
+                except Exception as erro:
+                    return {'long_callback_error': {'msg': str(erro), 'tb': traceback.format_exc()}}
+
+            try:
+                with metricas.medir('segundo_plano'):
+                    resultado = copy_context().run(rodar)
+            except TarefaCancelada:
+                resultado = _CANCELADA
+            with self._trava:
+                tarefa.concluida_em = time.monotonic()
+                if resultado is not _CANCELADA and not tarefa.cancelada.is_set():
+                    self._resultados[chave] = (tarefa.concluida_em, resultado)
+                if self._em_andamento.get(chave) == tarefa.id:
+                    del self._em_andamento[chave]
+                tarefa.concluida.set()
+
+        return job_fn
+
+    # Último progresso informado (lido sem apagar: todos os assinantes acompanham a mesma tarefa)
+    def get_progress(self, key):
+        return self._progresso.get(key)
+
+    def result_ready(self, key):
+        return key in self._resultados
+
+    def get_result(self, key, job):
+        with self._trava:
+            resultado = self._resultados.get(key)
+        if resultado is None:
+            return self.UNDEFINED
+        self._progresso.pop(key, None)
+        self.terminate_job(job)
+        return resultado[1]
+
+    def get_updated_props(self, key):
+        return self._propriedades.pop(key, {})
+
+    def clear_cache_entry(self, key):
+        with self._trava:
+            self._resultados.pop(key, None)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+from categorias import CATEGORIAS, codificar_spei
+
+# Ano zero da contagem de meses do numpy (datetime64[M] conta os meses desde 1970-01)
+ANO_EPOCA = 1970
+
+
+# Série mensal compacta: o mês inicial e, por mês, o valor em float32 e o código da categoria em int8 (posição
+# em CATEGORIAS, -1 para ausentes), sem índice de datas. O eixo de tempo tem passo fixo de um mês: a data de
+# cada posição e a posição de cada data são calculadas. Fatias por posição são views dos mesmos arrays, sem
+# cópia, e os arrays podem vir de um .npy mapeado (memória compartilhada).
+class SerieMensal:
+    def __init__(self, inicio, valores, codigos, nome=None):
+        self.inicio = np.datetime64(inicio, 'M')
+        self.valores = valores
+        self.codigos = codigos
+        self.nome = nome
+
+    # Série compacta a partir de um array alinhado ao mês `inicio`, sem os meses ausentes das pontas (ex.: antes
+    # de a janela da escala completar). Sem `codigos`, as categorias são classificadas nos valores recebidos,
+    # antes da conversão para float32; com arrays float32 e `codigos` já prontos, a série é uma view deles
+    @classmethod
+    def de_valores(cls, inicio, valores, nome=None, codigos=None):
+        primeiro, ultimo = _pontas(valores)
+        trecho = valores[primeiro:ultimo]
+        codigos = codificar_spei(trecho) if codigos is None else codigos[primeiro:ultimo]
+        return cls(np.datetime64(inicio, 'M') + primeiro, trecho.astype('float32', copy=False), codigos, nome)
+
+    # Série compacta a partir de uma pd.Series mensal (índice de datas no primeiro dia de cada mês, sem lacunas)
+    @classmethod
+    def de_serie(cls, serie):
+        return cls.de_valores(mes_inicial(serie.index), serie.to_numpy(dtype='float64'), serie.name)
+
+    def __len__(self):
+        return len(self.valores)
+
+    # Trecho por posição (view, sem cópia)
+    def __getitem__(self, fatia):
+        inicio, _, _ = fatia.indices(len(self))
+        return SerieMensal(self.inicio + inicio, self.valores[fatia], self.codigos[fatia], self.nome)
+
+    # Meses desde 1970-01 da primeira posição
+    @property
+    def mes_zero(self):
+        return int(self.inicio.astype('int64'))
+
+    # Datas (datetime64[M]) de todas as posições ou só das `posicoes` pedidas
+    def datas(self, posicoes=None):
+        return self.inicio + (np.arange(len(self)) if posicoes is None else np.asarray(posicoes))
+
+    # Ano e mês do calendário (0 a 11) de cada posição
+    def anos(self):
+        return (self.mes_zero + np.arange(len(self))) // 12 + ANO_EPOCA
+
+    def meses(self):
+        return (self.mes_zero + np.arange(len(self))) % 12
+
+    # Posição da primeira data >= `data` (lado 'left') ou > `data` (lado 'right'), como searchsorted
+    def posicao(self, data, lado='left'):
+        data = pd.Timestamp(data)
+        mes = (data.year - ANO_EPOCA) * 12 + data.month - 1 - self.mes_zero
+        no_inicio_do_mes = data.day == 1 and data == data.normalize()  # Sem to_period: vale fora da faixa em ns
+        if lado == 'left':
+            posicao = mes if no_inicio_do_mes else mes + 1
+        else:
+            posicao = mes + 1
+        return min(max(posicao, 0), len(self))
+
+    # Nova série com os `valores` (float64) dos meses a partir de `inicio`, posteriores ao fim desta; os meses
+    # entre as duas ficam ausentes. Os valores e códigos já guardados são mantidos como estão.
+    def anexar(self, inicio, valores):
+        if not len(self):
+            return SerieMensal.de_valores(inicio, valores, self.nome)
+        lacuna = int((np.datetime64(inicio, 'M') - self.inicio).astype('int64')) - len(self)
+        valores = np.concatenate([np.full(lacuna, np.nan), valores])
+        trecho = valores[:_pontas(valores)[1]]
+        return SerieMensal(self.inicio, np.concatenate([self.valores, trecho.astype('float32')]),
+                           np.concatenate([self.codigos, codificar_spei(trecho)]), self.nome)
+
+    # Categorias como rótulos (categórico ordenado de CATEGORIAS)
+    def categorias(self):
+        return pd.Categorical.from_codes(self.codigos, categories=CATEGORIAS, ordered=True)
+
+    # pd.Series float64 com índice de datas, para quem precisa do pandas (montada a cada chamada)
+    def para_series(self):
+        indice = pd.DatetimeIndex(self.datas().astype('datetime64[s]'), name='data')
+        return pd.Series(self.valores.astype('float64'), index=indice, name=self.nome)
+
+    # Bytes dos arrays da série
+    @property
+    def nbytes(self):
+        return self.valores.nbytes + self.codigos.nbytes
+
+
+# Posições do primeiro valor presente e logo depois do último ((0, 0) sem nenhum valor)
+def _pontas(valores):
+    validos = np.flatnonzero(~np.isnan(valores))
+    return (int(validos[0]), int(validos[-1]) + 1) if len(validos) else (0, 0)
+
+
+# Mês (datetime64[M]) da primeira data de um índice mensal; ValueError se o passo não for de exatamente um mês
+def mes_inicial(indice):
+    meses = np.asarray(indice).astype('datetime64[M]')
+    if len(meses) and (np.any(np.diff(meses.astype('int64')) != 1) or np.any(meses != np.asarray(indice))):
+        raise ValueError('A série precisa ser mensal, sem lacunas, com as datas no primeiro dia de cada mês')
+    return meses[0] if len(meses) else np.datetime64('1970-01', 'M')
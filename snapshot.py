@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+# Geração da versão estática do dashboard (python snapshot.py estatico/): a página, o layout, as dependências,
+# os bundles do Dash e as figuras de todas as seleções possíveis (opções do ano-dropdown x escalas x locais),
+# pré-calculadas com as mesmas funções dos callbacks. O diretório gerado pode ser servido por qualquer
+# servidor de arquivos ou CDN, sem Python por requisição; com --servidor, as seleções que não estiverem nos
+# arquivos (ex.: um intervalo qualquer do controle deslizante de anos) são pedidas ao servidor ao vivo
+# (/api/figuras). A comparação de períodos não precisa de arquivos: usa os agregados anuais enviados na página.
+
+# Marca de versão que os bundles do Dash inserem no nome dos chunks carregados sob demanda (ex.: async-graph.js)
+PADRAO_VERSAO_CHUNKS = re.compile(r'splice\(1,0,"(v[0-9a-z_]+m\d+)"\)')
+
+# Cabeçalhos para hospedar o diretório na Vercel: JSON nas rotas sem extensão do Dash, cache longo nos bundles
+# versionados e revalidação nas figuras, que mudam junto com os dados
+VERCEL_ESTATICO = {
+    'headers': [
+        {'source': '/_dash-(layout|dependencies)',
+         'headers': [{'key': 'Content-Type', 'value': 'application/json'},
+                     {'key': 'Cache-Control', 'value': 'no-cache'}]},
+        {'source': '/_dash-component-suites/(.*)',
+         'headers': [{'key': 'Cache-Control', 'value': 'public, max-age=31536000, immutable'}]},
+        {'source': '/figuras/(.*)',
+         'headers': [{'key': 'Cache-Control', 'value': 'public, max-age=0, must-revalidate'}]},
+    ],
+}
+
+
+# Grava um arquivo do diretório de saída, criando os subdiretórios
+def gravar(saida, caminho, conteudo):
+    destino = os.path.join(saida, *caminho.strip('/').split('/'))
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, 'wb') as arquivo:
+        arquivo.write(conteudo)
+    return len(conteudo)
+
+
+# Todas as seleções que a página pode pedir: cada opção do ano-dropdown (5 anos, 10 anos e todos) com cada
+# escala e cada local, no mesmo formato da seleção montada no navegador
+def selecoes(app):
+    intervalos = dict.fromkeys(
+        opcao['value'] for tamanho in ('5', '10', 'all') for opcao in app.atualizar_ano_dropdown(tamanho)[0]
+    )
+    for intervalo in intervalos:
+        ano_inicial, ano_final = app.interpretar_intervalo(intervalo)
+        for escala in app.ESCALAS:
+            for local in app.locais_por_id:
+                yield {'ano_inicial': ano_inicial, 'ano_final': ano_final, 'escala': escala, 'local': local}
+
+
+# Figuras e eventos de cada seleção em figuras/<ano_inicial>-<ano_final>-<escala>-<local>.json
+def gerar_figuras(app, saida):
+    import plotly.utils
+
+    from modo_cliente import DIRETORIO_FIGURAS, arquivo_selecao
+
+    quantidade = total = 0
+    for selecao in selecoes(app):
+        conteudo = json.dumps(app.conteudo_selecao(selecao), cls=plotly.utils.PlotlyJSONEncoder).encode()
+        total += gravar(saida, f'{DIRETORIO_FIGURAS}/{arquivo_selecao(selecao)}', conteudo)
+        quantidade += 1
+    return quantidade, total
+
+
+# Página inicial, layout, dependências e os arquivos que a página carrega (bundles, /assets e favicon), obtidos
+# do próprio servidor do Dash pelo cliente de testes do Flask
+def gerar_pagina(app, saida):
+    cliente = app.app.server.test_client()
+
+    def obter(url):
+        resposta = cliente.get(url)
+        if resposta.status_code != 200:
+            raise RuntimeError(f'{url}: HTTP {resposta.status_code}')
+        return resposta.get_data()
+
+    pagina = obter('/')
+    total = gravar(saida, 'index.html', pagina)
+    for rota in ('/_dash-layout', '/_dash-dependencies'):
+        total += gravar(saida, rota, obter(rota))
+
+    # Arquivos referenciados pela página, gravados sem a query string (?m=, ?v=)
+    versoes = {}
+    for caminho in sorted({urlsplit(url).path for url in re.findall(r'(?:src|href)="(/[^"]+)"', pagina.decode())}):
+        conteudo = obter(caminho)
+        total += gravar(saida, caminho, conteudo)
+        if caminho.startswith('/_dash-component-suites/') and caminho.endswith('.js'):
+            for versao in PADRAO_VERSAO_CHUNKS.findall(conteudo.decode('utf-8', 'replace')):
+                versoes.setdefault(os.path.dirname(caminho), set()).add(versao)
+
+    # Arquivos registrados pelos pacotes de componentes: o plotly.min.js e os chunks carregados sob demanda
+    # (dropdown, gráfico...) não aparecem na página. Os chunks são pedidos com a marca de versão embutida no bundle
+    for pacote, caminhos in app.app.registered_paths.items():
+        for relativo in sorted(caminhos):
+            if relativo.endswith('.map'):
+                continue
+            caminho = f'/_dash-component-suites/{pacote}/{relativo}'
+            conteudo = obter(caminho)
+            total += gravar(saida, caminho, conteudo)
+            diretorio, nome = os.path.split(caminho)
+            primeiro, _, resto = nome.partition('.')
+            for versao in versoes.get(diretorio, ()):
+                total += gravar(saida, f'{diretorio}/{primeiro}.{versao}.{resto}', conteudo)
+
+    total += gravar(saida, 'vercel.json', json.dumps(VERCEL_ESTATICO, indent=4).encode())
+    return total
+
+
+# Gera o diretório estático. O app é importado já no modo estático, com a carga dos dados durante o import
+# e sem os callbacks em segundo plano; todas as escalas são calculadas antes das figuras.
+def gerar(saida, servidor=''):
+    os.environ['SPEI_MODO_ESTATICO'] = '1'
+    os.environ['SPEI_CARGA_ADIADA'] = '0'
+    os.environ['SPEI_TAREFAS_SEGUNDO_PLANO'] = '0'
+    os.environ['SPEI_SERVIDOR_FALLBACK'] = servidor
+    import app
+
+    inicio = time.perf_counter()
+    app.dados.obter().calcular()
+    quantidade, bytes_figuras = gerar_figuras(app, saida)
+    bytes_pagina = gerar_pagina(app, saida)
+    manifesto = {
+        'versao': app.cache_figuras.versao,
+        'gerado_em': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'selecoes': quantidade,
+        'servidor': servidor or None,
+    }
+    gravar(saida, 'snapshot.json', json.dumps(manifesto, indent=4).encode())
+    print(f'{quantidade} seleções ({bytes_figuras / 1e6:.1f} MB) e página ({bytes_pagina / 1e6:.1f} MB) '
+          f'em {saida} ({time.perf_counter() - inicio:.1f} s)')
+    return manifesto
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera a versão estática do dashboard SPEI (para CDN)')
+    parser.add_argument('saida', nargs='?', default='estatico', help='diretório de saída (padrão: estatico)')
+    parser.add_argument('--servidor', default=os.environ.get('SPEI_SERVIDOR_FALLBACK', ''),
+                        help='URL do servidor ao vivo para as seleções que não foram pré-calculadas')
+    args = parser.parse_args()
+    gerar(args.saida, args.servidor.rstrip('/'))